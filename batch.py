@@ -0,0 +1,389 @@
+"""Headless batch conversion/compression engine.
+
+Usage examples:
+    python batch.py ~/footage --to mp4
+    python batch.py "~/photos/*.png" --mode compress --quality 60
+    python batch.py jobs.json --report summary.json
+
+A manifest is either a JSON list of job objects
+({"input": ..., "output": ..., "mode": ..., "format": ..., "quality": ...})
+or a plain text file with one input path per line. ``--to mp4,webm,jpg:320``
+(or "targets" in a job object) writes several outputs from one decode of
+each input, the optional ":N" capping the longest side. A job object with
+"profile": "<path>" has a profile of just that job written to the path, and
+"priority": N moves it ahead of lower priorities.
+
+Jobs are admitted by a scheduler.Scheduler, so a worker only picks up a job
+once its estimated CPU and memory cost fits (see ``--memory``).
+
+This module never imports the GUI toolkit, so it can run on headless workers.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from cache import ConversionCache
+from converter import (
+    compress_file,
+    compressed_output_path,
+    convert_file,
+    convert_many,
+    converted_output_path,
+    describe_report,
+    multi_output_targets,
+    parse_targets,
+)
+from probe import detect_category
+from scheduler import Scheduler, job_cost
+from target_size import parse_size
+
+MANIFEST_EXTENSIONS = (".json", ".txt", ".lst")
+
+
+def default_workers():
+    """Return the number of worker processes to use (one per core)."""
+    return os.cpu_count() or 1
+
+
+def expand_source(source):
+    """Expand a directory, glob pattern or manifest into a list of entries.
+
+    Entries are either plain input paths or job dictionaries from a JSON manifest.
+    """
+    source = os.path.expanduser(source)
+    if os.path.isdir(source):
+        entries = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                entries.append(os.path.join(root, name))
+        return entries
+    if os.path.isfile(source) and source.lower().endswith(MANIFEST_EXTENSIONS):
+        with open(source, "r", encoding="utf-8") as f:
+            if source.lower().endswith(".json"):
+                return json.load(f)
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if os.path.isfile(source):
+        return [source]
+    return sorted(glob.glob(source, recursive=True))
+
+
+def is_multi_format(output_format):
+    """Return True for a multi-output format list such as "mp4,webm,jpg:320"."""
+    return "," in output_format or ":" in output_format
+
+
+def build_job(entry, mode="convert", output_format=None, quality=75, output_dir=None, encoder=None, preset=None):
+    """Turn a manifest entry into a job dictionary, or return None if it is not processable."""
+    job = dict(entry) if isinstance(entry, dict) else {"input": entry}
+    input_path = job["input"]
+    job.setdefault("mode", mode)
+    job.setdefault("quality", quality)
+    job.setdefault("encoder", encoder)
+    job.setdefault("preset", preset)
+
+    if "category" not in job:
+        job["category"] = detect_category(input_path)
+    if job["category"] is None:
+        return None
+
+    if job["mode"] == "convert":
+        job.setdefault("format", output_format)
+        if "targets" in job or (job["format"] and is_multi_format(job["format"])):
+            # One decode, several outputs (convert_many)
+            try:
+                job["targets"] = multi_output_targets(input_path, job["category"],
+                                                      job.get("targets") or parse_targets(job["format"]), output_dir)
+            except ValueError:
+                return None
+            job["output"] = ", ".join(target["output"] for target in job["targets"])
+        elif not job["format"]:
+            return None
+        else:
+            job.setdefault("output", converted_output_path(input_path, job["format"], output_dir))
+    elif job["mode"] == "compress":
+        job.setdefault("output", compressed_output_path(input_path, output_dir))
+    else:
+        raise ValueError(f"Unknown batch mode: {job['mode']}")
+    return job
+
+
+def iter_jobs(source, mode="convert", output_format=None, quality=75, output_dir=None, encoder=None, preset=None):
+    """Yield jobs for a directory, glob or manifest, skipping unsupported files."""
+    for entry in expand_source(source):
+        job = build_job(entry, mode, output_format, quality, output_dir, encoder, preset)
+        if job is not None:
+            yield job
+
+
+def run_job(job):
+    """Run a single job in a worker process and return its result dictionary."""
+    started = time.perf_counter()
+    result = {"input": job["input"], "output": job["output"], "mode": job["mode"]}
+    try:
+        outputs = [target["output"] for target in job["targets"]] if job.get("targets") else [job["output"]]
+        for output in outputs:
+            if os.path.dirname(output):
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+        if job.get("targets"):
+            convert_many(job["input"], job["targets"], job["category"], job.get("encoder"), job.get("preset"),
+                         queued_at=job.get("queued_at"), profile=job.get("profile"))
+        elif job["mode"] == "convert":
+            convert_file(job["input"], job["output"], job["category"], job["format"],
+                         job.get("encoder"), job.get("preset"), segmented=job.get("segmented"),
+                         max_size=job.get("max_size"), queued_at=job.get("queued_at"), profile=job.get("profile"),
+                         fps=job.get("fps"))
+        else:
+            report = compress_file(job["input"], job["output"], job["category"], job["quality"],
+                                   job.get("encoder"), job.get("preset"), segmented=job.get("segmented"),
+                                   max_size=job.get("max_size"), target_size=job.get("target_size"),
+                                   queued_at=job.get("queued_at"), profile=job.get("profile"))
+            if report:
+                result["report"] = report
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    if metrics.enabled():
+        # Worker totals travel back with the result and are merged in the parent
+        result["metrics"] = metrics.snapshot(reset=True)
+    return result
+
+
+def job_cache_key(cache, job):
+    """Return the cache key of a job; matches the key convert_file/compress_file use."""
+    if job["mode"] == "convert":
+        return cache.job_key(job["input"], "convert", job["output"], format=job["format"],
+                             encoder=job.get("encoder"), preset=job.get("preset"), max_size=job.get("max_size"),
+                             fps=job.get("fps"))
+    return cache.job_key(job["input"], "compress", job["output"], quality=job["quality"],
+                         encoder=job.get("encoder"), preset=job.get("preset"), max_size=job.get("max_size"),
+                         target_size=job.get("target_size"))
+
+
+class WorkerPool:
+    """Process pool for run_job that replaces itself when a worker process dies."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, job):
+        """Submit a job and return its Future."""
+        with self._lock:
+            try:
+                return self._executor.submit(run_job, job)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OOM killer) and took the pool down; its
+                # pending futures have already failed, so start over with a fresh pool
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                return self._executor.submit(run_job, job)
+
+    def run(self, job):
+        """Run a job on the pool and wait for it; used as the scheduler's task."""
+        return self.submit(job).result()
+
+    def shutdown(self):
+        with self._lock:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+def run_batch(jobs, workers=None, retries=1, max_pending=None, on_result=None, cache=None, scheduler=None):
+    """Run jobs across a process pool and return a summary report.
+
+    At most ``max_pending`` jobs (default: twice the worker count) are submitted
+    at any time so memory stays flat regardless of the batch size. Failed jobs
+    are resubmitted up to ``retries`` times. If a worker process dies, the
+    jobs pending on it count as failed attempts and the pool is replaced.
+    ``on_result`` is called in the parent process with every final result.
+
+    The optional ConversionCache is only touched from the parent process, so
+    its index has a single writer; cache hits never reach the pool. Document
+    jobs bypass it, as in convert_file.
+
+    With a ``scheduler`` (scheduler.Scheduler), pending jobs are handed to
+    the pool only once their estimated cost fits its budgets, in priority
+    order and shared fairly between categories. The summary then includes
+    the scheduler's stats().
+    """
+    workers = workers or default_workers()
+    max_pending = max_pending or workers * 2
+    started = time.perf_counter()
+    results = []
+    attempts = {}
+    pending = {}
+    queue = iter(jobs)
+    retry_queue = []
+
+    def next_job():
+        if retry_queue:
+            return retry_queue.pop()
+        return next(queue, None)
+
+    def submit(job):
+        if scheduler is None:
+            return pool.submit(job)
+        return scheduler.submit(pool.run, job, category=job["category"], cost=job_cost(job),
+                                priority=job.get("priority", 0))
+
+    def finish(result):
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    with WorkerPool(workers) as pool:
+        while True:
+            while len(pending) < max_pending:
+                job = next_job()
+                if job is None:
+                    break
+                # Multi-page PDF conversions write numbered page files, so documents bypass the cache
+                if (cache is not None and "cache_key" not in job and not job.get("targets")
+                        and job["category"] != "document"):
+                    try:
+                        job["cache_key"] = job_cache_key(cache, job)
+                        if cache.fetch(job["cache_key"], job["output"]):
+                            result = {"input": job["input"], "output": job["output"], "mode": job["mode"],
+                                      "status": "ok", "cached": True, "seconds": 0, "attempts": 0}
+                            if cache.report(job["cache_key"]):
+                                result["report"] = cache.report(job["cache_key"])
+                            finish(result)
+                            continue
+                    except OSError:
+                        job["cache_key"] = None
+                attempts[job["input"], job["output"]] = attempts.get((job["input"], job["output"]), 0) + 1
+                job["queued_at"] = time.time()
+                pending[submit(job)] = job
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. killed by the OOM killer); every job
+                    # pending on that pool fails with BrokenProcessPool and the pool is replaced
+                    result = {"input": job["input"], "output": job["output"], "mode": job["mode"],
+                              "status": "failed", "error": str(e), "seconds": 0}
+                if "metrics" in result:
+                    metrics.merge(result.pop("metrics"))
+                result["attempts"] = attempts[job["input"], job["output"]]
+                if result["status"] == "failed" and result["attempts"] <= retries:
+                    retry_queue.append(job)
+                    continue
+                if result["status"] == "ok" and job.get("cache_key"):
+                    cache.store(job["cache_key"], job["output"], result.get("report"))
+                finish(result)
+
+    failed = [r for r in results if r["status"] != "ok"]
+    summary = {
+        "total": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "retried": sum(1 for r in results if r["attempts"] > 1),
+        "cached": sum(1 for r in results if r.get("cached")),
+        "workers": workers,
+        "seconds": round(time.perf_counter() - started, 3),
+        "results": results,
+    }
+    if scheduler is not None:
+        summary["scheduler"] = scheduler.stats()
+    return summary
+
+
+def format_result(result):
+    """Return the one-line progress output of a batch result."""
+    line = f"[{result['status']}] {result['input']} -> {result['output']} ({result['seconds']}s)"
+    if result["status"] != "ok":
+        line += f": {result['error']}"
+    elif result.get("report"):
+        line += f" {describe_report(result['report'])}"
+    return line
+
+
+def print_result(result):
+    print(format_result(result), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch convert or compress files without the GUI.")
+    parser.add_argument("source", help="Directory, glob pattern or manifest file (.json/.txt)")
+    parser.add_argument("--mode", choices=["convert", "compress"], default="convert")
+    parser.add_argument("--to", dest="output_format", help="Output format for conversion (e.g. mp4, png)")
+    parser.add_argument("--quality", type=int, default=75, help="Compression quality (1-100)")
+    parser.add_argument("--encoder", help="Video encoder override (e.g. libx264, h264_nvenc)")
+    parser.add_argument("--preset", help="Encoder preset override (e.g. veryfast, p4)")
+    parser.add_argument("--segmented", action="store_true", default=None,
+                        help="Encode every video as parallel segments (default: only long videos)")
+    parser.add_argument("--target-size", help="Compress to at most this size (e.g. 8MB, 500k) instead of --quality")
+    parser.add_argument("--max-size", type=int,
+                        help="Shrink images (and video-to-GIF/WebP animations) to at most N pixels on the longest side")
+    parser.add_argument("--fps", type=int, help="Frame rate of video-to-GIF/WebP animations (default 12)")
+    parser.add_argument("--output-dir", help="Write results here instead of next to the inputs")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--retries", type=int, default=1, help="Retries per failed job")
+    parser.add_argument("--max-pending", type=int, default=None, help="Maximum jobs queued at once")
+    parser.add_argument("--memory", help="Memory budget shared by running jobs, e.g. 8G (default: 3/4 of RAM)")
+    parser.add_argument("--cache-dir", help="Reuse results from this conversion cache directory")
+    parser.add_argument("--cache-size", type=int, default=5120, help="Cache size limit in MB")
+    parser.add_argument("--report", help="Write the JSON summary report to this path")
+    parser.add_argument("--metrics-log", help="Append per-job JSON metrics to this file (implies --metrics)")
+    parser.add_argument("--metrics-file", help="Write Prometheus-format totals here when the batch ends")
+    parser.add_argument("--metrics", action="store_true", help="Log per-job stage timings as JSON to stderr")
+    parser.add_argument("--profile", metavar="DIR", help="Write a cProfile/pyinstrument profile of every job here")
+    args = parser.parse_args(argv)
+
+    if args.mode == "convert" and not args.output_format:
+        parser.error("--to is required in convert mode")
+    if args.metrics or args.metrics_log or args.metrics_file or args.profile:
+        metrics.enable(args.metrics_log, args.profile and os.path.abspath(args.profile))
+
+    jobs = iter_jobs(args.source, args.mode, args.output_format, args.quality, args.output_dir,
+                     args.encoder, args.preset)
+    if args.segmented:
+        jobs = (dict(job, segmented=True) for job in jobs)
+    if args.max_size:
+        jobs = (dict(job, max_size=args.max_size) for job in jobs)
+    if args.fps:
+        jobs = (dict(job, fps=args.fps) for job in jobs)
+    if args.target_size:
+        jobs = (dict(job, target_size=parse_size(args.target_size)) for job in jobs)
+
+    cache = ConversionCache(args.cache_dir, args.cache_size * 1024 ** 2) if args.cache_dir else None
+    workers = args.workers or default_workers()
+    scheduler = Scheduler(workers, parse_size(args.memory) if args.memory else None)
+    summary = run_batch(jobs, workers, args.retries, args.max_pending, print_result, cache, scheduler)
+    if summary["total"] == 0:
+        print("No supported files found.")
+        return 1
+    print(f"{summary['succeeded']}/{summary['total']} succeeded ({summary['cached']} from cache), "
+          f"{summary['failed']} failed, {summary['retried']} retried in {summary['seconds']}s using {summary['workers']} workers")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
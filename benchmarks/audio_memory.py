@@ -0,0 +1,85 @@
+"""Peak memory of audio conversion versus input duration.
+
+Generates FLAC sine-wave inputs of increasing length with ffmpeg, converts
+each to MP3 in a fresh interpreter and reports the peak resident memory of
+that interpreter plus its ffmpeg child. With the streaming backend the peak
+stays roughly constant; ``--backend pydub`` shows the old whole-file decode
+for comparison. Exits with code 1 if the streaming peak grows by more than
+``--max-growth`` between the shortest and the longest input.
+
+Usage:
+    python benchmarks/audio_memory.py --durations 60,600,3600
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from transcode import find_ffmpeg, run_ffmpeg  # noqa: E402
+
+# Runs in a fresh interpreter so each measurement starts from a clean heap
+CHILD_SCRIPT = """
+import json, resource, sys
+backend, source, target = sys.argv[1:4]
+if backend == "pydub":
+    from pydub import AudioSegment
+    AudioSegment.from_file(source).export(target, format="mp3")
+else:
+    from converter import convert_audio
+    convert_audio(source, target, "mp3")
+scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is KiB on Linux, bytes on macOS
+print(json.dumps({
+    "python": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+    "ffmpeg": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+}))
+"""
+
+
+def make_sine(path, seconds):
+    run_ffmpeg([find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-f", "lavfi",
+                "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}", "-ac", "2", path])
+
+
+def measure(backend, source, target):
+    """Return the peak RSS in bytes of converting ``source`` in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, backend, source, target],
+                            cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    usage = json.loads(result.stdout.strip().splitlines()[-1])
+    return usage["python"] + usage["ffmpeg"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure peak memory of audio conversion against duration.")
+    parser.add_argument("--durations", default="60,600,3600", help="Comma-separated input lengths in seconds")
+    parser.add_argument("--backend", choices=["streaming", "pydub"], default="streaming")
+    parser.add_argument("--max-growth", type=float, default=1.5,
+                        help="Fail if peak memory grows by more than this factor across durations")
+    args = parser.parse_args(argv)
+
+    durations = [int(d) for d in args.durations.split(",")]
+    peaks = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for seconds in durations:
+            source = os.path.join(work_dir, f"sine_{seconds}.flac")
+            make_sine(source, seconds)
+            peak = measure(args.backend, source, os.path.join(work_dir, f"sine_{seconds}.mp3"))
+            peaks.append(peak)
+            print(f"{seconds:>6}s input ({os.path.getsize(source) / 1_000_000:7.1f} MB flac): "
+                  f"peak RSS {peak / 1_000_000:7.1f} MB")
+
+    growth = peaks[-1] / peaks[0]
+    print(f"peak memory growth {durations[0]}s -> {durations[-1]}s: {growth:.2f}x")
+    if args.backend == "streaming" and growth > args.max_growth:
+        print(f"FAIL: growth above {args.max_growth}x")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
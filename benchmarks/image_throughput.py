@@ -0,0 +1,82 @@
+"""Image pipeline throughput in images per second.
+
+Generates a corpus of large JPEGs and RGBA PNGs with Pillow and runs it
+through convert_image/compress_image, with and without a resize target, in
+a process pool the size of the machine.
+
+Usage:
+    python benchmarks/image_throughput.py --count 64 --size 4000x3000 --max-size 1024
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import compress_image, convert_image  # noqa: E402
+
+
+def make_corpus(work_dir, count, size):
+    """Write ``count`` noisy gradient images, alternating JPEG and RGBA PNG."""
+    from PIL import Image
+
+    width, height = size
+    paths = []
+    base = Image.merge("RGB", [
+        Image.linear_gradient("L").resize((width, height)),
+        Image.effect_noise((width, height), 64),
+        Image.linear_gradient("L").rotate(90).resize((width, height)),
+    ])
+    for i in range(count):
+        if i % 2 == 0:
+            path = os.path.join(work_dir, f"photo_{i:04d}.jpg")
+            base.save(path, quality=92)
+        else:
+            path = os.path.join(work_dir, f"overlay_{i:04d}.png")
+            rgba = base.convert("RGBA")
+            rgba.putalpha(Image.linear_gradient("L").resize((width, height)))
+            rgba.save(path)
+        paths.append(path)
+    return paths
+
+
+def run_case(name, func, jobs, workers):
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(func, *zip(*jobs)))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<34} {len(jobs) / elapsed:8.1f} images/sec ({elapsed:.2f}s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark image conversion throughput.")
+    parser.add_argument("--count", type=int, default=64, help="Number of generated images")
+    parser.add_argument("--size", default="4000x3000", help="Generated image size")
+    parser.add_argument("--max-size", type=int, default=1024, help="Resize target for the resize cases")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    size = tuple(int(v) for v in args.size.split("x"))
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus = make_corpus(work_dir, args.count, size)
+        out = lambda path, ext: os.path.splitext(path)[0] + f"_out.{ext}"  # noqa: E731
+
+        run_case("convert -> webp", convert_image,
+                 [(p, out(p, "webp"), "webp") for p in corpus], args.workers)
+        run_case(f"convert -> webp (max {args.max_size}px)", convert_image,
+                 [(p, out(p, "webp"), "webp", None, None, args.max_size) for p in corpus], args.workers)
+        run_case(f"convert -> jpg (max {args.max_size}px)", convert_image,
+                 [(p, out(p, "jpg"), "jpg", None, None, args.max_size) for p in corpus], args.workers)
+        run_case("compress jpg q=60", compress_image,
+                 [(p, out(p, "jpg"), 60) for p in corpus if p.endswith(".jpg")], args.workers)
+        run_case("compress jpg q=95 (skip re-encode)", compress_image,
+                 [(p, out(p, "jpg"), 95) for p in corpus if p.endswith(".jpg")], args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Cold-import budget check for the converter core.
+
+Runs ``python -X importtime`` in a fresh interpreter and fails (exit code 1)
+if importing the given modules takes longer than the budget or drags in one
+of the heavy media backends, which must only load on first use.
+
+Usage:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 100 --module converter --module batch
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Backends that must be imported lazily
+HEAVY_MODULES = ("PIL", "pydub", "moviepy", "yt_dlp", "numpy", "imageio", "customtkinter")
+
+DEFAULT_MODULES = ("converter", "batch")
+
+DEFAULT_BUDGET_MS = 150.0
+
+
+def measure(modules, runs=5):
+    """Return (best total import time in microseconds, set of top-level packages imported)."""
+    best = None
+    imported = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {m}" for m in modules)],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        )
+        total = 0
+        for line in result.stderr.splitlines():
+            match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|(\s*)(\S+)", line)
+            if not match:
+                continue
+            cumulative, indent, name = match.groups()
+            imported.add(name.split(".")[0])
+            # Top-level entries (a single space of indent) add up to the total
+            if len(indent) == 1:
+                total += int(cumulative)
+        best = total if best is None else min(best, total)
+    return best, imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if cold import of the core modules exceeds a budget.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Maximum cold import time in milliseconds")
+    parser.add_argument("--module", action="append", help="Module to import (repeatable)")
+    parser.add_argument("--runs", type=int, default=5, help="Take the best of this many runs")
+    args = parser.parse_args(argv)
+
+    modules = args.module or list(DEFAULT_MODULES)
+    total_us, imported = measure(modules, args.runs)
+    heavy = sorted(set(HEAVY_MODULES) & imported)
+    print(f"import {', '.join(modules)}: {total_us / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: heavy backends imported eagerly: {', '.join(heavy)}")
+        failed = True
+    if total_us / 1000 > args.budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
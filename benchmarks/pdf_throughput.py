@@ -0,0 +1,100 @@
+"""PDF throughput in pages per second.
+
+Generates a PDF with PyMuPDF in which every page carries a paragraph of text
+and a large noisy photo. It then measures rendering to PNG/JPEG at 1, 2, 4,
+... worker processes, assembling the page images back into a PDF, and
+compressing the PDF. Compression also reports the size reduction.
+
+Usage:
+    python benchmarks/pdf_throughput.py --pages 64 --dpi 150
+    python benchmarks/pdf_throughput.py --pages 200 --workers 1,4,8 --quality 50
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from documents import compress_pdf, images_to_pdf, render_pdf  # noqa: E402
+
+TEXT = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore "
+        "et dolore magna aliqua. ") * 6
+
+
+def make_pdf(path, pages, image_size):
+    """Write an A4 PDF with ``pages`` pages of text and one distinct JPEG photo each."""
+    import fitz
+    from PIL import Image
+
+    width, height = image_size
+    base = Image.merge("RGB", [
+        Image.linear_gradient("L").resize((width, height)),
+        Image.effect_noise((width, height), 48),
+        Image.linear_gradient("L").rotate(90).resize((width, height)),
+    ])
+    with fitz.open() as doc:
+        for number in range(pages):
+            page = doc.new_page(width=595, height=842)
+            page.insert_textbox(fitz.Rect(50, 50, 545, 300), f"Page {number + 1}\n\n{TEXT}", fontsize=11)
+            buffer = io.BytesIO()
+            base.rotate(number % 360).save(buffer, format="JPEG", quality=92)
+            page.insert_image(fitz.Rect(50, 320, 545, 790), stream=buffer.getvalue())
+        doc.save(path, deflate=True)
+
+
+def timed(name, pages, func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<36} {pages / elapsed:8.1f} pages/sec ({elapsed:.2f}s)", flush=True)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PDF rendering, assembly and compression.")
+    parser.add_argument("--pages", type=int, default=64, help="Pages in the generated PDF")
+    parser.add_argument("--image-size", default="2400x1800", help="Size of the photo on every page")
+    parser.add_argument("--dpi", type=int, default=150, help="Render resolution")
+    parser.add_argument("--workers", help="Comma-separated worker counts (default: 1, 2, 4, ... up to CPU count)")
+    parser.add_argument("--quality", type=int, default=60, help="Quality for the compression case")
+    args = parser.parse_args(argv)
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(value) for value in args.workers.split(",")]
+    else:
+        counts = [1]
+        while counts[-1] * 2 <= cpus:
+            counts.append(counts[-1] * 2)
+        if counts[-1] != cpus:
+            counts.append(cpus)
+    image_size = tuple(int(v) for v in args.image_size.split("x"))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = os.path.join(work_dir, "source.pdf")
+        timed("generate", args.pages, make_pdf, source, args.pages, image_size)
+        print(f"source: {args.pages} pages, {os.path.getsize(source) / 1_000_000:.1f} MB")
+
+        for output_format in ("png", "jpg"):
+            for workers in counts:
+                output = os.path.join(work_dir, f"render_{workers}.{output_format}")
+                paths = timed(f"render -> {output_format} @{args.dpi}dpi, {workers} worker(s)", args.pages,
+                              render_pdf, source, output, output_format, args.dpi, None, workers)
+                if output_format != "jpg" or workers != counts[-1]:
+                    for path in paths:
+                        os.remove(path)
+
+        timed("assemble jpg pages -> pdf", args.pages, images_to_pdf, paths, os.path.join(work_dir, "merged.pdf"))
+        report = timed(f"compress q={args.quality}", args.pages, compress_pdf, source,
+                       os.path.join(work_dir, "compressed.pdf"), args.quality)
+        print(f"compress: {report['images']} images recompressed, {report['input_size'] / 1_000_000:.1f} MB -> "
+              f"{report['size'] / 1_000_000:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Wall-clock speedup of segmented encoding versus worker count.
+
+Generates a synthetic video with ffmpeg's ``testsrc`` source, encodes it once
+as a single serial ffmpeg run and then with segmented encoding at 1, 2, 4, ...
+workers up to the core count, and prints the speedup of each run.
+
+Usage:
+    python benchmarks/segmented_encoding.py --duration 240 --size 1280x720 --encoder libx264
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoders import video_encoder_args  # noqa: E402
+from segmented import encode_segmented  # noqa: E402
+from transcode import find_ffmpeg, probe_streams, run_ffmpeg  # noqa: E402
+
+
+def make_test_video(path, duration, size, rate=30):
+    """Generate a test pattern video with a sine tone and a keyframe every 2 seconds."""
+    run_ffmpeg([
+        find_ffmpeg(), "-hide_banner", "-nostdin", "-y",
+        "-f", "lavfi", "-i", f"testsrc=duration={duration}:size={size}:rate={rate}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(rate * 2), "-c:a", "aac", "-shortest", path,
+    ])
+
+
+def worker_counts():
+    cores = os.cpu_count() or 1
+    counts, n = [], 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    return counts + [cores]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark segmented encoding speedup against core count.")
+    parser.add_argument("--duration", type=int, default=240, help="Test video length in seconds")
+    parser.add_argument("--size", default="1280x720", help="Test video resolution")
+    parser.add_argument("--encoder", default="libx264", help="Video encoder to benchmark")
+    parser.add_argument("--bitrate", default="2000k", help="Target bitrate, applied to every segment")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = os.path.join(work_dir, "source.mp4")
+        print(f"Generating {args.duration}s {args.size} test video...")
+        make_test_video(source, args.duration, args.size)
+        streams = probe_streams(source)
+        video_args = ["-b:v", args.bitrate]
+
+        started = time.perf_counter()
+        run_ffmpeg([find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", source]
+                   + video_encoder_args("mp4", args.encoder) + video_args
+                   + ["-c:a", "copy", os.path.join(work_dir, "serial.mp4")])
+        serial = time.perf_counter() - started
+        print(f"{'serial':>10}: {serial:7.2f}s  1.00x")
+
+        for workers in worker_counts():
+            output = os.path.join(work_dir, f"segmented_{workers}.mp4")
+            started = time.perf_counter()
+            encode_segmented(source, output, "mp4", streams, video_args, encoder=args.encoder, workers=workers)
+            elapsed = time.perf_counter() - started
+            print(f"{workers:>3} workers: {elapsed:7.2f}s  {serial / elapsed:.2f}x  "
+                  f"({os.path.getsize(output) / 1_000_000:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Load test for the local job service.
+
+Starts ``service.py`` on a free localhost port (or uses ``--url``), then has
+``--clients`` threads each submit ``--jobs`` conversions of a generated
+fixture. Uploads and downloads are streamed from and to disk. Clients honour
+HTTP 429 by waiting for Retry-After, follow each job's event stream until
+it finishes, and fetch the result. Reports throughput, latency percentiles
+and how often the service pushed back.
+
+Usage:
+    python benchmarks/service_load.py --clients 16 --jobs 4 --workers 4 --max-queue 8
+    python benchmarks/service_load.py --kind video --to webm --clients 4
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from transcode import find_ffmpeg  # noqa: E402
+
+
+def make_fixture(work_dir, kind):
+    """Write a 2000x1500 JPEG or a 10 s testsrc clip and return its path."""
+    if kind == "image":
+        from PIL import Image
+
+        path = os.path.join(work_dir, "fixture.jpg")
+        Image.effect_noise((2000, 1500), 64).convert("RGB").save(path, quality=90)
+    else:
+        path = os.path.join(work_dir, "fixture.mp4")
+        subprocess.run([find_ffmpeg(), "-hide_banner", "-v", "error", "-y",
+                        "-f", "lavfi", "-i", "testsrc=size=640x360:rate=25:duration=10",
+                        "-c:v", "libx264", "-preset", "ultrafast", path], check=True)
+    return path
+
+
+def start_service(workers, max_queue):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "service.py"), "--port", str(port),
+                                "--workers", str(workers), "--max-queue", str(max_queue)],
+                               stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Service did not start")
+
+
+def request(base, method, path, body=None, headers=None):
+    url = urlsplit(base)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=600)
+    conn.request(method, path, body=body, headers=headers or {})
+    return conn, conn.getresponse()
+
+
+def run_client(base, fixture, to, jobs, stats, lock):
+    for _ in range(jobs):
+        started = time.perf_counter()
+        while True:
+            with open(fixture, "rb") as f:
+                conn, response = request(base, "POST", f"/jobs?mode=convert&to={to}&filename="
+                                         f"{os.path.basename(fixture)}", body=f,
+                                         headers={"Content-Length": str(os.path.getsize(fixture))})
+            payload = json.loads(response.read())
+            conn.close()
+            if response.status != 429:
+                break
+            with lock:
+                stats["rejected"] += 1
+            time.sleep(float(response.getheader("Retry-After", "1")))
+        if response.status != 202:
+            with lock:
+                stats["failed"] += 1
+                stats["errors"].append(payload.get("error"))
+            continue
+
+        conn, response = request(base, "GET", f"/jobs/{payload['id']}/events")
+        state = payload
+        for line in response:
+            state = json.loads(line)
+        conn.close()
+
+        if state["status"] == "done":
+            conn, response = request(base, "GET", f"/jobs/{payload['id']}/result")
+            size = 0
+            while True:
+                chunk = response.read(256 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+            conn.close()
+            request(base, "DELETE", f"/jobs/{payload['id']}")[0].close()
+        with lock:
+            if state["status"] == "done":
+                stats["done"] += 1
+                stats["bytes"] += size
+                stats["latencies"].append(time.perf_counter() - started)
+            else:
+                stats["failed"] += 1
+                stats["errors"].append(state.get("error"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the local job service.")
+    parser.add_argument("--url", help="Use a running service instead of starting one")
+    parser.add_argument("--kind", choices=["image", "video"], default="image")
+    parser.add_argument("--to", help="Target format (default: webp for images, webm for video)")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=4, help="Jobs per client")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Service workers")
+    parser.add_argument("--max-queue", type=int, default=8, help="Service queue size")
+    args = parser.parse_args(argv)
+    to = args.to or ("webp" if args.kind == "image" else "webm")
+
+    process = None
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixture = make_fixture(work_dir, args.kind)
+        if args.url:
+            base = args.url
+        else:
+            process, base = start_service(args.workers, args.max_queue)
+        try:
+            stats = {"done": 0, "failed": 0, "rejected": 0, "bytes": 0, "latencies": [], "errors": []}
+            lock = threading.Lock()
+            started = time.perf_counter()
+            threads = [threading.Thread(target=run_client, args=(base, fixture, to, args.jobs, stats, lock))
+                       for _ in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    latencies = sorted(stats["latencies"]) or [0]
+    print(f"{stats['done']} done, {stats['failed']} failed, {stats['rejected']} rejected with 429 "
+          f"in {elapsed:.2f}s ({stats['done'] / elapsed:.1f} jobs/s, {stats['bytes'] / 1_000_000:.1f} MB out)")
+    print(f"latency p50 {latencies[len(latencies) // 2]:.2f}s, p95 {latencies[int(len(latencies) * 0.95)]:.2f}s, "
+          f"max {latencies[-1]:.2f}s")
+    for error in sorted(set(filter(None, stats["errors"]))):
+        print(f"  error: {error}")
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Benchmark suite for every conversion and compression path, with regression tracking.
+
+Generates its own fixtures (Pillow images, ffmpeg ``sine`` audio and
+``testsrc`` video) in two sizes and runs convert_image, convert_audio,
+convert_video, compress_image and compress_video over a set of format
+pairs. Each case runs in a fresh interpreter and records wall time, CPU time
+(including ffmpeg children), peak RSS (the larger of the interpreter and its
+ffmpeg child) and output size. The median of ``--repeat`` runs is kept.
+
+Results are written as JSON. With ``--baseline`` they are compared against a
+previous results file, and the run fails (exit code 1) if any case got
+slower or used more memory than ``--threshold`` allows.
+
+Usage:
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --baseline baseline.json --threshold 0.15
+    python benchmarks/suite.py --cases "video*" --sizes small --repeat 5
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from transcode import find_ffmpeg, run_ffmpeg  # noqa: E402
+
+RESULTS_VERSION = 1
+
+# Fixture dimensions / durations per size
+SIZES = {
+    "small": {"image": (640, 480), "audio": 30, "video": ("640x360", 5)},
+    "large": {"image": (4000, 3000), "audio": 600, "video": ("1920x1080", 30)},
+}
+
+# (case name, converter function, fixture kind, fixture extension, extra arguments, output extension)
+CASES = [
+    ("image.convert.jpg-webp", "convert_image", "image", "jpg", ["webp"], "webp"),
+    ("image.convert.png-jpg", "convert_image", "image", "png", ["jpg"], "jpg"),
+    ("image.convert.jpg-png", "convert_image", "image", "jpg", ["png"], "png"),
+    ("image.compress.jpg-q60", "compress_image", "image", "jpg", [60], "jpg"),
+    ("image.compress.png", "compress_image", "image", "png", [60], "png"),
+    ("audio.convert.wav-mp3", "convert_audio", "audio", "wav", ["mp3"], "mp3"),
+    ("audio.convert.mp3-ogg", "convert_audio", "audio", "mp3", ["ogg"], "ogg"),
+    ("audio.convert.wav-flac", "convert_audio", "audio", "wav", ["flac"], "flac"),
+    ("video.convert.mp4-mkv", "convert_video", "video", "mp4", ["mkv"], "mkv"),
+    ("video.convert.mp4-webm", "convert_video", "video", "mp4", ["webm"], "webm"),
+    ("video.convert.mp4-avi", "convert_video", "video", "mp4", ["avi"], "avi"),
+    ("video.compress.mp4-q50", "compress_video", "video", "mp4", [50], "mp4"),
+]
+
+# Runs in a fresh interpreter so every measurement starts from a clean heap
+CHILD_SCRIPT = """
+import json, os, resource, sys, time
+function, source, target, args = sys.argv[1], sys.argv[2], sys.argv[3], json.loads(sys.argv[4])
+import converter
+started = time.perf_counter()
+getattr(converter, function)(source, target, *args)
+wall = time.perf_counter() - started
+scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is KiB on Linux, bytes on macOS
+me = resource.getrusage(resource.RUSAGE_SELF)
+children = resource.getrusage(resource.RUSAGE_CHILDREN)
+print(json.dumps({
+    "wall": wall,
+    "cpu": me.ru_utime + me.ru_stime + children.ru_utime + children.ru_stime,
+    "peak_rss": max(me.ru_maxrss, children.ru_maxrss) * scale,
+    "output_size": os.path.getsize(target),
+}))
+"""
+
+# Metrics compared against the baseline; output size is reported but not gated
+GATED_METRICS = ("wall", "cpu", "peak_rss")
+
+
+def make_image(path, size):
+    from PIL import Image
+
+    width, height = size
+    img = Image.merge("RGB", [
+        Image.linear_gradient("L").resize((width, height)),
+        Image.effect_noise((width, height), 48),
+        Image.linear_gradient("L").rotate(90).resize((width, height)),
+    ])
+    if path.endswith(".jpg"):
+        img.save(path, quality=92)
+    else:
+        img.save(path)
+
+
+def make_audio(path, seconds):
+    run_ffmpeg([find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-f", "lavfi",
+                "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}", "-ac", "2", path])
+
+
+def make_video(path, resolution, seconds):
+    run_ffmpeg([find_ffmpeg(), "-hide_banner", "-nostdin", "-y",
+                "-f", "lavfi", "-i", f"testsrc2=size={resolution}:rate=30:duration={seconds}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-shortest", path])
+
+
+def fixture(work_dir, kind, extension, size):
+    """Return the path of a generated fixture, creating it on first use."""
+    path = os.path.join(work_dir, f"{kind}_{size}.{extension}")
+    if not os.path.exists(path):
+        spec = SIZES[size][kind]
+        if kind == "image":
+            make_image(path, spec)
+        elif kind == "audio":
+            make_audio(path, spec)
+        else:
+            make_video(path, *spec)
+    return path
+
+
+def measure(function, source, target, args):
+    """Run one conversion in a fresh interpreter and return its metrics."""
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, function, source, target, json.dumps(args)],
+                            cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_suite(work_dir, patterns, sizes, repeat):
+    """Run the selected cases and return {"<case>@<size>": metrics}."""
+    results = {}
+    for size in sizes:
+        for name, function, kind, extension, args, output_extension in CASES:
+            key = f"{name}@{size}"
+            if not any(fnmatch.fnmatch(key, pattern) for pattern in patterns):
+                continue
+            source = fixture(work_dir, kind, extension, size)
+            target = os.path.join(work_dir, f"out_{name}_{size}.{output_extension}")
+            try:
+                runs = [measure(function, source, target, args) for _ in range(repeat)]
+            except RuntimeError as e:
+                results[key] = {"error": str(e)}
+                print(f"{key:<34} failed: {e}", flush=True)
+                continue
+            metrics = {metric: statistics.median(run[metric] for run in runs) for metric in runs[0]}
+            results[key] = metrics
+            print(f"{key:<34} {metrics['wall']:8.3f}s wall {metrics['cpu']:8.3f}s cpu "
+                  f"{metrics['peak_rss'] / 1_000_000:8.1f} MB rss {metrics['output_size'] / 1_000_000:8.2f} MB out",
+                  flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regression messages for metrics above ``baseline * (1 + threshold)``."""
+    regressions = []
+    for key, metrics in results.items():
+        before = baseline.get(key)
+        if before is None or "error" in before:
+            continue
+        if "error" in metrics:
+            regressions.append(f"{key}: failed ({metrics['error']}), baseline succeeded")
+            continue
+        for metric in GATED_METRICS:
+            if before.get(metric) and metrics[metric] > before[metric] * (1 + threshold):
+                change = metrics[metric] / before[metric] - 1
+                regressions.append(f"{key}: {metric} {before[metric]:.3f} -> {metrics[metric]:.3f} (+{change:.0%})")
+    return regressions
+
+
+def environment():
+    ffmpeg = find_ffmpeg()
+    version = None
+    if ffmpeg:
+        version = subprocess.run([ffmpeg, "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "ffmpeg": version, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every conversion path and check for regressions.")
+    parser.add_argument("--cases", default="*", help="Comma-separated glob patterns over case@size names")
+    parser.add_argument("--sizes", default="small,large", help="Comma-separated fixture sizes (small, large)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the median is kept")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown/memory growth over the baseline (0.2 = 20%%)")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    args = parser.parse_args(argv)
+
+    sizes = [size for size in args.sizes.split(",") if size]
+    if args.list:
+        for size in sizes:
+            for case in CASES:
+                print(f"{case[0]}@{size}")
+        return 0
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_suite(work_dir, args.cases.split(","), sizes, args.repeat)
+
+    report = {"version": RESULTS_VERSION, "environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failed = [key for key, metrics in results.items() if "error" in metrics]
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+        print(f"No regressions above {args.threshold:.0%} against {args.baseline}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
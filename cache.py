@@ -0,0 +1,190 @@
+"""Content-addressed cache of conversion results.
+
+Results are keyed on a fingerprint of the input plus every setting that
+affects the output (mode, target format, quality, encoder, preset, ...). The
+index lives in memory and is persisted to ``index.json`` next to the cached
+files, so lookups never rescan the directory. The cache is bounded in size and
+evicts least-recently-used entries.
+
+Results are stored and materialized as a reflink (copy-on-write clone) where
+the filesystem supports it, otherwise as a copy. Hardlinks are never used: a
+later job overwriting the output path in place (ffmpeg ``-y``, Pillow
+``save``) would also rewrite the cache entry behind another key.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+# Inputs up to this size are hashed in full; larger ones are sampled
+FULL_HASH_LIMIT = 8 * 1024 ** 2
+SAMPLE_COUNT = 16
+SAMPLE_SIZE = 64 * 1024
+
+# ioctl number of FICLONE on Linux (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+
+def default_cache_dir():
+    """Return the per-user cache directory for conversion results."""
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "convert-py")
+
+
+def fingerprint(path):
+    """Return a content fingerprint of a file.
+
+    Small files are hashed in full. Large files hash their size, mtime and
+    ``SAMPLE_COUNT`` evenly spaced chunks, so fingerprinting a multi-gigabyte
+    video reads about a megabyte.
+    """
+    st = os.stat(path)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(st.st_size).encode())
+    with open(path, "rb") as f:
+        if st.st_size <= FULL_HASH_LIMIT:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        else:
+            digest.update(str(st.st_mtime_ns).encode())
+            step = (st.st_size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1)
+            for i in range(SAMPLE_COUNT):
+                f.seek(i * step)
+                digest.update(f.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def clone_file(src, dst):
+    """Materialize ``src`` at ``dst`` via reflink or copy; return the method used."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if sys.platform.startswith("linux"):
+        try:
+            import fcntl
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return "reflink"
+        except OSError:
+            os.remove(dst)
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+class ConversionCache:
+    """Size-bounded LRU cache of conversion outputs on disk."""
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(self.root, "index.json")
+        self._entries = collections.OrderedDict()
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    @property
+    def total_bytes(self):
+        return sum(entry["size"] for entry in self._entries.values())
+
+    def job_key(self, input_path, mode, output_path, **settings):
+        """Return the cache key for producing ``output_path`` from ``input_path`` with these settings."""
+        settings = {name: value for name, value in settings.items() if value is not None}
+        settings["mode"] = mode
+        settings["target"] = os.path.splitext(output_path)[1][1:].lower()
+        payload = json.dumps({"v": CACHE_VERSION, "input": fingerprint(input_path), "settings": settings},
+                             sort_keys=True)
+        return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+    def fetch(self, key, output_path):
+        """Materialize a cached result at ``output_path``; return False on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not os.path.exists(self._path(entry)):
+                if entry is not None:
+                    del self._entries[key]
+                    self._save()
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._save()
+            clone_file(self._path(entry), output_path)
+            return True
+
+    def report(self, key):
+        """Return the report stored with a cached result (e.g. a target-size search), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry and entry.get("report")
+
+    def store(self, key, output_path, report=None):
+        """Add a freshly produced output (and the report its job returned) to the cache.
+
+        Old entries are evicted if the cache is over its size limit.
+        """
+        size = os.path.getsize(output_path)
+        if size > self.max_bytes:
+            return
+        entry = {"file": key + os.path.splitext(output_path)[1].lower(), "size": size}
+        if report is not None:
+            entry["report"] = report
+        with self._lock:
+            clone_file(output_path, self._path(entry))
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+            self._save()
+
+    def clear(self):
+        """Remove every cached result."""
+        with self._lock:
+            while self._entries:
+                self._remove(self._entries.popitem(last=False)[1])
+            self._save()
+
+    def _path(self, entry):
+        return os.path.join(self.root, entry["file"])
+
+    def _evict(self):
+        total = self.total_bytes
+        while total > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._remove(entry)
+            total -= entry["size"]
+
+    def _remove(self, entry):
+        try:
+            os.remove(self._path(entry))
+        except OSError:
+            pass
+
+    def _load(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION:
+            # Entries are stored least-recently-used first
+            self._entries.update((key, entry) for key, entry in data.get("entries", []))
+
+    def _save(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "entries": list(self._entries.items())}, f)
+        os.replace(tmp_path, self._index_path)
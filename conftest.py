@@ -0,0 +1 @@
+"""pytest configuration; its presence puts the repository root on sys.path for tests/."""
@@ -0,0 +1,442 @@
+"""Conversion and compression backends shared by the GUI and headless tools."""
+
+import os
+
+import metrics
+from documents import RENDER_FORMATS, compress_pdf, images_to_pdf, render_pdf
+from encoders import quality_args, select_encoder
+from images import output_image_format, process_image, process_image_variants
+from probe import check_job, default_index
+from target_size import compress_image_to_size, compress_video_to_size
+from transcode import (
+    ANIMATION_FORMATS,
+    JobCancelled,
+    ffmpeg_available,
+    transcode,
+    transcode_animation,
+    transcode_audio,
+    transcode_many,
+)
+
+# Pillow, pydub and MoviePy are imported inside the functions that use them so
+# that importing this module (for the GUI, batch.py or a single image job)
+# does not pay for every backend up front.
+
+# Supported formats for conversion by category
+SUPPORTED_FORMATS = {
+    "image": ["png", "jpeg", "jpg", "bmp", "gif", "tiff", "webp", "heif", "ico"],
+    "audio": ["mp3", "wav", "ogg", "flac", "aac", "m4a", "opus"],
+    "video": ["mp4", "avi", "mov", "webm", "flv", "mkv", "wmv", "gif", "webp"],
+    # PyMuPDF cannot open .docx, so Word files are not offered as documents
+    "document": ["pdf"]
+}
+
+# Formats each category can be converted to (images can also become a PDF,
+# and PDFs are rendered to images)
+CONVERSION_TARGETS = {
+    "image": SUPPORTED_FORMATS["image"] + ["pdf"],
+    "audio": SUPPORTED_FORMATS["audio"],
+    "video": SUPPORTED_FORMATS["video"],
+    "document": list(RENDER_FORMATS),
+}
+
+# Categories compress_file handles; audio is converted to a smaller format instead
+COMPRESSION_CATEGORIES = ("image", "video", "document")
+
+# Extra formats a multi-output job can produce from a video: audio tracks and thumbnails
+MULTI_OUTPUT_FORMATS = {
+    "image": SUPPORTED_FORMATS["image"],
+    "audio": SUPPORTED_FORMATS["audio"],
+    "video": SUPPORTED_FORMATS["video"] + SUPPORTED_FORMATS["audio"] + ["png", "jpg", "jpeg", "bmp"],
+}
+
+def clean_path(path):
+    """Clean the file path by removing curly braces and handling spaces."""
+    return path.strip('{}').strip('"').strip("'")
+
+def converted_output_path(input_path, output_format, output_dir=None):
+    """Return the default output path for a conversion ("<name>_converted.<fmt>")."""
+    base = os.path.splitext(input_path)[0]
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return base + f"_converted.{output_format.lower()}"
+
+def compressed_output_path(input_path, output_dir=None):
+    """Return the default output path for a compression ("<name>_compressed.<ext>")."""
+    base, ext = os.path.splitext(input_path)
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return base + "_compressed" + ext
+
+def parse_targets(text):
+    """Parse "png,webp,jpg:800" into multi-output targets ("format[:max_size]", comma-separated)."""
+    targets = []
+    for part in text.split(","):
+        output_format, _, max_size = part.strip().lower().partition(":")
+        if not output_format:
+            continue
+        if max_size and not max_size.isdigit():
+            raise ValueError(f"Invalid max size in target: {part.strip()}")
+        targets.append({"format": output_format, "max_size": int(max_size) if max_size else None})
+    return targets
+
+def multi_output_targets(input_path, category, targets, output_dir=None):
+    """Normalize multi-output targets into {"format", "output", "max_size"} dicts with output paths.
+
+    Targets are format names or dicts with "format" and optional "output" and
+    "max_size". Outputs default to converted_output_path(), with the max
+    size appended ("_converted_800.jpg") when one is set.
+    """
+    outputs = []
+    for target in targets:
+        target = {"format": target} if isinstance(target, str) else dict(target)
+        target["format"] = target["format"].lower()
+        target.setdefault("max_size", None)
+        if target["format"] not in MULTI_OUTPUT_FORMATS.get(category, []):
+            raise ValueError(f"Cannot convert {category} to {target['format']}")
+        if not target.get("output"):
+            output_path = converted_output_path(input_path, target["format"], output_dir)
+            if target["max_size"]:
+                base, ext = os.path.splitext(output_path)
+                output_path = f"{base}_{target['max_size']}{ext}"
+            target["output"] = output_path
+        outputs.append(target)
+    paths = [os.path.abspath(output["output"]) for output in outputs]
+    if len(set(paths)) != len(paths):
+        raise ValueError("Two targets would write the same output file")
+    if not outputs:
+        raise ValueError("No output formats given")
+    return outputs
+
+def detect_file_category(file_extension):
+    """Return the category of the file based on its extension."""
+    file_extension = file_extension.lower()
+    for category, extensions in SUPPORTED_FORMATS.items():
+        if file_extension in extensions:
+            return category
+    return None
+
+def report_progress(progress, percent, stage, bytes_written=None):
+    """Send a progress event for pipelines that do not run through ffmpeg."""
+    if progress:
+        progress({"stage": stage, "percent": percent, "fps": None, "eta": None, "bytes_written": bytes_written})
+
+def describe_report(report):
+    """Return a one-line summary of a compression report (target-size search or PDF recompression)."""
+    mb = 1024 ** 2
+    if "trials" in report:
+        return (f"Size: {report['size'] / mb:.2f} MB (target {report['target_size'] / mb:.2f} MB) "
+                f"after {report['trials']} trial encode(s)")
+    if "images" in report:
+        return (f"Size: {report['size'] / mb:.2f} MB (was {report['input_size'] / mb:.2f} MB), "
+                f"{report['images']} image(s) recompressed")
+    return f"Size: {report['size'] / mb:.2f} MB"
+
+def check_cancel(cancel):
+    """Raise JobCancelled if the job's cancel event is set."""
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled("Job was cancelled")
+
+def inspect_input(input_path, category):
+    """Return the indexed metadata of an input, rejecting jobs that cannot work on its content."""
+    metadata = default_index().get(input_path)
+    check_job(metadata, category)
+    return metadata
+
+def _streams(metadata):
+    """Return probed metadata usable as transcode's ``streams``, or None if the probe could not run."""
+    return metadata if metadata["probed"] else None
+
+def _video_format(path):
+    """Return the container format implied by a file's extension."""
+    return os.path.splitext(path)[1][1:].lower()
+
+def compress_image(input_path, output_path, quality, progress=None, cancel=None, max_size=None, target_size=None):
+    """Compress image files with the specified quality, optionally capping the longest side.
+
+    With ``target_size`` (bytes) the quality is searched instead and a report
+    of the search is returned.
+    """
+    def on_stage(percent, stage):
+        check_cancel(cancel)
+        report_progress(progress, percent, stage)
+
+    def on_trial(trials, max_trials):
+        on_stage(trials / max_trials * 100, "search")
+
+    try:
+        report_progress(progress, 0.0, "decode")
+        if target_size:
+            report = compress_image_to_size(input_path, output_path, target_size, max_size=max_size,
+                                            on_trial=on_trial)
+        else:
+            report = None
+            process_image(input_path, output_path, output_image_format(output_path), quality, max_size, on_stage)
+        report_progress(progress, 100.0, "done", os.path.getsize(output_path))
+        return report
+    except Exception as e:
+        raise ValueError(f"Error compressing image: {str(e)}")
+
+def compress_video(input_path, output_path, quality, encoder=None, preset=None, progress=None, cancel=None,
+                   segmented=None, target_size=None, streams=None):
+    """Compress video files at a constant quality derived from the 1-100 quality value.
+
+    With ``target_size`` (bytes) the bitrate is computed from the duration
+    instead, the video is encoded in two passes and a report is returned.
+    """
+    try:
+        output_format = _video_format(output_path)
+        if target_size:
+            return compress_video_to_size(input_path, output_path, target_size, encoder, preset, progress, cancel,
+                                          streams)
+        if ffmpeg_available():
+            encoder = encoder or select_encoder(output_format)
+            transcode(input_path, output_path, output_format,
+                      video_args=quality_args(encoder, quality), encoder=encoder, preset=preset,
+                      progress=progress, cancel=cancel, segmented=segmented, streams=streams)
+        else:
+            from moviepy.editor import VideoFileClip
+            clip = VideoFileClip(input_path)
+            clip.write_videofile(output_path, codec=encoder or "libx264", preset=preset or "medium",
+                                 ffmpeg_params=quality_args(encoder or "libx264", quality))
+            clip.close()
+    except Exception as e:
+        raise ValueError(f"Error compressing video: {str(e)}")
+
+def compress_file(input_path, output_path, category, quality, encoder=None, preset=None, progress=None, cancel=None,
+                  cache=None, segmented=None, max_size=None, target_size=None, queued_at=None, profile=None):
+    """Compress the file based on category (image/video/document).
+
+    ``progress`` receives progress event dicts; setting the ``cancel`` event
+    aborts the job with JobCancelled. With a ConversionCache as ``cache``,
+    repeated jobs are served from the cache instead of being re-encoded, and
+    return the report stored with the result.
+    ``segmented`` forces (True) or disables (False) parallel segmented video
+    encoding; by default long videos are segmented automatically. ``max_size``
+    caps the longest side of images in pixels. For PDFs, ``quality`` sets the
+    JPEG quality and resolution of the embedded images, and a report of the
+    images recompressed and the sizes is returned. ``target_size`` (bytes)
+    replaces ``quality`` with a search for the best result that fits; the
+    search report (trial encodes, final size) is returned. The input's
+    content is checked against ``category`` before any work starts.
+    ``queued_at`` (time.time() when the job was queued) and ``profile`` (a
+    path) feed the metrics module.
+    """
+    with metrics.job("compress", input_path, output_path, queued_at, profile, mode="compress",
+                     category=category) as record:
+        progress = record.wrap_progress(progress)
+        try:
+            if cache is not None:
+                with record.stage("cache"):
+                    key = cache.job_key(input_path, "compress", output_path, quality=quality, encoder=encoder,
+                                        preset=preset, max_size=max_size, target_size=target_size)
+                    hit = cache.fetch(key, output_path)
+                if hit:
+                    report_progress(progress, 100.0, "cache", os.path.getsize(output_path))
+                    return cache.report(key)
+            with record.stage("probe"):
+                metadata = inspect_input(input_path, category)
+            if category == "image":
+                report = compress_image(input_path, output_path, quality, progress, cancel, max_size, target_size)
+            elif category == "video":
+                report = compress_video(input_path, output_path, quality, encoder, preset, progress, cancel,
+                                        segmented, target_size, _streams(metadata))
+            elif category == "document":
+                report = compress_document(input_path, output_path, quality, progress, cancel)
+            else:
+                raise ValueError("Unsupported compression category.")
+            if cache is not None:
+                with record.stage("cache"):
+                    cache.store(key, output_path, report)
+            return report
+        except Exception as e:
+            raise ValueError(f"Error during compression: {str(e)}")
+
+def compress_document(input_path, output_path, quality, progress=None, cancel=None):
+    """Compress a PDF by downsampling and recompressing its images; return compress_pdf()'s report."""
+    try:
+        report_progress(progress, 0.0, "decode")
+        report = compress_pdf(input_path, output_path, quality, progress, cancel)
+        report_progress(progress, 100.0, "done", os.path.getsize(output_path))
+        return report
+    except Exception as e:
+        raise ValueError(f"Error compressing document: {str(e)}")
+
+def convert_document(input_path, output_path, output_format, progress=None, cancel=None):
+    """Render every page of a PDF to an image, in parallel; return the page paths.
+
+    A single-page PDF is written to ``output_path``; longer ones to numbered
+    files next to it ("<name>_converted-001.png", ...). If the conversion
+    fails or is cancelled, the pages written so far are removed.
+    """
+    paths = []
+    try:
+        paths = render_pdf(input_path, output_path, output_format, progress=progress, cancel=cancel)
+        report_progress(progress, 100.0, "done", sum(os.path.getsize(path) for path in paths))
+        return paths
+    except BaseException as e:
+        # render_pdf removes its pages when rendering fails; this covers the steps after it
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        if isinstance(e, Exception):
+            raise ValueError(f"Error converting document: {str(e)}")
+        raise
+
+def convert_image(input_path, output_path, output_format, progress=None, cancel=None, max_size=None):
+    """Convert image files to the specified format (or a one-page PDF), optionally capping the longest side."""
+    def on_stage(percent, stage):
+        check_cancel(cancel)
+        report_progress(progress, percent, stage)
+
+    try:
+        report_progress(progress, 0.0, "decode")
+        if output_format.lower() == "pdf":
+            images_to_pdf([input_path], output_path, max_size, progress, cancel)
+        else:
+            process_image(input_path, output_path, output_format, max_size=max_size, on_stage=on_stage)
+        report_progress(progress, 100.0, "done", os.path.getsize(output_path))
+    except Exception as e:
+        raise ValueError(f"Error converting image: {str(e)}")
+
+def convert_audio(input_path, output_path, output_format, progress=None, cancel=None, streams=None):
+    """Convert audio files to the specified format, streaming through ffmpeg."""
+    try:
+        if ffmpeg_available():
+            transcode_audio(input_path, output_path, output_format, progress=progress, cancel=cancel,
+                            streams=streams)
+            return
+
+        # pydub decodes the whole file into memory; only used when ffmpeg is missing
+        from pydub import AudioSegment
+
+        report_progress(progress, 0.0, "decode")
+        audio = AudioSegment.from_file(input_path)
+        check_cancel(cancel)
+        report_progress(progress, 50.0, "encode")
+        audio.export(output_path, format=output_format)
+        report_progress(progress, 100.0, "done", os.path.getsize(output_path))
+    except Exception as e:
+        raise ValueError(f"Error converting audio: {str(e)}")
+
+def convert_video(input_path, output_path, output_format, encoder=None, preset=None, progress=None, cancel=None,
+                  segmented=None, streams=None, max_size=None, fps=None):
+    """Convert video files to the specified format, remuxing when no re-encode is needed.
+
+    gif and webp targets become animations capped at ``fps`` frames per
+    second and ``max_size`` pixels (see transcode_animation).
+    """
+    try:
+        if output_format.lower() in ANIMATION_FORMATS:
+            if not ffmpeg_available():
+                raise ValueError("Animated output from video needs ffmpeg")
+            transcode_animation(input_path, output_path, output_format, fps, max_size, progress=progress,
+                                cancel=cancel, streams=streams)
+        elif ffmpeg_available():
+            transcode(input_path, output_path, output_format, encoder=encoder, preset=preset,
+                      progress=progress, cancel=cancel, segmented=segmented, streams=streams)
+        else:
+            # MoviePy decodes every frame in Python; only used when ffmpeg is missing
+            from moviepy.editor import VideoFileClip
+            clip = VideoFileClip(input_path)
+            clip.write_videofile(output_path, codec=encoder or "libx264", preset=preset or "medium")
+            clip.close()
+    except Exception as e:
+        raise ValueError(f"Error converting video: {str(e)}")
+
+def convert_file(input_path, output_path, category, output_format, encoder=None, preset=None, progress=None,
+                 cancel=None, cache=None, segmented=None, max_size=None, queued_at=None, profile=None, fps=None):
+    """Convert the file based on category (image/audio/video/document).
+
+    ``encoder`` and ``preset`` override the automatically selected video encoder.
+    ``progress`` receives progress event dicts; setting the ``cancel`` event
+    aborts the job with JobCancelled. With a ConversionCache as ``cache``,
+    repeated jobs are served from the cache instead of being re-encoded.
+    ``segmented`` forces (True) or disables (False) parallel segmented video
+    encoding; by default long videos are segmented automatically. ``max_size``
+    caps the longest side of images and video-to-GIF/WebP animations in
+    pixels, and ``fps`` the frame rate of those animations. The input's
+    content is checked against ``category`` before any work starts, and the
+    probed streams decide between remux and transcode. ``queued_at``
+    (time.time() when the job was queued) and ``profile`` (a path) feed the
+    metrics module. PDFs are rendered page by page (see convert_document)
+    and the list of page images is returned; they bypass the cache.
+    """
+    if category == "document":
+        cache = None
+    with metrics.job("convert", input_path, output_path, queued_at, profile, mode="convert", category=category,
+                     format=output_format) as record:
+        progress = record.wrap_progress(progress)
+        try:
+            if cache is not None:
+                with record.stage("cache"):
+                    key = cache.job_key(input_path, "convert", output_path, format=output_format, encoder=encoder,
+                                        preset=preset, max_size=max_size, fps=fps)
+                    hit = cache.fetch(key, output_path)
+                if hit:
+                    report_progress(progress, 100.0, "cache", os.path.getsize(output_path))
+                    return
+            with record.stage("probe"):
+                metadata = inspect_input(input_path, category)
+            if category == "image":
+                convert_image(input_path, output_path, output_format, progress, cancel, max_size)
+            elif category == "audio":
+                convert_audio(input_path, output_path, output_format, progress, cancel, _streams(metadata))
+            elif category == "video":
+                convert_video(input_path, output_path, output_format, encoder, preset, progress, cancel, segmented,
+                              _streams(metadata), max_size, fps)
+            elif category == "document":
+                return convert_document(input_path, output_path, output_format, progress, cancel)
+            else:
+                raise ValueError("Unsupported conversion category.")
+            if cache is not None:
+                with record.stage("cache"):
+                    cache.store(key, output_path)
+        except Exception as e:
+            raise ValueError(f"Error during conversion: {str(e)}")
+
+def convert_many(input_path, targets, category, encoder=None, preset=None, progress=None, cancel=None,
+                 output_dir=None, queued_at=None, profile=None):
+    """Convert one input into several formats, decoding it only once; return the output paths.
+
+    ``targets`` is a list of formats or dicts (see multi_output_targets), e.g.
+    ["mp4", "webm", {"format": "jpg", "max_size": 320}]. Images are decoded
+    once by Pillow and every variant is saved from memory. Audio and video
+    run through a single ffmpeg process with one output per target, so the
+    input is demuxed and decoded once; a video can also yield audio files and
+    a thumbnail. Other arguments are as for convert_file.
+    """
+    def on_stage(percent, stage):
+        check_cancel(cancel)
+        report_progress(progress, percent, stage)
+
+    outputs = multi_output_targets(input_path, category, targets, output_dir)
+    with metrics.job("convert_many", input_path, None, queued_at, profile, mode="convert", category=category,
+                     format=",".join(output["format"] for output in outputs)) as record:
+        progress = record.wrap_progress(progress)
+        try:
+            with record.stage("probe"):
+                metadata = inspect_input(input_path, category)
+            if category == "image":
+                report_progress(progress, 0.0, "decode")
+                process_image_variants(input_path, [(output["output"], output["format"], output["max_size"])
+                                                    for output in outputs], on_stage=on_stage)
+            elif ffmpeg_available():
+                transcode_many(input_path, outputs, encoder, preset, progress, cancel, _streams(metadata))
+            else:
+                # The pydub/MoviePy fallbacks decode per output
+                for output in outputs:
+                    if output["format"] in SUPPORTED_FORMATS["audio"]:
+                        convert_audio(input_path, output["output"], output["format"], progress, cancel)
+                    elif output["format"] in SUPPORTED_FORMATS["video"]:
+                        convert_video(input_path, output["output"], output["format"], encoder, preset, progress,
+                                      cancel)
+                    else:
+                        raise ValueError("Thumbnails need ffmpeg")
+            paths = [output["output"] for output in outputs]
+            written = sum(os.path.getsize(path) for path in paths)
+            record.add_bytes(written=written)
+            report_progress(progress, 100.0, "done", written)
+            return paths
+        except Exception as e:
+            raise ValueError(f"Error during conversion: {str(e)}")
@@ -0,0 +1,278 @@
+"""PDF rasterization, image-to-PDF assembly and PDF compression.
+
+- render_pdf() splits the pages into chunks that worker processes render
+  independently. Each worker opens the document itself and writes every page
+  to disk as soon as it is rendered, so at most one page per worker is held
+  in memory.
+- images_to_pdf() builds a PDF with one page per image. Pages are added one
+  at a time, and JPEGs are embedded as they are, without re-encoding.
+- compress_pdf() downsamples embedded images to a resolution derived from
+  the quality setting, recompresses them as JPEG, and drops unused objects
+  when saving.
+
+PyMuPDF (``import fitz``) is imported on first use, like the other heavy
+backends.
+"""
+
+import argparse
+import io
+import math
+import os
+import shutil
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from images import draft_for_size, fit, pil_format, prepare_mode, save_kwargs
+from transcode import JobCancelled
+
+# Image formats a PDF can be rendered to
+RENDER_FORMATS = ("png", "jpg", "jpeg", "webp", "tiff")
+
+DEFAULT_DPI = 150
+
+# compress_pdf: images are downsampled to at most quality * 3 DPI
+# (quality 100 -> 300 DPI, 50 -> 150 DPI), but never below this
+MIN_COMPRESS_DPI = 72
+
+# Embedded images smaller than this are left alone
+MIN_IMAGE_BYTES = 16 * 1024
+
+
+def _fitz():
+    try:
+        import fitz
+    except ImportError:
+        raise ValueError("PDF support needs PyMuPDF (pip install pymupdf)")
+    return fitz
+
+
+def page_count(input_path):
+    """Return the number of pages of a PDF."""
+    with _fitz().open(input_path) as doc:
+        return doc.page_count
+
+
+def page_paths(output_path, pages):
+    """Return the output path of every page: ``output_path`` itself for one page, else "<name>-001.<ext>"."""
+    if pages == 1:
+        return [output_path]
+    base, ext = os.path.splitext(output_path)
+    digits = max(3, len(str(pages)))
+    return [f"{base}-{number:0{digits}d}{ext}" for number in range(1, pages + 1)]
+
+
+def save_pixmap(pixmap, path, output_format, quality=None):
+    """Write a rendered page to disk (PNG natively, other formats through Pillow)."""
+    if pil_format(output_format) == "PNG":
+        pixmap.save(path)
+        return
+    from PIL import Image
+
+    img = Image.frombytes("L" if pixmap.n == 1 else "RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    img = prepare_mode(img, output_format)
+    img.save(path, **save_kwargs(img, output_format, quality))
+
+
+def render_pages(input_path, pages, paths, output_format, dpi=DEFAULT_DPI, quality=None):
+    """Render the given page numbers (0-based) to ``paths``; runs in a worker process."""
+    with _fitz().open(input_path) as doc:
+        for number, path in zip(pages, paths):
+            pixmap = doc[number].get_pixmap(dpi=dpi, alpha=False)
+            save_pixmap(pixmap, path, output_format, quality)
+            del pixmap
+    return len(pages)
+
+
+def render_pdf(input_path, output_path, output_format, dpi=DEFAULT_DPI, quality=None, workers=None,
+               progress=None, cancel=None):
+    """Render every page of a PDF to an image and return the page paths (see page_paths()).
+
+    Pages are rendered in chunks by up to ``workers`` processes (default: one
+    per core, at most one per page). ``progress`` receives "render" events
+    as chunks finish. When the ``cancel`` event is set, rendering stops, the
+    pages written so far are removed and JobCancelled is raised.
+    """
+    output_format = output_format.lower()
+    if output_format not in RENDER_FORMATS:
+        raise ValueError(f"Cannot render PDF pages as {output_format}")
+    pages = page_count(input_path)
+    if pages == 0:
+        raise ValueError("PDF has no pages")
+    paths = page_paths(output_path, pages)
+    workers = max(1, min(workers or os.cpu_count() or 1, pages))
+    # Several chunks per worker keeps them all busy to the end and progress moving
+    size = max(1, math.ceil(pages / (workers * 4)))
+    chunks = [list(range(start, min(start + size, pages))) for start in range(0, pages, size)]
+
+    def report(done):
+        if progress:
+            progress({"stage": "render", "percent": done / pages * 100, "fps": None, "eta": None,
+                      "bytes_written": None})
+
+    try:
+        if workers == 1:
+            done = 0
+            for chunk in chunks:
+                if cancel is not None and cancel.is_set():
+                    raise JobCancelled("Job was cancelled")
+                done += render_pages(input_path, chunk, paths[chunk[0]:chunk[-1] + 1], output_format, dpi,
+                                     quality)
+                report(done)
+            return paths
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(render_pages, input_path, chunk, paths[chunk[0]:chunk[-1] + 1],
+                                       output_format, dpi, quality) for chunk in chunks}
+            done = 0
+            while pending:
+                finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                if cancel is not None and cancel.is_set():
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise JobCancelled("Job was cancelled")
+                for future in finished:
+                    done += future.result()
+                if finished:
+                    report(done)
+        return paths
+    except BaseException:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+
+def images_to_pdf(input_paths, output_path, max_size=None, progress=None, cancel=None):
+    """Assemble images into a PDF with one page per image, sized to the image at 72 DPI.
+
+    JPEGs (without a resize) are embedded unchanged; other images are inserted
+    one at a time, so only the current image is decoded.
+    """
+    fitz = _fitz()
+    with fitz.open() as doc:
+        for index, path in enumerate(input_paths):
+            if cancel is not None and cancel.is_set():
+                raise JobCancelled("Job was cancelled")
+            stream, width, height = _pdf_image(path, max_size)
+            page = doc.new_page(width=width, height=height)
+            page.insert_image(page.rect, stream=stream)
+            if progress:
+                progress({"stage": "encode", "percent": (index + 1) / len(input_paths) * 90, "fps": None,
+                          "eta": None, "bytes_written": None})
+        doc.save(output_path, garbage=3, deflate=True)
+    return output_path
+
+
+def _pdf_image(path, max_size=None):
+    """Return (encoded bytes, width, height) of an image ready to be placed on a PDF page."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        if img.format == "JPEG" and img.mode in ("RGB", "L", "CMYK") and not (max_size and max(img.size) > max_size):
+            with open(path, "rb") as f:
+                return f.read(), img.width, img.height
+        draft_for_size(img, max_size)
+        img.load()
+        fit(img, max_size)
+        out = prepare_mode(img, "png")
+        buffer = io.BytesIO()
+        out.save(buffer, format="PNG")
+        return buffer.getvalue(), out.width, out.height
+
+
+def compress_pdf(input_path, output_path, quality, progress=None, cancel=None):
+    """Downsample and recompress the images of a PDF according to ``quality`` (1-100).
+
+    Every embedded image larger than MIN_IMAGE_BYTES and without a soft mask
+    is scaled down to at most ``quality * 3`` DPI at the size it is shown on
+    the page, and re-encoded as JPEG at ``quality``. An image is only
+    replaced when the result is smaller. Returns a report dict with the
+    number of images recompressed and the input and output sizes.
+    """
+    from PIL import Image
+
+    fitz = _fitz()
+    max_dpi = max(MIN_COMPRESS_DPI, quality * 3)
+    replaced = 0
+    with fitz.open(input_path) as doc:
+        seen = set()
+        for page_index, page in enumerate(doc):
+            if cancel is not None and cancel.is_set():
+                raise JobCancelled("Job was cancelled")
+            for entry in page.get_images(full=True):
+                xref, smask = entry[0], entry[1]
+                if xref in seen or smask:
+                    continue
+                seen.add(xref)
+                info = doc.extract_image(xref)
+                if not info or len(info["image"]) < MIN_IMAGE_BYTES:
+                    continue
+                rects = page.get_image_rects(xref)
+                # Points are 1/72 inch; the largest placement decides the resolution needed
+                shown = max((max(rect.width, rect.height) for rect in rects), default=0) / 72
+                try:
+                    with Image.open(io.BytesIO(info["image"])) as img:
+                        img.load()
+                        limit = int(shown * max_dpi) if shown else max(img.size)
+                        if max(img.size) > limit > 0:
+                            img.thumbnail((limit, limit), Image.LANCZOS)
+                        img = img.convert("L" if img.mode in ("1", "L", "LA") else "RGB")
+                        buffer = io.BytesIO()
+                        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+                except Exception:
+                    # Formats Pillow cannot decode (e.g. JBIG2) stay as they are
+                    continue
+                if buffer.tell() < len(info["image"]):
+                    page.replace_image(xref, stream=buffer.getvalue())
+                    replaced += 1
+            if progress:
+                progress({"stage": "encode", "percent": (page_index + 1) / doc.page_count * 90, "fps": None,
+                          "eta": None, "bytes_written": None})
+        doc.save(output_path, garbage=4, deflate=True, clean=True)
+
+    input_size, output_size = os.path.getsize(input_path), os.path.getsize(output_path)
+    if output_size >= input_size:
+        # Nothing worth recompressing; keep the original bytes
+        shutil.copyfile(input_path, output_path)
+        output_size = input_size
+    return {"images": replaced, "input_size": input_size, "size": output_size}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render, assemble and compress PDFs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    render = commands.add_parser("render", help="Render every page of a PDF to an image")
+    render.add_argument("input")
+    render.add_argument("--to", dest="output_format", default="png", choices=RENDER_FORMATS)
+    render.add_argument("--output", help="Output path (default: <name>_converted.<fmt>, numbered per page)")
+    render.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    render.add_argument("--quality", type=int, help="JPEG/WebP quality")
+    render.add_argument("--workers", type=int, default=None, help="Render processes (default: CPU count)")
+    merge = commands.add_parser("merge", help="Assemble images into a PDF, one page each")
+    merge.add_argument("output")
+    merge.add_argument("images", nargs="+")
+    merge.add_argument("--max-size", type=int, help="Shrink images to at most N pixels on the longest side")
+    compress = commands.add_parser("compress", help="Downsample and recompress the images of a PDF")
+    compress.add_argument("input")
+    compress.add_argument("--output", help="Output path (default: <name>_compressed.pdf)")
+    compress.add_argument("--quality", type=int, default=75, help="JPEG quality; also sets the DPI cap (3x)")
+    args = parser.parse_args(argv)
+
+    from converter import compressed_output_path, converted_output_path
+
+    if args.command == "render":
+        output = args.output or converted_output_path(args.input, args.output_format)
+        paths = render_pdf(args.input, output, args.output_format, args.dpi, args.quality, args.workers)
+        print(f"Rendered {len(paths)} page(s) to {paths[0] if len(paths) == 1 else os.path.dirname(paths[0]) or '.'}")
+    elif args.command == "merge":
+        images_to_pdf(args.images, args.output, args.max_size)
+        print(f"Wrote {len(args.images)} page(s) to {args.output}")
+    else:
+        output = args.output or compressed_output_path(args.input)
+        report = compress_pdf(args.input, output, args.quality)
+        print(f"Recompressed {report['images']} image(s): {report['input_size'] / 1_000_000:.2f} MB -> "
+              f"{report['size'] / 1_000_000:.2f} MB ({output})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Video encoder registry.
+
+Probes the local ffmpeg build once per process and picks the fastest encoder
+that actually works on this machine for each output format: a hardware
+encoder (NVENC, QSV, VAAPI, VideoToolbox, AMF) when one is usable, otherwise
+the software encoder with a tuned preset and thread count.
+
+Usage examples:
+    python encoders.py --list
+    python encoders.py --benchmark clip.mp4 --encoders libx264,h264_nvenc --presets veryfast,medium
+"""
+
+import argparse
+import functools
+import os
+import re
+import subprocess
+import sys
+import time
+
+from transcode import find_ffmpeg
+
+# Video codec used for each container when the stream has to be re-encoded
+FORMAT_CODECS = {
+    "mp4": "h264",
+    "mov": "h264",
+    "mkv": "h264",
+    "flv": "h264",
+    "webm": "vp9",
+    "avi": "mpeg4",
+    "wmv": "wmv2",
+}
+
+# Encoders per codec, fastest first
+ENCODER_CANDIDATES = {
+    "h264": ["h264_nvenc", "h264_qsv", "h264_vaapi", "h264_videotoolbox", "h264_amf", "libx264"],
+    "hevc": ["hevc_nvenc", "hevc_qsv", "hevc_vaapi", "hevc_videotoolbox", "hevc_amf", "libx265"],
+    "vp9": ["vp9_qsv", "vp9_vaapi", "libvpx-vp9"],
+    "mpeg4": ["mpeg4"],
+    "wmv2": ["wmv2"],
+}
+
+# Speed-oriented presets used when a job does not ask for one
+DEFAULT_PRESETS = {
+    "libx264": "veryfast",
+    "libx265": "fast",
+    "h264_nvenc": "p4",
+    "hevc_nvenc": "p4",
+    "h264_qsv": "veryfast",
+    "hevc_qsv": "veryfast",
+    "vp9_qsv": "veryfast",
+}
+
+HARDWARE_SUFFIXES = ("_nvenc", "_qsv", "_vaapi", "_videotoolbox", "_amf")
+
+VAAPI_DEVICE = os.environ.get("VAAPI_DEVICE", "/dev/dri/renderD128")
+
+
+def is_hardware(encoder):
+    """Return True for GPU/ASIC encoders."""
+    return encoder.endswith(HARDWARE_SUFFIXES)
+
+
+@functools.lru_cache(maxsize=None)
+def listed_encoders():
+    """Return the set of encoder names compiled into the ffmpeg build."""
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        return frozenset()
+    try:
+        result = subprocess.run([ffmpeg, "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return frozenset()
+    return frozenset(re.findall(r"^\s*[VAS][\w.]{5}\s+(\S+)", result.stdout, re.MULTILINE))
+
+
+@functools.lru_cache(maxsize=None)
+def encoder_works(encoder):
+    """Return True if the encoder is compiled in and, for hardware encoders, can open a device.
+
+    ffmpeg lists NVENC/QSV/VAAPI even on machines without the hardware, so
+    those are checked with a tiny test encode.
+    """
+    if encoder not in listed_encoders():
+        return False
+    if not is_hardware(encoder):
+        return True
+    cmd = [find_ffmpeg(), "-hide_banner", "-nostdin", "-v", "error",
+           "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1"]
+    cmd += encoder_args(encoder) + ["-frames:v", "1", "-f", "null", "-"]
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=30).returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+def encoder_args(encoder, preset=None, threads=None):
+    """Return the ffmpeg output arguments for an encoder with a preset and thread count."""
+    preset = preset or DEFAULT_PRESETS.get(encoder)
+    threads = threads or os.cpu_count() or 1
+    args = ["-c:v", encoder]
+    if encoder.endswith("_vaapi"):
+        args = ["-vaapi_device", VAAPI_DEVICE, "-vf", "format=nv12,hwupload"] + args
+    if encoder.endswith("_amf"):
+        args += ["-quality", preset or "speed"]
+    elif encoder == "libvpx-vp9":
+        args += ["-deadline", "good", "-cpu-used", preset or "4", "-row-mt", "1"]
+    elif preset and not encoder.endswith(("_vaapi", "_videotoolbox")):
+        args += ["-preset", preset]
+    if not is_hardware(encoder):
+        args += ["-threads", str(threads)]
+    return args
+
+
+def quality_args(encoder, quality):
+    """Map the 1-100 compression quality slider onto the encoder's constant-quality control."""
+    quality = max(1, min(100, int(quality)))
+
+    def scale(worst, best):
+        return str(round(worst + (best - worst) * quality / 100))
+
+    if encoder in ("libx264", "libx265"):
+        return ["-crf", scale(51, 18)]
+    if encoder == "libvpx-vp9":
+        return ["-crf", scale(63, 20), "-b:v", "0"]
+    if encoder.endswith("_nvenc"):
+        return ["-rc", "vbr", "-cq", scale(51, 18), "-b:v", "0"]
+    if encoder.endswith("_qsv"):
+        return ["-global_quality", scale(51, 18)]
+    if encoder.endswith("_vaapi"):
+        return ["-rc_mode", "CQP", "-qp", scale(51, 18)]
+    if encoder.endswith("_videotoolbox"):
+        return ["-q:v", str(quality)]
+    if encoder.endswith("_amf"):
+        qp = scale(51, 18)
+        return ["-rc", "cqp", "-qp_i", qp, "-qp_p", qp]
+    # mpeg4, wmv2 and other classic encoders use a 2-31 quantizer
+    return ["-q:v", scale(31, 2)]
+
+
+def two_pass_args(encoder, pass_number, log_prefix):
+    """Return two-pass arguments for software encoders, or None if the encoder has no two-pass mode."""
+    if encoder == "libx265":
+        return ["-x265-params", f"pass={pass_number}:stats={log_prefix}.log"]
+    if encoder in ("libx264", "libvpx-vp9", "mpeg4", "wmv2"):
+        return ["-pass", str(pass_number), "-passlogfile", log_prefix]
+    return None
+
+
+def select_encoder(output_format):
+    """Return the fastest working encoder for an output container."""
+    codec = FORMAT_CODECS.get(output_format.lower(), "h264")
+    candidates = ENCODER_CANDIDATES[codec]
+    for encoder in candidates:
+        if encoder_works(encoder):
+            return encoder
+    # Nothing probed successfully (e.g. ffmpeg missing); let ffmpeg report the error
+    return candidates[-1]
+
+
+def video_encoder_args(output_format, encoder=None, preset=None, threads=None):
+    """Return "-c:v ..." arguments for an output format, honouring a per-job encoder override."""
+    return encoder_args(encoder or select_encoder(output_format), preset, threads)
+
+
+def benchmark(input_path, encoders, presets, seconds=None):
+    """Encode ``input_path`` to the null muxer with every encoder/preset pair and return timings."""
+    results = []
+    for encoder in encoders:
+        for preset in presets or [None]:
+            cmd = [find_ffmpeg(), "-hide_banner", "-nostdin", "-v", "error", "-i", input_path, "-an"]
+            if seconds:
+                cmd += ["-t", str(seconds)]
+            cmd += encoder_args(encoder, preset) + ["-f", "null", "-"]
+            started = time.perf_counter()
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            elapsed = time.perf_counter() - started
+            results.append({
+                "encoder": encoder,
+                "preset": preset or DEFAULT_PRESETS.get(encoder),
+                "seconds": round(elapsed, 3),
+                "ok": result.returncode == 0,
+                "error": result.stderr.strip().splitlines()[-1] if result.returncode else None,
+            })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and benchmark the available video encoders.")
+    parser.add_argument("--list", action="store_true", help="Show the encoder picked for each format")
+    parser.add_argument("--benchmark", metavar="INPUT", help="Benchmark encoders on this input file")
+    parser.add_argument("--encoders", default="", help="Comma-separated encoders to benchmark")
+    parser.add_argument("--presets", default="", help="Comma-separated presets to benchmark")
+    parser.add_argument("--seconds", type=float, help="Only encode the first N seconds")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        encoders = [e for e in args.encoders.split(",") if e] or [select_encoder("mp4")]
+        presets = [p for p in args.presets.split(",") if p]
+        for result in benchmark(args.benchmark, encoders, presets, args.seconds):
+            status = f"{result['seconds']}s" if result["ok"] else f"failed: {result['error']}"
+            print(f"{result['encoder']:<20} {str(result['preset']):<10} {status}")
+        return 0
+
+    for output_format in FORMAT_CODECS:
+        encoder = select_encoder(output_format)
+        print(f"{output_format:<5} {' '.join(video_encoder_args(output_format, encoder))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""Fast image pipeline helpers built on Pillow.
+
+- JPEGs that are going to be downscaled are decoded at reduced size with
+  ``draft()``, so the DCT does most of the shrinking for free.
+- Resizes use ``thumbnail()``, which applies ``reduce()`` before resampling.
+- The source mode (including alpha) is kept whenever the target format can
+  store it; alpha is only flattened onto white for formats without it.
+- Files that already match the requested format, size and quality are copied
+  instead of being re-encoded.
+- Animated GIF/WebP/APNG and multi-page TIFF keep all their frames when the
+  target can store them. Frames are decoded one at a time as the encoder
+  asks for them; see save_animated().
+"""
+
+import os
+import shutil
+
+# Pillow format names for the extensions we accept
+PIL_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "tif": "TIFF", "tiff": "TIFF"}
+
+# Modes each format can store without conversion
+FORMAT_MODES = {
+    "JPEG": {"RGB", "L", "CMYK"},
+    "PNG": {"1", "L", "LA", "P", "RGB", "RGBA", "I", "I;16"},
+    "WEBP": {"RGB", "RGBA"},
+    "GIF": {"1", "L", "P"},
+    "BMP": {"1", "L", "P", "RGB"},
+    "TIFF": {"1", "L", "LA", "P", "RGB", "RGBA", "CMYK", "I", "F"},
+    "ICO": {"RGB", "RGBA"},
+    "HEIF": {"RGB", "RGBA"},
+    "PDF": {"1", "L", "RGB", "CMYK"},
+}
+
+# Formats that can store several frames (PNG as APNG)
+ANIMATED_FORMATS = {"GIF", "WEBP", "PNG", "TIFF"}
+
+# Formats whose encoder takes a quality setting
+QUALITY_FORMATS = {"JPEG", "WEBP", "HEIF"}
+
+# Luminance quantization table of the IJG reference encoder at quality 50
+_STANDARD_LUMINANCE = [
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+]
+
+
+def pil_format(output_format):
+    """Return Pillow's format name for an extension-style format name."""
+    output_format = output_format.lower()
+    return PIL_FORMATS.get(output_format, output_format.upper())
+
+
+def has_alpha(img):
+    """Return True if the image carries transparency."""
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def is_animated(img):
+    """Return True for images with more than one frame (animations, multi-page TIFFs)."""
+    return getattr(img, "n_frames", 1) > 1
+
+
+def estimate_jpeg_quality(img):
+    """Estimate the IJG quality (1-100) a JPEG was saved with from its quantization table."""
+    tables = getattr(img, "quantization", None)
+    if not tables or 0 not in tables:
+        return None
+    scale = sum(q * 100 / s for q, s in zip(tables[0], _STANDARD_LUMINANCE)) / 64
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return max(1, min(100, round(quality)))
+
+
+def can_skip_reencode(img, output_format, quality=None, max_size=None):
+    """Return True if the source file already is what the job would produce."""
+    target = pil_format(output_format)
+    if img.format != target or getattr(img, "is_animated", False):
+        return False
+    if max_size and max(img.size) > max_size:
+        return False
+    if quality is None:
+        return True
+    if target == "JPEG":
+        current = estimate_jpeg_quality(img)
+        # Re-encoding at a higher quality only makes the file bigger
+        return current is not None and current <= quality
+    return False
+
+
+def draft_for_size(img, max_size=None):
+    """Configure reduced-size JPEG decoding before the image data is loaded."""
+    if max_size and img.format == "JPEG" and max(img.size) > max_size:
+        scale = max_size / max(img.size)
+        img.draft(img.mode, (max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+    return img
+
+
+def fit(img, max_size=None):
+    """Shrink an image in place so its longest side is at most ``max_size``."""
+    from PIL import Image
+
+    if max_size and max(img.size) > max_size:
+        img.thumbnail((max_size, max_size), Image.LANCZOS, reducing_gap=2.0)
+    return img
+
+
+def prepare_mode(img, output_format):
+    """Convert an image to a mode the target format can store, keeping alpha where supported."""
+    from PIL import Image
+
+    target = pil_format(output_format)
+    modes = FORMAT_MODES.get(target)
+    if modes is None or img.mode in modes:
+        return img
+    if has_alpha(img):
+        if "RGBA" in modes:
+            return img.convert("RGBA")
+        if target == "GIF":
+            return img.convert("RGBA").convert("P", palette=Image.ADAPTIVE)
+        # Flatten onto white instead of exposing whatever is under transparent pixels
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    if target == "GIF":
+        return img.convert("P", palette=Image.ADAPTIVE)
+    if img.mode in ("I;16", "I", "F") and "L" in modes:
+        return img.convert("L")
+    return img.convert("RGB")
+
+
+def save_kwargs(img, output_format, quality=None):
+    """Return Pillow save() arguments for a target format."""
+    target = pil_format(output_format)
+    kwargs = {"format": target}
+    if target in QUALITY_FORMATS and quality is not None:
+        kwargs["quality"] = quality
+    if target in ("JPEG", "PNG"):
+        kwargs["optimize"] = True
+    if target == "WEBP":
+        kwargs["method"] = 4
+    for key in ("icc_profile", "exif"):
+        if img.info.get(key) and target in ("JPEG", "PNG", "WEBP", "TIFF"):
+            kwargs[key] = img.info[key]
+    return kwargs
+
+
+def frame_durations(img):
+    """Return the duration of every frame in ms.
+
+    Seeking a GIF or APNG decodes each frame it passes (WebP only reads the
+    frame headers), so this is a full decode pass; save_animated() skips it
+    for targets without frame timing.
+    """
+    durations = []
+    for index in range(img.n_frames):
+        img.seek(index)
+        durations.append(img.info.get("duration", 100))
+    img.seek(0)
+    return durations
+
+
+def iter_frames(img, output_format, max_size=None):
+    """Yield the frames of a multi-frame image one by one, resized and converted for the target."""
+    from PIL import ImageSequence
+
+    for frame in ImageSequence.Iterator(img):
+        # Copy so the next seek on the source does not change this frame
+        frame = fit(frame.copy(), max_size)
+        yield prepare_mode(frame, output_format)
+
+
+def save_animated(img, output_path, output_format, quality=None, max_size=None):
+    """Save every frame of ``img`` to an animated/multi-page target.
+
+    Without resizing, the source itself is handed to Pillow with
+    ``save_all``, so the WebP and TIFF encoders seek and encode it frame by
+    frame and at most one decoded frame is alive. When frames have to be
+    shrunk, iter_frames() produces them lazily. Pillow's GIF and APNG writers
+    keep the (delta-cropped) frames until the file is finished.
+    """
+    kwargs = save_kwargs(img, output_format, quality)
+    kwargs["save_all"] = True
+    if pil_format(output_format) != "TIFF":
+        kwargs["duration"] = frame_durations(img)
+    if "loop" in img.info:
+        kwargs["loop"] = img.info["loop"]
+    if pil_format(output_format) == "GIF" and "transparency" in img.info:
+        kwargs["disposal"] = 2
+    if not max_size or max(img.size) <= max_size:
+        img.save(output_path, **kwargs)
+        return
+    frames = iter_frames(img, output_format, max_size)
+    next(frames).save(output_path, append_images=frames, **kwargs)
+
+
+def copy_source(input_path, output_path):
+    """Copy the source bytes unchanged; either side may be a seekable binary file object."""
+    if isinstance(input_path, str) and isinstance(output_path, str):
+        shutil.copyfile(input_path, output_path)
+        return
+    source = open(input_path, "rb") if isinstance(input_path, str) else input_path
+    target = open(output_path, "wb") if isinstance(output_path, str) else output_path
+    try:
+        source.seek(0)
+        shutil.copyfileobj(source, target)
+    finally:
+        if source is not input_path:
+            source.close()
+        if target is not output_path:
+            target.close()
+
+
+def process_image(input_path, output_path, output_format, quality=None, max_size=None, on_stage=None):
+    """Run one image through the pipeline; return "copied" or "encoded".
+
+    ``input_path`` and ``output_path`` may also be binary file objects (the
+    input seekable). ``on_stage(percent, stage)`` is called between pipeline
+    stages so callers can report progress and check for cancellation.
+    """
+    from PIL import Image
+
+    with Image.open(input_path) as img:
+        if can_skip_reencode(img, output_format, quality, max_size):
+            copy_source(input_path, output_path)
+            return "copied"
+        if is_animated(img) and pil_format(output_format) in ANIMATED_FORMATS:
+            if on_stage:
+                on_stage(10.0, "encode")
+            save_animated(img, output_path, output_format, quality, max_size)
+            return "encoded"
+        draft_for_size(img, max_size)
+        img.load()
+        if on_stage:
+            on_stage(33.0, "resize")
+        fit(img, max_size)
+        out = prepare_mode(img, output_format)
+        if on_stage:
+            on_stage(66.0, "encode")
+        out.save(output_path, **save_kwargs(img, output_format, quality))
+    return "encoded"
+
+
+def process_image_variants(input_path, variants, quality=None, on_stage=None):
+    """Decode an image once and save every variant from the decoded copy.
+
+    ``variants`` is a list of (output_path, output_format, max_size) tuples.
+    Returns "copied" or "encoded" per variant. When every variant is
+    downscaled, JPEGs are drafted for the largest of them.
+    """
+    from PIL import Image
+
+    written = []
+    try:
+        with Image.open(input_path) as img:
+            results = ["copied" if can_skip_reencode(img, output_format, quality, max_size) else "encoded"
+                       for _, output_format, max_size in variants]
+            encoded = [variant for variant, result in zip(variants, results) if result == "encoded"]
+            sizes = [max_size for _, _, max_size in encoded]
+            if encoded:
+                if all(sizes):
+                    draft_for_size(img, max(sizes))
+                img.load()
+            for index, ((output_path, output_format, max_size), result) in enumerate(zip(variants, results)):
+                if on_stage:
+                    on_stage(10.0 + 90.0 * index / len(variants), "encode")
+                written.append(output_path)
+                if result == "copied":
+                    shutil.copyfile(input_path, output_path)
+                    continue
+                if is_animated(img) and pil_format(output_format) in ANIMATED_FORMATS:
+                    save_animated(img, output_path, output_format, quality, max_size)
+                    img.seek(0)
+                    continue
+                out = img
+                if max_size and max(img.size) > max_size:
+                    # thumbnail() works in place, so resize a copy and keep the decoded original
+                    out = fit(img.copy(), max_size)
+                out = prepare_mode(out, output_format)
+                out.save(output_path, **save_kwargs(img, output_format, quality))
+    except BaseException:
+        for output_path in written:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        raise
+    return results
+
+
+def output_image_format(output_path):
+    """Return the image format implied by a file's extension."""
+    return os.path.splitext(output_path)[1][1:].lower()
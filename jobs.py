@@ -0,0 +1,143 @@
+"""Background conversion/compression jobs with progress events and cancellation.
+
+A Job runs convert_file, compress_file or convert_many on its own thread and
+publishes event dicts to every subscriber:
+
+    {"job": <id>, "type": "progress", "stage": ..., "percent": ..., "fps": ...,
+     "eta": ..., "bytes_written": ...}
+    {"job": <id>, "type": "done" | "failed" | "cancelled", "output": ..., "report": ..., "error": ...}
+
+A "multi" job takes convert_many's targets as ``output_format`` and an
+output directory (or None, for next to the input) as ``output_path``; its
+"done" event carries the list of outputs.
+
+start() runs the job right away; scheduler.Scheduler.submit_job() queues it
+until its estimated cost fits the machine's budgets.
+
+Subscribers are called on the worker thread. The GUI forwards events into a
+queue.Queue and polls it with ``after()``; headless callers can subscribe
+directly or just ``wait()``.
+"""
+
+import itertools
+import os
+import threading
+import time
+
+from converter import compress_file, convert_file, convert_many
+from documents import page_count, page_paths
+from transcode import JobCancelled
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+    """A single convert or compress job running off the calling thread."""
+
+    def __init__(self, mode, input_path, output_path, category, output_format=None, quality=75, **options):
+        if mode not in ("convert", "compress", "multi"):
+            raise ValueError(f"Unknown job mode: {mode}")
+        self.id = next(_job_ids)
+        self.mode = mode
+        self.input_path = input_path
+        self.output_path = output_path
+        self.category = category
+        self.output_format = output_format
+        self.quality = quality
+        self.options = options
+        self.status = "pending"
+        self.error = None
+        self.report = None
+        self.last_event = None
+        self.queued_at = time.time()
+        self._subscribers = []
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """Register a callable that receives every event of this job."""
+        self._subscribers.append(callback)
+        return callback
+
+    def start(self):
+        """Start the job on a daemon thread and return self."""
+        self._thread = threading.Thread(target=self.run, name=f"job-{self.id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Ask the job to stop; partial output is removed once it has."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; return True if it did within ``timeout``."""
+        return self._done.wait(timeout)
+
+    def _emit(self, event):
+        event = dict(event, job=self.id)
+        event.setdefault("type", "progress")
+        self.last_event = event
+        for callback in list(self._subscribers):
+            callback(event)
+
+    def run(self):
+        """Run the job on the current thread."""
+        if self.cancelled:
+            # Cancelled while it was still queued (e.g. in a scheduler); nothing to clean up
+            self.status = "cancelled"
+            self._emit({"type": "cancelled"})
+            self._done.set()
+            return
+        self.status = "running"
+        try:
+            if self.mode == "convert":
+                self.report = convert_file(self.input_path, self.output_path, self.category, self.output_format,
+                                           progress=self._emit, cancel=self._cancel, queued_at=self.queued_at,
+                                           **self.options)
+            elif self.mode == "multi":
+                self.report = convert_many(self.input_path, self.output_format, self.category, progress=self._emit,
+                                           cancel=self._cancel, output_dir=self.output_path,
+                                           queued_at=self.queued_at, **self.options)
+            else:
+                self.report = compress_file(self.input_path, self.output_path, self.category, self.quality,
+                                            progress=self._emit, cancel=self._cancel, queued_at=self.queued_at,
+                                            **self.options)
+            self.status = "done"
+            output = self.report if self.mode == "multi" else self.output_path
+            self._emit({"type": "done", "output": output, "percent": 100.0, "report": self.report})
+        except JobCancelled:
+            self._remove_partial_output()
+            self.status = "cancelled"
+            self._emit({"type": "cancelled"})
+        except Exception as e:
+            self._remove_partial_output()
+            self.status = "failed"
+            self.error = str(e)
+            self._emit({"type": "failed", "error": self.error})
+        finally:
+            self._done.set()
+
+    def _remove_partial_output(self):
+        for path in self._output_paths():
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _output_paths(self):
+        if self.mode == "multi":
+            # convert_many removes its own outputs on failure
+            return []
+        if self.mode == "convert" and self.category == "document":
+            # Multi-page PDFs are written as numbered page files next to output_path
+            try:
+                return page_paths(self.output_path, page_count(self.input_path))
+            except Exception:
+                pass
+        return [self.output_path]
@@ -1,14 +1,25 @@
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image
-from pydub import AudioSegment
-from moviepy.editor import VideoFileClip
+import multiprocessing
 import os
-import threading
-import yt_dlp as ytdlp
-import re
+import queue
 import sys
+import threading
+
+from converter import (
+    CONVERSION_TARGETS,
+    clean_path,
+    compressed_output_path,
+    converted_output_path,
+    describe_report,
+    parse_targets,
+)
+from jobs import Job
+from probe import detect_category
+from scheduler import default_scheduler
+from target_size import parse_size
+from youtube import DownloadQueue
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
@@ -16,91 +27,21 @@ ctk.set_default_color_theme("blue")
 DARK_GRAY = "#2b2b2b"
 TEXT_COLOR = "#ffffff"
 
-# Supported formats for conversion by category
-SUPPORTED_FORMATS = {
-    "image": ["png", "jpeg", "jpg", "bmp", "gif", "tiff", "webp", "heif", "ico"],
-    "audio": ["mp3", "wav", "ogg", "flac", "aac", "m4a", "opus"],
-    "video": ["mp4", "avi", "mov", "webm", "flv", "mkv", "wmv"],
-    "document": ["docx", "pdf"]
-}
-
-def clean_path(path):
-    """Clean the file path by removing curly braces and handling spaces."""
-    return path.strip('{}').strip('"').strip("'")
-
-def detect_file_category(file_extension):
-    """Return the category of the file based on its extension."""
-    file_extension = file_extension.lower()
-    for category, extensions in SUPPORTED_FORMATS.items():
-        if file_extension in extensions:
-            return category
-    return None
-
-def compress_image(input_path, output_path, quality):
-    """Compress image files with the specified quality."""
-    try:
-        with Image.open(input_path) as img:
-            img.save(output_path, quality=quality, optimize=True)
-    except Exception as e:
-        raise ValueError(f"Error compressing image: {str(e)}")
-
-def compress_video(input_path, output_path, quality):
-    """Compress video files by adjusting the bitrate."""
-    try:
-        clip = VideoFileClip(input_path)
-        clip.write_videofile(output_path, codec="h264_nvenc", bitrate=f"{quality}k")
-    except Exception as e:
-        raise ValueError(f"Error compressing video: {str(e)}")
-
-def compress_file(input_path, output_path, category, quality):
-    """Compress the file based on category (image/video)."""
-    try:
-        if category == "image":
-            compress_image(input_path, output_path, quality)
-        elif category == "video":
-            compress_video(input_path, output_path, quality)
-        else:
-            raise ValueError("Unsupported compression category.")
-    except Exception as e:
-        raise ValueError(f"Error during compression: {str(e)}")
-
-def convert_image(input_path, output_path, output_format):
-    """Convert image files to the specified format."""
-    try:
-        with Image.open(input_path) as img:
-            img.convert("RGB").save(output_path, format=output_format.upper())
-    except Exception as e:
-        raise ValueError(f"Error converting image: {str(e)}")
-
-def convert_audio(input_path, output_path, output_format):
-    """Convert audio files to the specified format."""
-    try:
-        audio = AudioSegment.from_file(input_path)
-        audio.export(output_path, format=output_format)
-    except Exception as e:
-        raise ValueError(f"Error converting audio: {str(e)}")
-
-def convert_video(input_path, output_path, output_format):
-    """Convert video files to the specified format."""
-    try:
-        clip = VideoFileClip(input_path)
-        clip.write_videofile(output_path, codec="h264_nvenc")
-    except Exception as e:
-        raise ValueError(f"Error converting video: {str(e)}")
-
-def convert_file(input_path, output_path, category, output_format):
-    """Convert the file based on category (image/audio/video)."""
-    try:
-        if category == "image":
-            convert_image(input_path, output_path, output_format)
-        elif category == "audio":
-            convert_audio(input_path, output_path, output_format)
-        elif category == "video":
-            convert_video(input_path, output_path, output_format)
-        else:
-            raise ValueError("Unsupported conversion category.")
-    except Exception as e:
-        raise ValueError(f"Error during conversion: {str(e)}")
+
+def format_progress(event):
+    """Return a short status line ("42% - 120 fps - ETA 0:12") for a progress event."""
+    parts = []
+    if event.get("percent") is not None:
+        parts.append(f"{event['percent']:.0f}%")
+    if event.get("fps"):
+        parts.append(f"{event['fps']:.0f} fps")
+    if event.get("eta") is not None:
+        minutes, seconds = divmod(int(event["eta"]), 60)
+        parts.append(f"ETA {minutes}:{seconds:02d}")
+    if event.get("bytes_written"):
+        parts.append(f"{event['bytes_written'] / 1_000_000:.1f} MB")
+    return " - ".join(parts) or event.get("stage", "")
+
 
 class FileConverterApp(tk.Tk):
     def __init__(self):
@@ -122,6 +63,9 @@ class FileConverterApp(tk.Tk):
         except Exception as e:
             print(f"Error setting icon: {e}")
         
+        self.active_jobs = {}
+        self.download_queue = None
+
         self.configure(bg=DARK_GRAY)
         self.main_frame = ctk.CTkFrame(self, fg_color=DARK_GRAY)
         self.main_frame.pack(fill="both", expand=True)
@@ -162,7 +106,7 @@ class FileConverterApp(tk.Tk):
             width=400,
             fg_color=DARK_GRAY,
             text_color=TEXT_COLOR,
-            placeholder_text="Enter YouTube URL"
+            placeholder_text="Enter YouTube URLs or playlists (space separated)"
         )
         self.url_entry.pack(pady=10)
 
@@ -175,6 +119,16 @@ class FileConverterApp(tk.Tk):
         )
         self.download_button.pack(pady=10)
 
+        self.parallel_downloads = ctk.CTkOptionMenu(
+            self.tab_toolbox,
+            values=["1", "2", "3", "4", "6", "8"],
+            command=self.update_parallel_downloads,
+            fg_color="#3b3b3b",
+            button_color="#4b4b4b"
+        )
+        self.parallel_downloads.set("3")
+        self.parallel_downloads.pack(pady=5)
+
         self.progress_bar_toolbox = ctk.CTkProgressBar(
             self.tab_toolbox,
             width=400,
@@ -183,6 +137,17 @@ class FileConverterApp(tk.Tk):
             progress_color="#4b4b4b"
         )
         self.progress_bar_toolbox.pack(pady=10)
+        self.progress_bar_toolbox.set(0)
+
+        self.download_status = ctk.CTkTextbox(
+            self.tab_toolbox,
+            width=400,
+            height=100,
+            fg_color=DARK_GRAY,
+            text_color=TEXT_COLOR,
+            state="disabled"
+        )
+        self.download_status.pack(pady=5)
 
         self.format_tabs = ctk.CTkTabview(self.tab_toolbox)
         self.format_tabs.pack(pady=10)
@@ -236,6 +201,24 @@ class FileConverterApp(tk.Tk):
         )
         self.format_menu_conversion.pack(pady=5)
 
+        self.max_size_entry_conversion = ctk.CTkEntry(
+            self.tab_conversion,
+            width=200,
+            fg_color=DARK_GRAY,
+            text_color=TEXT_COLOR,
+            placeholder_text="Max image size in px (optional)"
+        )
+        self.max_size_entry_conversion.pack(pady=5)
+
+        self.extra_formats_entry_conversion = ctk.CTkEntry(
+            self.tab_conversion,
+            width=300,
+            fg_color=DARK_GRAY,
+            text_color=TEXT_COLOR,
+            placeholder_text="Also convert to, in one pass (e.g. webm, jpg:320)"
+        )
+        self.extra_formats_entry_conversion.pack(pady=5)
+
         self.convert_button = ctk.CTkButton(
             self.tab_conversion,
             text="Convert",
@@ -252,9 +235,22 @@ class FileConverterApp(tk.Tk):
             fg_color="#3b3b3b",
             progress_color="#4b4b4b"
         )
-        self.progress_bar_conversion.pack(pady=20)
+        self.progress_bar_conversion.pack(pady=(20, 5))
         self.progress_bar_conversion.set(0)
 
+        self.status_label_conversion = ctk.CTkLabel(self.tab_conversion, text="", text_color=TEXT_COLOR)
+        self.status_label_conversion.pack(pady=5)
+
+        self.cancel_button_conversion = ctk.CTkButton(
+            self.tab_conversion,
+            text="Cancel",
+            command=lambda: self.cancel_job("conversion"),
+            state="disabled",
+            fg_color="#3b3b3b",
+            hover_color="#4b4b4b"
+        )
+        self.cancel_button_conversion.pack(pady=5)
+
     def create_compression_tab(self):
         """Create the UI for the compression tab."""
         self.label_compression = ctk.CTkLabel(
@@ -299,6 +295,24 @@ class FileConverterApp(tk.Tk):
         self.quality_slider.set(75)  # Default quality
         self.quality_slider.pack(pady=10)
 
+        self.max_size_entry_compression = ctk.CTkEntry(
+            self.tab_compression,
+            width=200,
+            fg_color=DARK_GRAY,
+            text_color=TEXT_COLOR,
+            placeholder_text="Max image size in px (optional)"
+        )
+        self.max_size_entry_compression.pack(pady=5)
+
+        self.target_size_entry = ctk.CTkEntry(
+            self.tab_compression,
+            width=200,
+            fg_color=DARK_GRAY,
+            text_color=TEXT_COLOR,
+            placeholder_text="Target size in MB (optional)"
+        )
+        self.target_size_entry.pack(pady=5)
+
         self.compress_button = ctk.CTkButton(
             self.tab_compression,
             text="Compress",
@@ -315,9 +329,22 @@ class FileConverterApp(tk.Tk):
         fg_color="#3b3b3b",
         progress_color="blue"
         )
-        self.progress_bar_compression.pack(pady=20)
+        self.progress_bar_compression.pack(pady=(20, 5))
         self.progress_bar_compression.set(0)
 
+        self.status_label_compression = ctk.CTkLabel(self.tab_compression, text="", text_color=TEXT_COLOR)
+        self.status_label_compression.pack(pady=5)
+
+        self.cancel_button_compression = ctk.CTkButton(
+            self.tab_compression,
+            text="Cancel",
+            command=lambda: self.cancel_job("compression"),
+            state="disabled",
+            fg_color="#3b3b3b",
+            hover_color="#4b4b4b"
+        )
+        self.cancel_button_compression.pack(pady=5)
+
 
     def browse_file_conversion(self):
         """Open file dialog to select a file for conversion."""
@@ -338,12 +365,11 @@ class FileConverterApp(tk.Tk):
     def update_format_options(self, file_path, tab):
         """Update format options based on the file selected."""
         try:
-            file_extension = os.path.splitext(file_path)[1][1:].lower()
-            category = detect_file_category(file_extension)
+            category = detect_category(clean_path(file_path))
 
             if category:
                 if tab == "conversion":
-                    formats = SUPPORTED_FORMATS[category]
+                    formats = CONVERSION_TARGETS[category]
                     self.format_menu_conversion.configure(values=formats)
                 elif tab == "compression":
                     self.category_compression = category
@@ -352,47 +378,6 @@ class FileConverterApp(tk.Tk):
         except Exception as e:
             messagebox.showerror("Error", f"Error updating format options: {e}")
             
-    def convert_to_mp4(self, input_file):
-        """Convert downloaded WEBM file to MP4 using moviepy."""
-        output_file = input_file.replace('.webm', '.mp4')
-        
-        try:
-            clip = VideoFileClip(input_file)
-            clip.write_videofile(output_file, codec="h264_nvenc")  # Save as MP4 with H.264 codec
-            clip.close()
-            print(f"Converted to MP4: {output_file}")
-            self.progress_bar_toolbox.set(0.5)
-        except Exception as e:
-            print(f"Error converting to MP4: {e}")
-
-    def convert_to_mp3(self, file_path, output_dir):
-        """Convert downloaded video to MP3 format."""
-        mp3_path = os.path.join(output_dir, os.path.splitext(os.path.basename(file_path))[0] + ".mp3")
-        try:
-            audio = AudioSegment.from_file(file_path)
-            audio.export(mp3_path, format="mp3")
-        except Exception as e:
-            messagebox.showerror("Conversion Error", f"Error converting to MP3: {str(e)}")
-
-    def update_progress(self, status):
-        # Clean the string of escape sequences
-        progress_str = status["_percent_str"].strip("%")
-        progress_str_clean = re.sub(r'\x1b\[[0-9;]*m', '', progress_str)  # Remove ANSI escape sequences
-
-        # Add a check for empty or invalid progress string
-        if not progress_str_clean:
-            print("Empty or invalid progress string")
-            return
-
-        try:
-            progress = float(progress_str_clean)
-            progress_percentage = progress / 100
-            print(f"Progress: {progress_percentage * 100}%")
-        except ValueError:
-            # Handle cases where conversion fails
-            print(f"Error parsing progress value: {progress_str_clean}")
-
-
     def convert(self):
         """Handle file conversion."""
         filepath = self.file_entry_conversion.get()
@@ -405,13 +390,25 @@ class FileConverterApp(tk.Tk):
             messagebox.showerror("Error", "Please select a valid output format.")
             return
         
+        output_path = converted_output_path(filepath, output_format)
+        category = detect_category(filepath)
+        max_size = self.get_max_size("conversion")
+        if max_size is False:
+            return
         try:
-            output_path = os.path.splitext(filepath)[0] + f"_converted.{output_format.lower()}"
-            category = detect_file_category(os.path.splitext(filepath)[1][1:])
-            convert_file(filepath, output_path, category, output_format)
-            messagebox.showinfo("Success", f"File converted to {output_format}!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error during conversion: {e}")
+            extra_targets = parse_targets(self.extra_formats_entry_conversion.get())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        if extra_targets:
+            # One decode feeds every output
+            targets = [{"format": output_format, "max_size": max_size}] + extra_targets
+            job = Job("multi", filepath, None, category, output_format=targets)
+            formats = ", ".join(target["format"] for target in targets)
+            self.start_job(job, "conversion", f"File converted to {formats}!")
+            return
+        job = Job("convert", filepath, output_path, category, output_format=output_format, max_size=max_size)
+        self.start_job(job, "conversion", f"File converted to {output_format}!")
 
     def compress(self):
         """Handle file compression."""
@@ -421,23 +418,82 @@ class FileConverterApp(tk.Tk):
             return
 
         quality = int(self.quality_slider.get())
-        output_path = os.path.splitext(filepath)[0] + "_compressed" + os.path.splitext(filepath)[1]
+        output_path = compressed_output_path(filepath)
         category = self.category_compression
 
-        try:
-            self.progress_bar_compression.set(0)
-            threading.Thread(target=self._compress_file, args=(filepath, output_path, category, quality)).start()
-        except Exception as e:
-            messagebox.showerror("Error", f"Error during compression: {e}")
+        max_size = self.get_max_size("compression")
+        if max_size is False:
+            return
+        target_size = None
+        if self.target_size_entry.get().strip():
+            try:
+                target_size = parse_size(self.target_size_entry.get().strip() + "MB")
+            except ValueError:
+                messagebox.showerror("Error", "Target size must be a number of megabytes.")
+                return
+        job = Job("compress", filepath, output_path, category, quality=quality, max_size=max_size,
+                  target_size=target_size)
+        self.start_job(job, "compression", f"File compressed successfully: {output_path}")
+
+    def get_max_size(self, tab):
+        """Return the max image size entered on a tab, None if empty, or False if invalid."""
+        value = getattr(self, f"max_size_entry_{tab}").get().strip()
+        if not value:
+            return None
+        if not value.isdigit() or int(value) == 0:
+            messagebox.showerror("Error", "Max image size must be a positive number of pixels.")
+            return False
+        return int(value)
+
+    def start_job(self, job, tab, success_message):
+        """Run a job off the UI thread and follow its progress events from the Tk main loop."""
+        events = queue.Queue()
+        job.subscribe(events.put)
+        self.active_jobs[tab] = job
+        getattr(self, f"progress_bar_{tab}").set(0)
+        getattr(self, f"status_label_{tab}").configure(text="Starting...")
+        getattr(self, f"cancel_button_{tab}").configure(state="normal")
+        # Estimating the job's cost may run ffprobe, so it is queued from a worker thread
+        threading.Thread(target=default_scheduler().submit_job, args=(job,), daemon=True).start()
+        self.after(100, self.poll_job_events, events, tab, success_message)
+
+    def poll_job_events(self, events, tab, success_message):
+        """Apply queued job events to the UI; runs on the Tk main thread via after()."""
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event["type"] == "progress":
+                if event["percent"] is not None:
+                    getattr(self, f"progress_bar_{tab}").set(event["percent"] / 100)
+                getattr(self, f"status_label_{tab}").configure(text=format_progress(event))
+                continue
+
+            self.active_jobs.pop(tab, None)
+            getattr(self, f"cancel_button_{tab}").configure(state="disabled")
+            getattr(self, f"status_label_{tab}").configure(text="")
+            if event["type"] == "done":
+                getattr(self, f"progress_bar_{tab}").set(1)
+                report = event.get("report")
+                if isinstance(report, dict):
+                    success_message += f"\n{describe_report(report)}."
+                messagebox.showinfo("Success", success_message)
+            else:
+                getattr(self, f"progress_bar_{tab}").set(0)
+                if event["type"] == "failed":
+                    messagebox.showerror("Error", f"Error during {tab}: {event['error']}")
+            return
 
-    def _compress_file(self, filepath, output_path, category, quality):
-        """Handle compression in a separate thread."""
-        try:
-            compress_file(filepath, output_path, category, quality)
-            self.progress_bar_compression.set(1)
-            messagebox.showinfo("Success", f"File compressed successfully: {output_path}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error during compression: {e}")
+        self.after(100, self.poll_job_events, events, tab, success_message)
+
+    def cancel_job(self, tab):
+        """Cancel the running job of a tab."""
+        job = self.active_jobs.get(tab)
+        if job:
+            job.cancel()
+            getattr(self, f"status_label_{tab}").configure(text="Cancelling...")
 
     def update_quality_label(self, value):
         """Update quality label with the selected value."""
@@ -451,89 +507,39 @@ class FileConverterApp(tk.Tk):
             self.file_entry_conversion.insert(0, clean_path(file_path))
             self.update_format_options(file_path, "conversion")
 
-    def run_download(self, url):
-        """Run the download process in a separate thread to keep the GUI responsive."""
-        download_path = self.get_download_path()
-        if not download_path:
-            messagebox.showerror("Error", "Unable to determine the download path.")
-            return
-
-        ydl_opts = {
-            'format': 'bestvideo+bestaudio/best',
-            'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
-            'progress_hooks': [self.update_progress],
-            'postprocessors': [{
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': 'mp4',
-            }],
-            'merge_output_format': 'mp4',  # Ensure merging to MP4 format
-            'postprocessor_args': [
-                '-c:v', 'h264_nvenc',  # hardware accelerated h264_nvenc (NVIDIA GPU)
-                '-b:v', '5M',
-                '-c:a', 'aac',
-                '-b:a', '192k' # Audio bitrate
-            ]
-        }
-
-        try:
-            with ytdlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            messagebox.showinfo("Success", "Video downloaded and processed successfully!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Download failed: {str(e)}")
-
     def download_video(self):
-        """Download YouTube video in selected format (WEBM, MP3, or MP4 with NVENC GPU acceleration)."""
-        url = self.url_entry.get()
+        """Queue every URL in the entry (videos or playlists) for download in the selected format."""
+        urls = self.url_entry.get().split()
+        if not urls:
+            messagebox.showerror("Error", "Please enter at least one URL.")
+            return
         download_format = self.format_tabs.get()  # Retrieve selected format
 
-        def download_thread():
-            output_dir = filedialog.askdirectory(title="Select Download Folder")
+        if self.download_queue is None:
+            output_dir = filedialog.askdirectory(title="Select Download Folder", initialdir=self.get_download_path())
             if not output_dir:
                 return
+            self.download_queue = DownloadQueue(output_dir, max_concurrent=int(self.parallel_downloads.get()),
+                                                scheduler=default_scheduler())
+            self.poll_downloads()
+        self.download_queue.add_many(urls, download_format)
+        self.url_entry.delete(0, tk.END)
+
+    def update_parallel_downloads(self, value):
+        """Apply the parallel downloads setting to the running queue."""
+        if self.download_queue is not None:
+            self.download_queue.set_max_concurrent(value)
+
+    def poll_downloads(self):
+        """Refresh the per-item status list and the overall progress bar."""
+        items = self.download_queue.snapshot()
+        self.download_status.configure(state="normal")
+        self.download_status.delete("1.0", tk.END)
+        self.download_status.insert(tk.END, "\n".join(item.describe() for item in items))
+        self.download_status.configure(state="disabled")
+        self.progress_bar_toolbox.set(self.download_queue.overall_progress())
+        self.after(500, self.poll_downloads)
 
-            options = {
-                "outtmpl": os.path.join(output_dir, "%(title)s" + ".%(ext)s"),
-                "format": "bestvideo+bestaudio/best" if download_format == "MP4" else "bestaudio" if download_format != "WEBM" else "bestaudio+bestaudio[ext=webm]+bestvideo[ext=webm]",
-                "progress_hooks": [self.update_progress],
-            }
-            with ytdlp.YoutubeDL(options) as ydl:
-                info = ydl.extract_info(url, download=True)
-                file_path = ydl.prepare_filename(info)
-
-                if download_format == "MP3":  # Convert to MP3 if selected
-                    self.convert_to_mp3(file_path, output_dir)
-                elif download_format == "MP4":  # Convert to MP4 with NVENC
-                    self.convert_to_mp4_with_nvenc(file_path, output_dir)
-
-            self.progress_bar_toolbox.set(0)
-
-        threading.Thread(target=download_thread).start()
-
-    def convert_to_mp4_with_nvenc(self, file_path, output_dir):
-        """Convert downloaded video to MP4 using NVENC (GPU acceleration)."""
-        try:
-            # Get the base file name without extension
-            base_filename = os.path.splitext(os.path.basename(file_path))[0]
-            output_file = os.path.join(output_dir, base_filename + "_gpu.mp4")
-            
-            # Ensure the file path is properly quoted
-            file_path = f'"{file_path}"'
-            output_file = f'"{output_file}"'
-
-            ffmpeg_command = [
-                'ffmpeg', '-i', file_path, 
-                '-c:v', 'h264_nvenc',
-                '-preset', 'fast',  # Use a fast encoding preset
-                output_file
-            ]
-            
-            os.system(' '.join(ffmpeg_command))
-            
-            messagebox.showinfo("Success", "MP4 Conversion completed with GPU acceleration.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Conversion failed: {str(e)}")
-            
     def update_download_format(self):
         """Update the download format based on the selected tab."""
         selected_tab = self.format_tabs.get()
@@ -547,21 +553,8 @@ class FileConverterApp(tk.Tk):
             return os.path.join(os.environ['HOME'], 'Downloads')
         return ''
 
-    def ytdlp_progress_hook(self, d):
-        """Progress hook for yt-dlp."""
-        if d["status"] == "downloading":
-            percent = d.get("percent", 0)
-            self.progress_bar_toolbox.set(percent / 100)
-        elif d["status"] == "finished":
-            self.progress_bar_toolbox.set(1)
-            messagebox.showinfo("Download Complete", "Download complete!")
-
-    def progress_hook(self, d):
-        """Progress hook to update download progress."""
-        if d['status'] == 'downloading':
-            progress = d.get('downloaded_bytes', 0) / d.get('total_bytes', 1)
-            self.progress_bar_toolbox.set(progress)
-
 if __name__ == "__main__":
+    # PDF pages are rendered in worker processes, which need this in frozen builds
+    multiprocessing.freeze_support()
     app = FileConverterApp()
     app.mainloop()
@@ -0,0 +1,335 @@
+"""Per-stage timing and resource instrumentation.
+
+Disabled unless ``CONVERT_PY_METRICS=1`` is set or enable() is called, and
+then every entry point returns immediately (``job()`` hands back a shared
+no-op context), so uninstrumented runs pay nothing.
+
+When enabled, every job records:
+
+* the time spent in each pipeline stage (probe, decode, resize, encode,
+  download, postprocess, ...), taken from the stage names in its progress
+  events;
+* bytes read and written, the encoder's frames per second and the time the
+  job waited in a queue;
+* its overall duration and outcome.
+
+Each finished job is written as one JSON line to ``CONVERT_PY_METRICS_LOG``
+(stderr if unset) and folded into process-wide totals that render as
+Prometheus text (write_prometheus(), or ``GET /metrics`` on the service).
+
+``CONVERT_PY_PROFILE=<dir>`` (or ``profile=<path>`` on a single job)
+captures a profile of the job: pyinstrument HTML when
+``CONVERT_PY_PROFILER=pyinstrument`` and it is installed, otherwise a
+cProfile ``.prof`` file. Profilers hook the whole interpreter, so only one
+job per process is profiled at a time; jobs overlapping it run unprofiled.
+"""
+
+import collections
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from transcode import JobCancelled
+
+ENV_ENABLED = "CONVERT_PY_METRICS"
+ENV_LOG = "CONVERT_PY_METRICS_LOG"
+ENV_PROFILE = "CONVERT_PY_PROFILE"
+ENV_PROFILER = "CONVERT_PY_PROFILER"
+
+_enabled = os.environ.get(ENV_ENABLED, "") not in ("", "0")
+_lock = threading.Lock()
+_profile_ids = itertools.count(1)
+
+# cProfile and pyinstrument hook the whole interpreter (Python 3.12+ refuses a second
+# active cProfile), so only one job per process is profiled at a time
+_profiling = threading.Lock()
+
+# Process-wide totals: (metric, sorted label items) -> value
+_counters = collections.defaultdict(float)
+_gauges = {}
+
+METRIC_HELP = {
+    "convert_py_stage_seconds_total": ("counter", "Time spent per pipeline stage"),
+    "convert_py_stage_runs_total": ("counter", "Number of times each stage ran"),
+    "convert_py_jobs_total": ("counter", "Finished jobs by mode, category and status"),
+    "convert_py_job_seconds_total": ("counter", "Wall time of finished jobs"),
+    "convert_py_queue_wait_seconds_total": ("counter", "Time jobs waited before starting"),
+    "convert_py_bytes_read_total": ("counter", "Input bytes processed"),
+    "convert_py_bytes_written_total": ("counter", "Output bytes produced"),
+    "convert_py_encoder_fps": ("gauge", "Encoder frames per second of the last job per category"),
+    "convert_py_scheduler_queued": ("gauge", "Jobs waiting for admission per category"),
+    "convert_py_scheduler_running": ("gauge", "Admitted jobs running per category"),
+    "convert_py_scheduler_cpu_utilization": ("gauge", "Share of the scheduler's CPU slots in use"),
+    "convert_py_scheduler_memory_utilization": ("gauge", "Share of the scheduler's memory budget in use"),
+}
+
+
+def enabled():
+    return _enabled
+
+
+def enable(log_path=None, profile_dir=None):
+    """Turn instrumentation on for this process and any worker processes it starts."""
+    global _enabled
+    _enabled = True
+    os.environ[ENV_ENABLED] = "1"
+    if log_path:
+        os.environ[ENV_LOG] = log_path
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        os.environ[ENV_PROFILE] = profile_dir
+
+
+class JobRecord:
+    """Timings of one job; filled in by the progress wrapper and stage() blocks."""
+
+    def __init__(self, kind, labels):
+        self.kind = kind
+        self.labels = labels
+        self.started = time.perf_counter()
+        self.stages = collections.OrderedDict()
+        self.fps = []
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.queue_wait = None
+        self._stage = None
+        self._stage_started = None
+
+    def enter_stage(self, name):
+        """Close the current stage and start ``name`` (no-op if it is already current)."""
+        if name == self._stage:
+            return
+        now = time.perf_counter()
+        if self._stage is not None:
+            self.stages[self._stage] = self.stages.get(self._stage, 0.0) + now - self._stage_started
+        self._stage, self._stage_started = name, now
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        previous = self._stage
+        self.enter_stage(name)
+        try:
+            yield
+        finally:
+            self.enter_stage(previous)
+
+    def add_bytes(self, read=0, written=0):
+        self.bytes_read += read
+        self.bytes_written += written
+
+    def wrap_progress(self, progress):
+        """Return a progress callback that records stages, fps and bytes before forwarding events."""
+        def forward(event):
+            stage = event.get("stage")
+            if stage and stage not in ("done", "cache"):
+                self.enter_stage(stage)
+            if event.get("fps"):
+                self.fps.append(event["fps"])
+            if event.get("bytes_written"):
+                self.bytes_written = max(self.bytes_written, event["bytes_written"])
+            if progress:
+                progress(event)
+        return forward
+
+    def finish(self, status, error=None):
+        self.enter_stage(None)
+        seconds = time.perf_counter() - self.started
+        entry = {"event": self.kind, "time": time.time(), "status": status, "seconds": round(seconds, 4),
+                 "stages": {name: round(value, 4) for name, value in self.stages.items()},
+                 "bytes_read": self.bytes_read, "bytes_written": self.bytes_written,
+                 "fps": round(sum(self.fps) / len(self.fps), 2) if self.fps else None,
+                 "queue_wait": None if self.queue_wait is None else round(self.queue_wait, 4)}
+        entry.update(self.labels)
+        if error:
+            entry["error"] = error
+        _log(entry)
+
+        base = {"kind": self.kind, "category": self.labels.get("category") or "",
+                "mode": self.labels.get("mode") or ""}
+        with _lock:
+            for name, value in self.stages.items():
+                _counters["convert_py_stage_seconds_total", _key(base, stage=name)] += value
+                _counters["convert_py_stage_runs_total", _key(base, stage=name)] += 1
+            _counters["convert_py_jobs_total", _key(base, status=status)] += 1
+            _counters["convert_py_job_seconds_total", _key(base)] += seconds
+            _counters["convert_py_bytes_read_total", _key(base)] += self.bytes_read
+            _counters["convert_py_bytes_written_total", _key(base)] += self.bytes_written
+            if self.queue_wait is not None:
+                _counters["convert_py_queue_wait_seconds_total", _key(base)] += self.queue_wait
+            if self.fps:
+                _gauges["convert_py_encoder_fps", _key(base)] = entry["fps"]
+
+
+class _NullRecord:
+    """Stand-in used while instrumentation is disabled."""
+
+    def stage(self, name):
+        return _NULL_CONTEXT
+
+    def enter_stage(self, name):
+        pass
+
+    def add_bytes(self, read=0, written=0):
+        pass
+
+    def wrap_progress(self, progress):
+        return progress
+
+
+_NULL_RECORD = _NullRecord()
+_NULL_CONTEXT = contextlib.nullcontext(_NULL_RECORD)
+
+
+def _key(labels, **extra):
+    return tuple(sorted(dict(labels, **extra).items()))
+
+
+def _log(entry):
+    line = json.dumps(entry, default=str)
+    path = os.environ.get(ENV_LOG)
+    if path:
+        # One short append per job; O_APPEND keeps lines intact across worker processes
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    else:
+        print(line, file=sys.stderr, flush=True)
+
+
+def job(kind, input_path=None, output_path=None, queued_at=None, profile=None, **labels):
+    """Context manager that instruments one job and yields its record.
+
+    ``queued_at`` is the time.time() at which the job was queued. ``profile``
+    is a path to write a profile of this job to (a directory when it comes
+    from ``CONVERT_PY_PROFILE``).
+    """
+    profile = profile or os.environ.get(ENV_PROFILE)
+    if not _enabled and not profile:
+        return _NULL_CONTEXT
+    return _instrumented_job(kind, input_path, output_path, queued_at, profile, labels)
+
+
+@contextlib.contextmanager
+def _instrumented_job(kind, input_path, output_path, queued_at, profile, labels):
+    record = JobRecord(kind, dict(labels, input=input_path, output=output_path))
+    if queued_at is not None:
+        record.queue_wait = max(0.0, time.time() - queued_at)
+    if input_path and os.path.isfile(input_path):
+        record.bytes_read = os.path.getsize(input_path)
+    profiler = _start_profiler() if profile else None
+    try:
+        yield record
+    except BaseException as e:
+        if profiler:
+            _stop_profiler(profiler, profile, kind)
+        if _enabled:
+            record.finish("cancelled" if isinstance(e, JobCancelled) else "failed", str(e))
+        raise
+    if profiler:
+        _stop_profiler(profiler, profile, kind)
+    if _enabled:
+        if output_path and os.path.isfile(output_path):
+            record.bytes_written = os.path.getsize(output_path)
+        record.finish("ok")
+
+
+def _start_profiler():
+    """Start a profiler for the current job, or return None while another job is being profiled."""
+    if not _profiling.acquire(blocking=False):
+        print("Another job is already being profiled; not profiling this one", file=sys.stderr, flush=True)
+        return None
+    try:
+        if os.environ.get(ENV_PROFILER) == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                pass
+            else:
+                profiler = Profiler()
+                profiler.start()
+                return profiler
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    except BaseException:
+        _profiling.release()
+        raise
+
+
+def _stop_profiler(profiler, profile, kind):
+    try:
+        is_pyinstrument = type(profiler).__module__.startswith("pyinstrument")
+        extension = ".html" if is_pyinstrument else ".prof"
+        if os.path.isdir(profile):
+            profile = os.path.join(profile, f"{kind}-{os.getpid()}-{next(_profile_ids)}{extension}")
+        if is_pyinstrument:
+            profiler.stop()
+            with open(profile, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.disable()
+            profiler.dump_stats(profile)
+    finally:
+        _profiling.release()
+
+
+def set_gauge(name, value, **labels):
+    """Set a process-wide gauge (no-op while disabled)."""
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[name, _key(labels)] = value
+
+
+def snapshot(reset=False):
+    """Return the process totals as a JSON-friendly dict (for shipping from worker processes)."""
+    with _lock:
+        data = {"counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+                "gauges": [[name, list(labels), value] for (name, labels), value in _gauges.items()]}
+        if reset:
+            _counters.clear()
+            _gauges.clear()
+    return data
+
+
+def merge(data):
+    """Add totals produced by snapshot() in another process."""
+    with _lock:
+        for name, labels, value in data["counters"]:
+            _counters[name, tuple(tuple(item) for item in labels)] += value
+        for name, labels, value in data["gauges"]:
+            _gauges[name, tuple(tuple(item) for item in labels)] = value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus():
+    """Return the totals in the Prometheus text exposition format."""
+    with _lock:
+        series = [(name, labels, value) for (name, labels), value in _counters.items()]
+        series += [(name, labels, value) for (name, labels), value in _gauges.items()]
+    lines = []
+    for metric, (metric_type, help_text) in METRIC_HELP.items():
+        rows = sorted((labels, value) for name, labels, value in series if name == metric)
+        if not rows:
+            continue
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+        for labels, value in rows:
+            label_text = ",".join(f'{name}="{_escape(label)}"' for name, label in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}" if label_text else f"{metric} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Write the totals to a file for a node_exporter textfile collector (atomically)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
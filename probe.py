@@ -0,0 +1,319 @@
+"""Content-based format detection and a persistent media metadata index.
+
+``sniff`` identifies a file from its magic bytes, so a mislabeled file is
+recognized (or rejected) before any converter touches it. ``probe_media``
+adds codec, container, duration, resolution and bitrate from a single
+``ffprobe -show_streams -show_format -of json`` call, or from the Pillow
+header for images. ``MetadataIndex`` keeps those results on disk keyed on
+path, size and mtime, so repeated jobs on the same file skip the probe.
+
+The metadata dict has the same "video"/"audio"/"duration" keys as
+transcode.probe_streams and can be passed to transcode() as ``streams``.
+
+Usage examples:
+    python probe.py clip.mkv
+    python probe.py ~/footage --workers 16
+"""
+
+import argparse
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import default_cache_dir
+from transcode import ffmpeg_available, ffprobe_json, find_ffprobe, first_streams, probe_streams
+
+INDEX_VERSION = 1
+
+# Oldest entries are dropped once the index grows past this
+MAX_INDEX_ENTRIES = 10_000
+
+# Minimum seconds between index writes from get(); later misses wait for the next write or exit
+SAVE_INTERVAL = 30.0
+
+SNIFF_BYTES = 4096
+
+# (magic bytes at offset 0, category, container); longest signatures first
+MAGIC = [
+    (b"\x30\x26\xb2\x75\x8e\x66\xcf\x11", None, "asf"),
+    (b"\x89PNG\r\n\x1a\n", "image", "png"),
+    (b"\x1a\x45\xdf\xa3", None, "mkv"),
+    (b"\x00\x00\x01\x00", "image", "ico"),
+    (b"GIF87a", "image", "gif"),
+    (b"GIF89a", "image", "gif"),
+    (b"II*\x00", "image", "tiff"),
+    (b"MM\x00*", "image", "tiff"),
+    (b"%PDF-", "document", "pdf"),
+    (b"FLV\x01", "video", "flv"),
+    (b"OggS", "audio", "ogg"),
+    (b"fLaC", "audio", "flac"),
+    (b"ID3", "audio", "mp3"),
+    (b"\xff\xd8\xff", "image", "jpeg"),
+    (b"BM", "image", "bmp"),
+]
+
+# Containers that hold either audio or video; sniff() leaves their category to the streams
+AV_CONTAINERS = {"asf", "mkv", "webm"}
+
+# RIFF form types
+RIFF_TYPES = {
+    b"WEBP": ("image", "webp"),
+    b"WAVE": ("audio", "wav"),
+    b"AVI ": ("video", "avi"),
+}
+
+# ISO base media "ftyp" brands that are not plain MP4 video
+FTYP_BRANDS = {
+    "heic": ("image", "heif"), "heix": ("image", "heif"), "heif": ("image", "heif"),
+    "mif1": ("image", "heif"), "msf1": ("image", "heif"), "avif": ("image", "avif"),
+    "M4A ": ("audio", "m4a"), "M4B ": ("audio", "m4a"),
+    "qt  ": ("video", "mov"),
+}
+
+
+def sniff(path):
+    """Return (category, container) from a file's magic bytes, or (None, None) if unrecognized.
+
+    The category is None for AV_CONTAINERS; probe_media() decides it from the streams.
+    """
+    with open(path, "rb") as f:
+        return sniff_bytes(f.read(SNIFF_BYTES))
+
+
+def sniff_bytes(head):
+    """Return (category, container) from the first bytes of a file (SNIFF_BYTES are enough)."""
+    head = bytes(head[:SNIFF_BYTES])
+    if head[4:8] == b"ftyp":
+        return FTYP_BRANDS.get(head[8:12].decode("latin-1"), ("video", "mp4"))
+    if head[:4] == b"RIFF":
+        return RIFF_TYPES.get(head[8:12], (None, None))
+    for magic, category, container in MAGIC:
+        if head.startswith(magic):
+            if container == "mkv" and b"webm" in head[:64]:
+                return category, "webm"
+            if container == "ogg" and b"OpusHead" in head[:64]:
+                return category, "opus"
+            return category, container
+    if len(head) >= 2 and head[0] == 0xFF:
+        # MPEG audio frame sync; ADTS AAC sets layer 0
+        if head[1] & 0xF6 == 0xF0:
+            return "audio", "aac"
+        if head[1] & 0xE0 == 0xE0:
+            return "audio", "mp3"
+    return None, None
+
+
+def _number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(rate):
+    num, _, den = (rate or "").partition("/")
+    if _number(num) and _number(den):
+        return round(float(num) / float(den), 3)
+    return _number(num)
+
+
+def probe_media(path):
+    """Return a metadata dict for a media file, raising ValueError if it is not one."""
+    st = os.stat(path)
+    category, container = sniff(path)
+    info = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "category": category, "container": container,
+            "format_name": None, "duration": None, "bit_rate": None, "video": None, "audio": None,
+            "width": None, "height": None, "fps": None, "channels": None, "sample_rate": None,
+            "mode": None, "frames": None, "probed": True}
+
+    if category == "document":
+        return info
+    if category == "image":
+        from PIL import Image
+
+        try:
+            with Image.open(path) as img:
+                info.update(format_name=img.format, width=img.width, height=img.height, mode=img.mode,
+                            frames=getattr(img, "n_frames", 1))
+        except Exception as e:
+            raise ValueError(f"Not a readable image: {str(e)}")
+        return info
+
+    if find_ffprobe():
+        try:
+            data = ffprobe_json(path)
+        except Exception:
+            raise ValueError(f"Not a recognized media file: {os.path.basename(path)}")
+        fmt = data.get("format", {})
+        streams = first_streams(data)
+        video, audio = streams["video"], streams["audio"]
+        info.update(format_name=fmt.get("format_name"), duration=_number(fmt.get("duration")),
+                    bit_rate=_number(fmt.get("bit_rate"), int))
+        if video:
+            info.update(video=video.get("codec_name"), width=video.get("width"), height=video.get("height"),
+                        fps=_frame_rate(video.get("avg_frame_rate")))
+        if audio:
+            info.update(audio=audio.get("codec_name"), channels=audio.get("channels"),
+                        sample_rate=_number(audio.get("sample_rate"), int))
+    elif ffmpeg_available():
+        info.update(probe_streams(path))
+    else:
+        # Nothing to probe with; the MoviePy/pydub fallbacks will find out
+        info["probed"] = False
+        return info
+
+    if info["video"] is None and info["audio"] is None:
+        raise ValueError(f"Not a recognized media file: {os.path.basename(path)}")
+    info["category"] = "video" if info["video"] is not None else "audio"
+    return info
+
+
+def check_job(metadata, category):
+    """Raise ValueError if a job of ``category`` cannot work on a file with this metadata."""
+    found = metadata["category"]
+    if category == "image":
+        if found != "image":
+            raise ValueError(f"File is not an image (detected {found or 'unknown content'})")
+    elif category in ("video", "audio"):
+        if found in ("image", "document"):
+            raise ValueError(f"File is not {category} (detected {found})")
+        if metadata["probed"] and category == "audio" and metadata["audio"] is None:
+            raise ValueError("File has no audio stream")
+    elif category == "document":
+        if metadata["container"] != "pdf":
+            raise ValueError(f"File is not a PDF (detected {metadata['container'] or found or 'unknown content'})")
+
+
+class MetadataIndex:
+    """Persistent path -> metadata index, invalidated when a file's size or mtime changes."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), "metadata.json")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = set()
+        self._saved_at = None
+        self._load()
+
+    def get(self, path, save=True):
+        """Return the metadata of ``path``, probing it only if the index has no fresh entry.
+
+        A miss is written to the index file at most every SAVE_INTERVAL
+        seconds (never with ``save=False``); call save() to flush the rest.
+        """
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = probe_media(key)
+        with self._lock:
+            self._entries[key] = entry
+            self._dirty.add(key)
+        if save and (self._saved_at is None or time.monotonic() - self._saved_at >= SAVE_INTERVAL):
+            self.save()
+        return entry
+
+    def probe_many(self, paths, workers=None):
+        """Probe many files in parallel; return {path: metadata or the exception raised}."""
+        def probe_one(path):
+            try:
+                return path, self.get(path, save=False)
+            except Exception as e:
+                return path, e
+
+        # Probing is dominated by ffprobe subprocesses and file I/O, so threads are enough
+        with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as executor:
+            results = dict(executor.map(probe_one, paths))
+        self.save()
+        return results
+
+    def save(self):
+        """Merge new entries into the index file (other processes may have added their own)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            merged = self._read()
+            merged.update((key, self._entries[key]) for key in self._dirty)
+            while len(merged) > MAX_INDEX_ENTRIES:
+                del merged[next(iter(merged))]
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "entries": merged}, f)
+            os.replace(tmp_path, self.path)
+            self._entries = merged
+            self._dirty.clear()
+            self._saved_at = time.monotonic()
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data.get("entries", {}) if data.get("version") == INDEX_VERSION else {}
+
+    def _load(self):
+        self._entries = self._read()
+
+
+@functools.lru_cache(maxsize=None)
+def default_index():
+    """Return the per-process index stored in the user cache directory; unsaved entries are flushed at exit."""
+    index = MetadataIndex()
+    atexit.register(index.save)
+    return index
+
+
+def detect_category(path):
+    """Return a file's category from its content (and streams, for AV_CONTAINERS), falling back to the extension."""
+    from converter import detect_file_category
+
+    try:
+        category, container = sniff(path)
+    except OSError:
+        category = container = None
+    if category is None and container in AV_CONTAINERS:
+        try:
+            category = default_index().get(path)["category"]
+        except (OSError, ValueError):
+            pass
+    return category or detect_file_category(os.path.splitext(path)[1][1:])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Probe media files and store their metadata in the index.")
+    parser.add_argument("sources", nargs="+", help="Files, directories or glob patterns")
+    parser.add_argument("--workers", type=int, help="Parallel probes (default: 4 per CPU, at most 32)")
+    parser.add_argument("--index", help="Index file (default: metadata.json in the user cache directory)")
+    args = parser.parse_args(argv)
+
+    from batch import expand_source
+
+    paths = [path for source in args.sources for path in expand_source(source)]
+    index = MetadataIndex(args.index) if args.index else default_index()
+    results = index.probe_many(paths, args.workers)
+    failed = 0
+    for path, metadata in results.items():
+        if isinstance(metadata, Exception):
+            failed += 1
+            print(json.dumps({"path": path, "error": str(metadata)}))
+        else:
+            print(json.dumps(dict(metadata, path=path)))
+    print(f"{len(results)} probed ({index.hits} from the index), {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""Resource-aware admission for conversion, compression and download jobs.
+
+Every job gets a cost estimate, ``{"cpu": slots, "memory": bytes}``. The
+estimate comes from the job's category and its probed metadata: resolution
+and frame count for images, resolution and whether the video is
+stream-copied for video, and page rendering for PDFs. A job starts only when
+its cost fits both budgets:
+
+* the global budget: ``cpu_slots`` (default: CPU count), ``memory`` (default:
+  MEMORY_FRACTION of physical RAM) and optionally ``max_jobs``;
+* the budget of its category (CATEGORY_LIMITS). By default video and
+  documents may take at most 3/4 of the CPU slots, so a long encode never
+  leaves image jobs without a slot.
+
+Among jobs that fit, a higher priority goes first. Categories with equal
+priority share the machine fairly: the category with the fewest slots in
+use is served next, so a flood of image jobs runs alongside a long video
+instead of queueing behind it. Within a category, jobs run in priority and
+then FIFO order. A job that has waited longer than ``max_wait`` seconds
+reserves the resources. Nothing else starts until it fits, which keeps a
+large job from being starved by a stream of small ones. A cost larger than
+the whole budget is clamped, so the job can still run on its own.
+
+Scheduler.submit() runs a callable on its own thread once it is admitted and
+returns a concurrent.futures.Future. Scheduler.acquire() blocks the calling
+thread until a slot is granted (for code that already owns its threads, such
+as DownloadQueue). stats() reports queue depth, running jobs and utilization.
+With metrics enabled, the same figures are exported as Prometheus gauges.
+"""
+
+import collections
+import functools
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+MB = 1024 * 1024
+
+# Share of physical memory the scheduler hands out by default
+MEMORY_FRACTION = 0.75
+
+# Jobs waiting longer than this (seconds) reserve resources ahead of newer jobs
+MAX_WAIT = 60.0
+
+# Per-category budgets: "cpu" and "memory" as fractions of the global budget, "jobs" as a count
+CATEGORY_LIMITS = {
+    "video": {"cpu": 0.75, "memory": 0.75},
+    "document": {"cpu": 0.75, "memory": 0.75},
+    "download": {"jobs": 4},
+}
+
+# Fixed overhead of one job (interpreter work, ffmpeg process, buffers)
+BASE_MEMORY = {"image": 32 * MB, "audio": 64 * MB, "video": 192 * MB, "document": 96 * MB, "download": 128 * MB}
+
+# Frames an encoder keeps in flight (lookahead, reference and B-frames)
+ENCODER_FRAMES = 64
+
+# Threads a single (non-segmented) ffmpeg encode keeps busy
+ENCODE_SLOTS = 4
+
+DEFAULT_VIDEO_PIXELS = 1920 * 1080
+DEFAULT_IMAGE_PIXELS = 12_000_000
+
+
+def physical_memory():
+    """Return the installed RAM in bytes, or None if it cannot be determined."""
+    if sys.platform == "win32":
+        return _windows_physical_memory()
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _windows_physical_memory():
+    # os.sysconf does not exist on Windows; ask GlobalMemoryStatusEx instead
+    try:
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong)] + [
+                (name, ctypes.c_ulonglong) for name in ("ullTotalPhys", "ullAvailPhys", "ullTotalPageFile",
+                                                        "ullAvailPageFile", "ullTotalVirtual", "ullAvailVirtual",
+                                                        "ullAvailExtendedVirtual")]
+
+        status = MemoryStatus(dwLength=ctypes.sizeof(MemoryStatus))
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return None
+        return status.ullTotalPhys
+    except (AttributeError, ImportError, OSError):
+        return None
+
+
+def estimate_cost(category, metadata=None, mode="convert", output_format=None, segmented=None):
+    """Return the {"cpu", "memory"} cost of a job from its category and probed metadata."""
+    cpus = os.cpu_count() or 1
+    metadata = metadata or {}
+    pixels = (metadata.get("width") or 0) * (metadata.get("height") or 0)
+    base = BASE_MEMORY.get(category, 64 * MB)
+
+    if category == "image":
+        if not pixels:
+            # Compressed images decode to roughly 10x their file size
+            pixels = (metadata.get("size") or 0) * 10 // 4 or DEFAULT_IMAGE_PIXELS
+        # Decoded RGBA source plus a resized/converted copy; frames are decoded one at a time
+        return {"cpu": 1, "memory": base + pixels * 4 * 2}
+
+    if category == "video":
+        from transcode import ANIMATION_FORMATS, can_copy
+
+        copy = (mode == "convert" and output_format and output_format.lower() not in ANIMATION_FORMATS
+                and can_copy(metadata.get("video"), "video", output_format))
+        if copy:
+            return {"cpu": 1, "memory": base}
+        frame = (pixels or DEFAULT_VIDEO_PIXELS) * 3 // 2
+        if segmented is None:
+            from segmented import should_segment
+
+            segmented = should_segment(metadata.get("duration"), output_format or "mp4")
+        if segmented:
+            # One encoder per core, each with its own frame buffers
+            return {"cpu": cpus, "memory": base + cpus * frame * ENCODER_FRAMES // 4}
+        return {"cpu": min(cpus, ENCODE_SLOTS), "memory": base + frame * ENCODER_FRAMES}
+
+    if category == "document":
+        if mode == "compress":
+            return {"cpu": 1, "memory": base + 64 * MB}
+        # Render workers each hold one page (A4 at 150 DPI is ~3.6 MB of RGB)
+        return {"cpu": cpus, "memory": base + cpus * 32 * MB}
+
+    return {"cpu": 1, "memory": base}
+
+
+def job_cost(job):
+    """Return the cost of a jobs.Job (or a batch/watch job dict), probing its input through the index."""
+    if isinstance(job, dict):
+        category, mode, path = job["category"], job.get("mode", "convert"), job["input"]
+        output_format, segmented = job.get("format"), job.get("segmented")
+        if job.get("targets"):
+            mode = "multi"
+    else:
+        category, mode, path = job.category, job.mode, job.input_path
+        output_format, segmented = job.output_format, job.options.get("segmented")
+    if mode == "multi" or not isinstance(output_format, str):
+        # Several outputs decoded once; as expensive as re-encoding
+        mode, output_format = "multi", None
+    try:
+        from probe import default_index
+
+        metadata = default_index().get(path)
+    except Exception:
+        metadata = {"size": os.path.getsize(path)} if os.path.isfile(path) else None
+    return estimate_cost(category, metadata, mode, output_format, segmented)
+
+
+class Lease:
+    """Resources granted to one job; release() (or leaving the ``with`` block) returns them."""
+
+    def __init__(self, scheduler, entry):
+        self._scheduler = scheduler
+        self._entry = entry
+
+    @property
+    def cost(self):
+        return dict(self._entry.cost)
+
+    def release(self):
+        self._scheduler._release(self._entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _Entry:
+    def __init__(self, seq, category, cost, priority, name, on_admit):
+        self.seq = seq
+        self.category = category
+        self.cost = cost
+        self.priority = priority
+        self.name = name
+        self.on_admit = on_admit
+        self.queued = time.monotonic()
+        self.started = None
+        self.released = False
+
+    def __lt__(self, other):
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+class Scheduler:
+    """Admits jobs against global and per-category CPU-slot and memory budgets."""
+
+    def __init__(self, cpu_slots=None, memory=None, limits=None, max_jobs=None, max_wait=MAX_WAIT):
+        """``memory=0`` disables the memory budget; ``limits`` overrides CATEGORY_LIMITS per category."""
+        self.cpu_slots = max(1, cpu_slots or os.cpu_count() or 1)
+        if memory is None:
+            total = physical_memory()
+            if not total:
+                print("Cannot determine physical memory; the scheduler's memory budget is disabled "
+                      "(set one with --memory)", file=sys.stderr)
+            memory = int(total * MEMORY_FRACTION) if total else 0
+        self.memory = memory or None
+        self.max_jobs = max_jobs
+        self.max_wait = max_wait
+        self.limits = {}
+        for category, limit in dict(CATEGORY_LIMITS, **(limits or {})).items():
+            self.limits[category] = {
+                "cpu": max(1, int(self.cpu_slots * limit["cpu"])) if limit.get("cpu") else None,
+                "memory": int(self.memory * limit["memory"]) if limit.get("memory") and self.memory else None,
+                "jobs": limit.get("jobs"),
+            }
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._queues = collections.defaultdict(list)
+        self._running = set()
+        self._used = collections.Counter()
+        self._completed = collections.Counter()
+        self._waited = collections.Counter()
+
+    def submit(self, func, *args, category="other", cost=None, priority=0, name=None, **kwargs):
+        """Queue ``func(*args, **kwargs)`` and return a Future; it runs on its own thread once admitted."""
+        future = Future()
+
+        def run(entry):
+            thread = threading.Thread(target=self._run, args=(entry, future, func, args, kwargs),
+                                      name=name or f"scheduled-{entry.seq}", daemon=True)
+            thread.start()
+
+        self._queue(category, cost, priority, name, run)
+        return future
+
+    def submit_job(self, job, priority=0):
+        """Queue a jobs.Job with its estimated cost and return the Future of its run()."""
+        return self.submit(job.run, category=job.category, cost=job_cost(job), priority=priority,
+                           name=f"job-{job.id}")
+
+    def acquire(self, category="other", cost=None, priority=0, timeout=None):
+        """Block until a job of this cost is admitted and return its Lease (None on timeout)."""
+        admitted = threading.Event()
+        entry = self._queue(category, cost, priority, None, lambda entry: admitted.set())
+        if admitted.wait(timeout):
+            return Lease(self, entry)
+        with self._lock:
+            if entry.started is None:
+                self._queues[category].remove(entry)
+                heapq.heapify(self._queues[category])
+                return None
+        # Admitted between the timeout and taking the lock
+        return Lease(self, entry)
+
+    def queued(self):
+        """Return the number of jobs waiting for admission."""
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        """Return queue depth, running jobs and utilization, overall and per category."""
+        with self._lock:
+            categories = set(self._queues) | set(self._completed) | {entry.category for entry in self._running}
+            per_category = {}
+            for category in sorted(categories):
+                running = [entry for entry in self._running if entry.category == category]
+                completed = self._completed[category]
+                per_category[category] = {
+                    "queued": len(self._queues.get(category, ())),
+                    "running": len(running),
+                    "completed": completed,
+                    "cpu": self._used[category, "cpu"],
+                    "memory": self._used[category, "memory"],
+                    "mean_wait": round(self._waited[category] / completed, 3) if completed else None,
+                }
+            cpu_used = sum(entry.cost["cpu"] for entry in self._running)
+            memory_used = sum(entry.cost["memory"] for entry in self._running)
+            return {
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "running": len(self._running),
+                "cpu_slots": self.cpu_slots,
+                "cpu_used": cpu_used,
+                "cpu_utilization": round(cpu_used / self.cpu_slots, 3),
+                "memory": self.memory,
+                "memory_used": memory_used,
+                "memory_utilization": round(memory_used / self.memory, 3) if self.memory else None,
+                "categories": per_category,
+            }
+
+    def _queue(self, category, cost, priority, name, on_admit):
+        cost = self._clamp(category, cost or estimate_cost(category))
+        with self._lock:
+            entry = _Entry(next(self._seq), category, cost, priority, name, on_admit)
+            heapq.heappush(self._queues[category], entry)
+            admitted = self._dispatch()
+        self._admit(admitted)
+        return entry
+
+    def _clamp(self, category, cost):
+        """Shrink a cost to what the global and category budgets can ever grant."""
+        limit = self.limits.get(category, {})
+        cpu = min(max(1, int(cost.get("cpu") or 1)), limit.get("cpu") or self.cpu_slots, self.cpu_slots)
+        memory = max(0, int(cost.get("memory") or 0))
+        for cap in (self.memory, limit.get("memory")):
+            if cap:
+                memory = min(memory, cap)
+        return {"cpu": cpu, "memory": memory}
+
+    def _fits(self, entry):
+        if not self._running:
+            return True
+        cost, category = entry.cost, entry.category
+        limit = self.limits.get(category, {})
+        if self.max_jobs and len(self._running) >= self.max_jobs:
+            return False
+        if sum(e.cost["cpu"] for e in self._running) + cost["cpu"] > self.cpu_slots:
+            return False
+        if self.memory and sum(e.cost["memory"] for e in self._running) + cost["memory"] > self.memory:
+            return False
+        if limit.get("cpu") and self._used[category, "cpu"] + cost["cpu"] > limit["cpu"]:
+            return False
+        if limit.get("memory") and self._used[category, "memory"] + cost["memory"] > limit["memory"]:
+            return False
+        if limit.get("jobs") and self._used[category, "jobs"] >= limit["jobs"]:
+            return False
+        return True
+
+    def _dispatch(self):
+        """Start every queued job that fits now and return them; called with the lock held."""
+        admitted = []
+        now = time.monotonic()
+        while True:
+            heads = [queue[0] for queue in self._queues.values() if queue]
+            if not heads:
+                break
+            starving = [entry for entry in heads if now - entry.queued > self.max_wait]
+            if starving:
+                order = [min(starving, key=lambda entry: entry.queued)]
+            else:
+                # Priority first, then the category using the fewest slots, then arrival order
+                order = sorted(heads, key=lambda entry: (-entry.priority, self._used[entry.category, "cpu"],
+                                                         entry.seq))
+            entry = next((entry for entry in order if self._fits(entry)), None)
+            if entry is None:
+                break
+            heapq.heappop(self._queues[entry.category])
+            if not self._queues[entry.category]:
+                del self._queues[entry.category]
+            entry.started = now
+            self._running.add(entry)
+            self._used[entry.category, "cpu"] += entry.cost["cpu"]
+            self._used[entry.category, "memory"] += entry.cost["memory"]
+            self._used[entry.category, "jobs"] += 1
+            self._waited[entry.category] += now - entry.queued
+            admitted.append(entry)
+        return admitted
+
+    def _admit(self, admitted):
+        for entry in admitted:
+            entry.on_admit(entry)
+        if metrics.enabled():
+            self._export()
+
+    def _release(self, entry):
+        with self._lock:
+            if entry.released:
+                return
+            entry.released = True
+            self._running.discard(entry)
+            self._used[entry.category, "cpu"] -= entry.cost["cpu"]
+            self._used[entry.category, "memory"] -= entry.cost["memory"]
+            self._used[entry.category, "jobs"] -= 1
+            self._completed[entry.category] += 1
+            admitted = self._dispatch()
+        self._admit(admitted)
+
+    def _run(self, entry, future, func, args, kwargs):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            self._release(entry)
+
+    def _export(self):
+        stats = self.stats()
+        metrics.set_gauge("convert_py_scheduler_cpu_utilization", stats["cpu_utilization"])
+        if stats["memory_utilization"] is not None:
+            metrics.set_gauge("convert_py_scheduler_memory_utilization", stats["memory_utilization"])
+        for category, values in stats["categories"].items():
+            metrics.set_gauge("convert_py_scheduler_queued", values["queued"], category=category)
+            metrics.set_gauge("convert_py_scheduler_running", values["running"], category=category)
+
+
+@functools.lru_cache(maxsize=None)
+def default_scheduler():
+    """Return the process-wide scheduler with default budgets."""
+    return Scheduler()
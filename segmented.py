@@ -0,0 +1,135 @@
+"""Segmented parallel video encoding for long inputs.
+
+The input's video stream is split at keyframes with ffmpeg's segment muxer
+(stream copy, no decoding), every segment is encoded by its own ffmpeg
+process, and the encoded segments are joined losslessly with the concat
+demuxer while the audio is taken from the original file in the same pass.
+Each segment gets the same encoder arguments (bitrate, quality, preset), so
+compression settings apply to the whole output.
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from transcode import audio_codec_args, find_ffmpeg, run_ffmpeg
+
+# Inputs shorter than this are encoded in one pass unless segmenting is forced
+SEGMENT_MIN_DURATION = 600
+
+# Never cut segments shorter than this; each segment pays encoder start-up cost
+MIN_SEGMENT_SECONDS = 20
+
+# Aim for this many segments per worker so uneven segments still balance out
+SEGMENTS_PER_WORKER = 3
+
+
+def should_segment(duration, output_format, encoder=None):
+    """Return True if a transcode is long enough and CPU-bound enough to benefit from segmenting."""
+    from encoders import is_hardware, select_encoder
+
+    if not duration or duration < SEGMENT_MIN_DURATION or (os.cpu_count() or 1) < 4:
+        return False
+    # A GPU encoder is already parallel internally and limits concurrent sessions
+    return not is_hardware(encoder or select_encoder(output_format))
+
+
+def plan_segment_seconds(duration, workers):
+    """Return the target segment length for an input of ``duration`` seconds."""
+    if not duration:
+        return MIN_SEGMENT_SECONDS * 3
+    return max(MIN_SEGMENT_SECONDS, duration / (workers * SEGMENTS_PER_WORKER))
+
+
+def split_at_keyframes(input_path, work_dir, segment_seconds, cancel=None):
+    """Split the first video stream into keyframe-aligned segments and return their paths."""
+    pattern = os.path.join(work_dir, "source_%05d.mkv")
+    run_ffmpeg([
+        find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", input_path,
+        "-map", "0:v:0", "-c", "copy", "-f", "segment", "-segment_time", f"{segment_seconds:.3f}",
+        "-reset_timestamps", "1", pattern,
+    ], cancel=cancel)
+    return sorted(glob.glob(os.path.join(work_dir, "source_*.mkv")))
+
+
+def encode_segmented(input_path, output_path, output_format, streams, video_args=None, audio_args=None,
+                     force_encode=False, encoder=None, preset=None, segment_seconds=None, workers=None,
+                     progress=None, cancel=None):
+    """Encode a video as parallel keyframe-aligned segments and concatenate them.
+
+    Segments are encoded by up to ``workers`` concurrent ffmpeg processes
+    (default: one per core) with the encoder's thread count divided between
+    them. Returns the final concat command.
+    """
+    from encoders import select_encoder, video_encoder_args
+
+    output_format = output_format.lower()
+    workers = workers or os.cpu_count() or 1
+    encoder = encoder or select_encoder(output_format)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    segment_seconds = segment_seconds or plan_segment_seconds(streams["duration"], workers)
+
+    # Internal stop signal: set by the caller's cancel event, or when one segment
+    # fails so the other ffmpeg processes are terminated as well
+    stop = threading.Event()
+    finished_event = threading.Event()
+    if cancel is not None:
+        def forward_cancel():
+            while not finished_event.is_set():
+                if cancel.wait(0.2):
+                    stop.set()
+                    return
+        threading.Thread(target=forward_cancel, daemon=True).start()
+
+    work_dir = tempfile.mkdtemp(prefix=".segments-", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        sources = split_at_keyframes(input_path, work_dir, segment_seconds, stop)
+        if not sources:
+            raise RuntimeError("ffmpeg produced no segments")
+
+        encoded = [os.path.join(work_dir, f"encoded_{i:05d}.mkv") for i in range(len(sources))]
+        video_codec_args = video_encoder_args(output_format, encoder, preset, threads) + list(video_args or [])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(run_ffmpeg, [find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", source, "-an"]
+                                + video_codec_args + [target], None, None, stop)
+                for source, target in zip(sources, encoded)
+            }
+            finished = 0
+            try:
+                while futures:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                        finished += 1
+                        if progress:
+                            progress({"stage": "encode", "percent": finished / len(sources) * 95, "fps": None,
+                                      "eta": None, "bytes_written": None})
+            except BaseException:
+                # Stop the remaining ffmpeg processes before the pool shuts down
+                stop.set()
+                raise
+
+        list_path = os.path.join(work_dir, "segments.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in encoded:
+                f.write("file '{}'\n".format(path.replace("'", "'\\''")))
+
+        cmd = [find_ffmpeg(), "-hide_banner", "-nostdin", "-y",
+               "-f", "concat", "-safe", "0", "-i", list_path, "-i", input_path,
+               "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy"]
+        cmd += audio_codec_args(streams, output_format, audio_args, force_encode)
+        if output_format in ("mp4", "mov"):
+            cmd += ["-movflags", "+faststart"]
+        cmd.append(output_path)
+        run_ffmpeg(cmd, cancel=stop)
+        if progress:
+            progress({"stage": "done", "percent": 100.0, "fps": None, "eta": 0.0,
+                      "bytes_written": os.path.getsize(output_path)})
+        return cmd
+    finally:
+        finished_event.set()
+        shutil.rmtree(work_dir, ignore_errors=True)
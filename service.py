@@ -0,0 +1,666 @@
+"""Local HTTP job service for conversion, compression and downloads.
+
+Runs on asyncio with no web framework. Uploads are streamed to disk and
+results streamed back in chunks, so no file is ever held in memory. Jobs
+are admitted by a scheduler.Scheduler: each one waits until its estimated CPU
+and memory cost fits, at most ``--workers`` run at once, and a higher
+``priority`` goes first. When the queue is full, new jobs get HTTP 429 with a
+Retry-After header instead of piling up.
+
+Endpoints (all responses are JSON unless noted):
+
+    POST   /jobs?mode=convert&to=mp4&filename=clip.mkv   body: the file (PUT works too, for curl -T)
+    POST   /jobs?mode=compress&quality=60&filename=a.jpg  (also target_size=8MB, max_size=1024,
+                                                           encoder=..., preset=..., priority=1)
+    POST   /convert?to=webp                               body: the file; the response body is the result,
+                                                          converted in memory / through ffmpeg pipes with no
+                                                          files on disk (also mode=compress&quality=60)
+    POST   /downloads                                     body: {"url": ..., "format": "MP4"}
+    GET    /jobs                                          all jobs
+    GET    /jobs/<id>                                     status and progress
+    GET    /jobs/<id>/events                              NDJSON stream of status changes
+    GET    /jobs/<id>/result                              the output file (?file=<name> picks one
+                                                          of "outputs", e.g. a page of a rendered PDF)
+    GET    /jobs/<id>/profile                             profile of a job submitted with profile=1
+    DELETE /jobs/<id>                                     cancel, or discard a finished job
+    GET    /stats                                         scheduler queue depth and utilization
+    GET    /metrics                                       Prometheus text (with --metrics)
+
+Usage:
+    python service.py --port 8765 --workers 4 --max-queue 16
+    curl -T clip.mkv "http://127.0.0.1:8765/jobs?mode=convert&to=mp4&filename=clip.mkv"
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from converter import (
+    COMPRESSION_CATEGORIES,
+    CONVERSION_TARGETS,
+    compressed_output_path,
+    converted_output_path,
+    detect_file_category,
+)
+from jobs import Job
+from probe import detect_category
+from scheduler import Scheduler, job_cost
+from streaming import compress_stream, convert_stream
+from target_size import parse_size
+
+CHUNK_SIZE = 256 * 1024
+
+DEFAULT_MAX_UPLOAD = 8 * 1024 ** 3
+
+# Finished jobs and their files are discarded after this many seconds
+DEFAULT_JOB_TTL = 3600
+
+TERMINAL_STATUSES = ("done", "failed", "cancelled", "skipped", "expanded")
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 409: "Conflict",
+           411: "Length Required", 413: "Payload Too Large", 415: "Unsupported Media Type",
+           429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    """Turned into an error response by the request handler."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Request:
+    """A parsed request whose body is still unread on the stream."""
+
+    def __init__(self, method, path, query, headers, reader, writer):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+        self.unread = int(headers.get("content-length", 0))
+        self.expects_continue = headers.get("expect", "").lower() == "100-continue"
+
+    async def read(self, size):
+        """Read up to ``size`` bytes of the body."""
+        if self.expects_continue:
+            # The client waits for this before sending the body
+            self.writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await self.writer.drain()
+            self.expects_continue = False
+        chunk = await self.reader.read(min(size, self.unread))
+        if not chunk:
+            raise HTTPError(400, "Request body ended early")
+        self.unread -= len(chunk)
+        return chunk
+
+    async def read_all(self):
+        chunks = []
+        while self.unread:
+            chunks.append(await self.read(CHUNK_SIZE))
+        return b"".join(chunks)
+
+    async def discard_body(self):
+        """Consume an unread body so the client can read the error response.
+
+        A client waiting for "100 Continue" has not sent it, so nothing is read.
+        """
+        if self.expects_continue:
+            return
+        try:
+            while self.unread:
+                await self.read(CHUNK_SIZE)
+        except HTTPError:
+            pass
+
+
+class BodyReader(io.RawIOBase):
+    """Blocking file object over a request body, for code running off the event loop."""
+
+    def __init__(self, request, loop):
+        self.request = request
+        self.loop = loop
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self.request.unread:
+            return 0
+        chunk = asyncio.run_coroutine_threadsafe(self.request.read(len(b)), self.loop).result()
+        b[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class ResponseStream:
+    """Blocking writer that starts a chunked 200 response on the first write."""
+
+    def __init__(self, service, writer, loop):
+        self.service = service
+        self.writer = writer
+        self.loop = loop
+        self.started = False
+
+    def write(self, data):
+        asyncio.run_coroutine_threadsafe(self._write(bytes(data)), self.loop).result()
+        return len(data)
+
+    async def _write(self, data):
+        if not data:
+            return
+        if not self.started:
+            self.started = True
+            await self.service.send_headers(self.writer, 200, {"Content-Type": "application/octet-stream",
+                                                               "Transfer-Encoding": "chunked"})
+        self.writer.writelines([b"%x\r\n" % len(data), data, b"\r\n"])
+        await self.writer.drain()
+
+
+class ConversionJob:
+    """A convert/compress job on an uploaded file."""
+
+    kind = "conversion"
+
+    def __init__(self, job_id, directory, job):
+        self.id = job_id
+        self.directory = directory
+        self.job = job
+        self.finished_at = None
+        self.profile_dir = job.options.get("profile")
+
+    @property
+    def status(self):
+        return "queued" if self.job.status == "pending" else self.job.status
+
+    @property
+    def output(self):
+        return self.job.output_path if self.job.status == "done" and os.path.exists(self.job.output_path) else None
+
+    @property
+    def outputs(self):
+        """All files the job wrote; a multi-page PDF render writes one per page."""
+        if self.job.status != "done":
+            return []
+        return self.job.report if isinstance(self.job.report, list) else [self.job.output_path]
+
+    def describe(self):
+        event = self.job.last_event or {}
+        return {"id": self.id, "kind": self.job.mode, "status": self.status, "percent": event.get("percent"),
+                "fps": event.get("fps"), "eta": event.get("eta"), "error": self.job.error,
+                "report": self.job.report, "output": self.output and os.path.basename(self.output),
+                "profile": self.profile is not None,
+                "outputs": [os.path.basename(path) for path in self.outputs]}
+
+    @property
+    def profile(self):
+        """Path of the job's profile, once the job has finished and written it."""
+        if self.profile_dir and self.status in TERMINAL_STATUSES:
+            for name in os.listdir(self.profile_dir):
+                return os.path.join(self.profile_dir, name)
+        return None
+
+    def cancel(self):
+        self.job.cancel()
+
+    def discard(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class DownloadJob:
+    """A yt-dlp download running on the service's DownloadQueue."""
+
+    kind = "download"
+
+    def __init__(self, job_id, item, downloads):
+        self.id = job_id
+        self.item = item
+        self.downloads = downloads
+        self.finished_at = None
+
+    @property
+    def status(self):
+        return self.item.status
+
+    @property
+    def output(self):
+        return self.item.filename if self.item.status == "done" else None
+
+    def describe(self):
+        return {"id": self.id, "kind": "download", "status": self.item.status, "percent": self.item.percent,
+                "url": self.item.url, "title": self.item.title, "error": self.item.error,
+                "output": self.output and os.path.basename(self.output)}
+
+    def cancel(self):
+        self.downloads.cancel(self.item)
+
+    def discard(self):
+        self.downloads.forget(self.item)
+        if self.item.filename and os.path.exists(self.item.filename):
+            os.remove(self.item.filename)
+
+
+class JobService:
+    """Job table, scheduler and HTTP handlers."""
+
+    def __init__(self, work_dir, workers=2, max_queue=8, max_upload=DEFAULT_MAX_UPLOAD, job_ttl=DEFAULT_JOB_TTL,
+                 cpu_slots=None, memory=None):
+        self.work_dir = work_dir
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_upload = max_upload
+        self.job_ttl = job_ttl
+        self.jobs = {}
+        self.waiting = 0
+        self.streaming = 0
+        self.scheduler = Scheduler(cpu_slots, memory, max_jobs=workers)
+        self._stream_executor = ThreadPoolExecutor(max_workers=max_queue, thread_name_prefix="service-stream")
+        self._loop = None
+        self._item_jobs = {}   # DownloadItem -> DownloadJob
+        self._downloads = None
+
+    @property
+    def downloads(self):
+        """The shared DownloadQueue, created on the first download (yt-dlp stays unimported until then)."""
+        if self._downloads is None:
+            from youtube import DownloadQueue
+
+            directory = os.path.join(self.work_dir, "downloads")
+            os.makedirs(directory, exist_ok=True)
+            # No archive: a client asking again expects a file, not "skipped"
+            self._downloads = DownloadQueue(directory, max_concurrent=self.workers, archive_path=False,
+                                            on_update=self._on_download_update, scheduler=self.scheduler)
+        return self._downloads
+
+    async def start(self, host, port):
+        os.makedirs(self.work_dir, exist_ok=True)
+        self._loop = asyncio.get_running_loop()
+        asyncio.ensure_future(self._expire_jobs())
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def _run(self, record):
+        # Runs on a scheduler thread once the job is admitted
+        self._loop.call_soon_threadsafe(self._job_started)
+        try:
+            record.job.run()
+        finally:
+            record.finished_at = time.monotonic()
+
+    def _job_started(self):
+        self.waiting -= 1
+
+    async def _expire_jobs(self):
+        while True:
+            await asyncio.sleep(60)
+            now = time.monotonic()
+            for job_id, record in list(self.jobs.items()):
+                if record.status in TERMINAL_STATUSES:
+                    record.finished_at = record.finished_at or now
+                    if now - record.finished_at > self.job_ttl:
+                        del self.jobs[job_id]
+                        record.discard()
+                        if record.kind == "download":
+                            del self._item_jobs[record.item]
+
+    def _on_download_update(self, item):
+        # Called on download threads; playlist entries show up here as new items
+        if item not in self._item_jobs:
+            job_id = uuid.uuid4().hex[:12]
+            self._item_jobs[item] = self.jobs[job_id] = DownloadJob(job_id, item, self._downloads)
+
+    def _reserve_slot(self):
+        if self.waiting >= self.max_queue:
+            raise HTTPError(429, "Job queue is full", {"Retry-After": "5"})
+        self.waiting += 1
+
+    # HTTP plumbing
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if not headers.get("content-length", "0").isdigit():
+                # The body cannot be drained without a length; the connection closes after the reply
+                await self.send_json(writer, 400, {"error": "Invalid Content-Length"})
+                return
+            url = urlsplit(target)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            request = Request(method, url.path.rstrip("/") or "/", query, headers, reader, writer)
+            try:
+                await self.dispatch(request)
+            except HTTPError as e:
+                await request.discard_body()
+                await self.send_json(writer, e.status, {"error": str(e)}, e.headers)
+            except Exception as e:
+                await self.send_json(writer, 500, {"error": str(e)})
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def send_headers(self, writer, status, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def send_json(self, writer, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        await self.send_headers(writer, status, dict(headers or {}, **{"Content-Type": "application/json",
+                                                                       "Content-Length": len(body)}))
+        writer.write(body)
+        await writer.drain()
+
+    async def dispatch(self, request):
+        method, path, writer = request.method, request.path, request.writer
+        parts = path.strip("/").split("/")
+        if method in ("POST", "PUT") and path == "/jobs":
+            return await self.submit_conversion(request)
+        if method == "POST" and path == "/convert":
+            return await self.convert_inline(request)
+        if method == "POST" and path == "/downloads":
+            return await self.submit_download(request)
+        if method == "GET" and path == "/stats":
+            return await self.send_json(writer, 200, dict(self.scheduler.stats(), waiting=self.waiting))
+        if method == "GET" and path == "/metrics":
+            return await self.send_metrics(writer)
+        if method == "GET" and path == "/jobs":
+            return await self.send_json(writer, 200, [record.describe() for record in list(self.jobs.values())])
+        if parts[0] == "jobs" and len(parts) in (2, 3):
+            record = self.jobs.get(parts[1])
+            if record is None:
+                raise HTTPError(404, "No such job")
+            action = parts[2] if len(parts) == 3 else None
+            if method == "GET" and action is None:
+                return await self.send_json(writer, 200, record.describe())
+            if method == "GET" and action == "events":
+                return await self.stream_events(record, writer)
+            if method == "GET" and action == "result":
+                if request.query.get("file"):
+                    paths = {os.path.basename(path): path for path in getattr(record, "outputs", [])}
+                    if request.query["file"] not in paths:
+                        raise HTTPError(404, "No such output file")
+                    return await self.stream_result(record, writer, paths[request.query["file"]])
+                return await self.stream_result(record, writer)
+            if method == "GET" and action == "profile":
+                if getattr(record, "profile", None) is None:
+                    raise HTTPError(409, "No profile available; submit the job with profile=1 and wait for it")
+                return await self.stream_result(record, writer, record.profile)
+            if method == "DELETE" and action is None:
+                return await self.delete_job(record, writer)
+        raise HTTPError(404, f"No route for {method} {path}")
+
+    async def read_body_to(self, request, path):
+        """Stream the request body into ``path`` chunk by chunk."""
+        loop = asyncio.get_running_loop()
+        with open(path, "wb") as f:
+            while request.unread:
+                chunk = await request.read(CHUNK_SIZE)
+                await loop.run_in_executor(None, f.write, chunk)
+
+    # Handlers
+
+    async def submit_conversion(self, request):
+        query, writer = request.query, request.writer
+        if "content-length" not in request.headers:
+            raise HTTPError(411, "Content-Length is required")
+        if request.unread > self.max_upload:
+            raise HTTPError(413, f"Uploads are limited to {self.max_upload} bytes")
+        mode = query.get("mode", "convert")
+        if mode not in ("convert", "compress"):
+            raise HTTPError(400, f"Unknown mode: {mode}")
+        filename = os.path.basename(query.get("filename", ""))
+        if not filename:
+            raise HTTPError(400, "filename is required")
+        output_format = query.get("to", "").lower() or None
+        if mode == "convert" and not output_format:
+            raise HTTPError(400, "to is required in convert mode")
+        if mode == "compress" and detect_file_category(os.path.splitext(filename)[1][1:]) == "audio":
+            # Checked against the content again once the upload is in
+            raise HTTPError(400, "Audio cannot be compressed; convert it to a smaller format instead")
+        options = {}
+        for name in ("encoder", "preset"):
+            if query.get(name):
+                options[name] = query[name]
+        try:
+            quality = int(query.get("quality", 75))
+            priority = int(query.get("priority", 0))
+            if query.get("max_size"):
+                options["max_size"] = int(query["max_size"])
+            if query.get("target_size") and mode == "compress":
+                options["target_size"] = parse_size(query["target_size"])
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid parameter: {e}")
+
+        # Refuse before reading the body, so a full queue costs the client no upload
+        self._reserve_slot()
+        job_id = uuid.uuid4().hex[:12]
+        directory = os.path.join(self.work_dir, job_id)
+        try:
+            os.makedirs(directory)
+            if query.get("profile") in ("1", "true"):
+                options["profile"] = os.path.join(directory, "profile")
+                os.makedirs(options["profile"])
+            input_path = os.path.join(directory, filename)
+            await self.read_body_to(request, input_path)
+            category = detect_category(input_path)
+            if category is None or (mode == "convert" and output_format not in CONVERSION_TARGETS[category]):
+                raise HTTPError(415, f"Cannot {mode} {filename} to {output_format or 'its format'}")
+            if mode == "compress" and category not in COMPRESSION_CATEGORIES:
+                raise HTTPError(400, f"{category.capitalize()} cannot be compressed; convert it to a smaller "
+                                     "format instead")
+            if mode == "convert":
+                output_path = converted_output_path(input_path, output_format)
+            else:
+                output_path = compressed_output_path(input_path)
+            job = Job(mode, input_path, output_path, category, output_format, quality, **options)
+            # Estimating the cost probes the input
+            cost = await asyncio.get_running_loop().run_in_executor(None, job_cost, job)
+        except BaseException:
+            self.waiting -= 1
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        record = ConversionJob(job_id, directory, job)
+        self.jobs[job_id] = record
+        self.scheduler.submit(self._run, record, category=category, cost=cost, priority=priority,
+                              name=f"service-job-{job_id}")
+        await self.send_json(writer, 202, record.describe(), {"Location": f"/jobs/{job_id}"})
+
+    async def convert_inline(self, request):
+        """Convert the request body straight into the response, without a job or any files."""
+        query, writer = request.query, request.writer
+        if "content-length" not in request.headers:
+            raise HTTPError(411, "Content-Length is required")
+        if request.unread > self.max_upload:
+            raise HTTPError(413, f"Uploads are limited to {self.max_upload} bytes")
+        mode = query.get("mode", "convert")
+        if mode not in ("convert", "compress"):
+            raise HTTPError(400, f"Unknown mode: {mode}")
+        output_format = query.get("to", "").lower() or None
+        if mode == "convert" and not output_format:
+            raise HTTPError(400, "to is required in convert mode")
+        try:
+            quality = int(query["quality"]) if query.get("quality") else None
+            max_size = int(query["max_size"]) if query.get("max_size") else None
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid parameter: {e}")
+        if self.streaming >= self.max_queue:
+            raise HTTPError(429, "Too many conversions in progress", {"Retry-After": "5"})
+
+        self.streaming += 1
+        loop = asyncio.get_running_loop()
+        response = ResponseStream(self, writer, loop)
+        try:
+            await loop.run_in_executor(self._stream_executor, self._convert_inline, mode, BodyReader(request, loop),
+                                       response, output_format, quality, max_size)
+        except HTTPError:
+            raise
+        except Exception as e:
+            if response.started:
+                # Too late for an error status; the unterminated chunked body tells the client it failed
+                return
+            raise HTTPError(415, str(e))
+        finally:
+            self.streaming -= 1
+        if not response.started:
+            return await self.send_headers(writer, 200, {"Content-Type": "application/octet-stream",
+                                                         "Content-Length": 0})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _convert_inline(self, mode, body, response, output_format, quality, max_size):
+        # The category is not known until the body is sniffed; admit it at the default one-slot cost
+        with self.scheduler.acquire("stream"):
+            if mode == "convert":
+                convert_stream(body, output_format, response, quality=quality, max_size=max_size)
+            else:
+                compress_stream(body, quality or 75, response, output_format, max_size=max_size)
+
+    async def submit_download(self, request):
+        writer = request.writer
+        if not 0 < request.unread <= 64 * 1024:
+            raise HTTPError(400, "Expected a small JSON body")
+        try:
+            payload = json.loads(await request.read_all())
+            url = payload["url"]
+            download_format = payload.get("format", "MP4").upper()
+        except (ValueError, KeyError, TypeError):
+            raise HTTPError(400, 'Expected {"url": ..., "format": "MP4"|"WEBM"|"MP3"}')
+        from youtube import DOWNLOAD_FORMATS
+
+        if download_format not in DOWNLOAD_FORMATS:
+            raise HTTPError(400, f"Unknown download format: {download_format}")
+
+        existing = self.downloads.find(url, download_format)
+        if existing is not None:
+            record = self._item_jobs[existing]
+            return await self.send_json(writer, 200, record.describe(), {"Location": f"/jobs/{record.id}"})
+        active = sum(1 for item in self.downloads.snapshot() if item.status in ("queued", "expanding"))
+        if active >= self.max_queue:
+            raise HTTPError(429, "Download queue is full", {"Retry-After": "5"})
+        item = self.downloads.add(url, download_format)
+        record = self._item_jobs[item]
+        await self.send_json(writer, 202, record.describe(), {"Location": f"/jobs/{record.id}"})
+
+    async def stream_events(self, record, writer):
+        """Send one JSON line per status change until the job finishes (chunked transfer encoding)."""
+        await self.send_headers(writer, 200, {"Content-Type": "application/x-ndjson",
+                                              "Transfer-Encoding": "chunked"})
+        last = None
+        while True:
+            state = record.describe()
+            if state != last:
+                line = json.dumps(state).encode() + b"\n"
+                writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+                await writer.drain()
+                last = state
+            if state["status"] in TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(0.25)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def stream_result(self, record, writer, output=None):
+        output = output or record.output
+        if output is None:
+            raise HTTPError(409, f"Job is {record.status}, no result available")
+        loop = asyncio.get_running_loop()
+        await self.send_headers(writer, 200, {
+            "Content-Type": "application/octet-stream",
+            "Content-Length": os.path.getsize(output),
+            "Content-Disposition": f'attachment; filename="{os.path.basename(output)}"',
+        })
+        with open(output, "rb") as f:
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+    async def send_metrics(self, writer):
+        if not metrics.enabled():
+            raise HTTPError(404, "Metrics are disabled; start the service with --metrics")
+        body = metrics.render_prometheus().encode()
+        await self.send_headers(writer, 200, {"Content-Type": "text/plain; version=0.0.4",
+                                              "Content-Length": len(body)})
+        writer.write(body)
+        await writer.drain()
+
+    async def delete_job(self, record, writer):
+        if record.status in TERMINAL_STATUSES:
+            del self.jobs[record.id]
+            record.discard()
+            if record.kind == "download":
+                del self._item_jobs[record.item]
+            return await self.send_json(writer, 200, {"id": record.id, "status": "deleted"})
+        record.cancel()
+        await self.send_json(writer, 202, record.describe())
+
+
+async def serve(host, port, work_dir, workers, max_queue, max_upload, job_ttl, cpu_slots=None, memory=None):
+    service = JobService(work_dir, workers, max_queue, max_upload, job_ttl, cpu_slots, memory)
+    server = await service.start(host, port)
+    print(f"Serving on http://{host}:{server.sockets[0].getsockname()[1]} "
+          f"({workers} workers, queue {max_queue}, files in {work_dir})", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the local conversion job service.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Jobs (conversions and downloads) running at once (default: half the CPU count)")
+    parser.add_argument("--cpu-slots", type=int, help="CPU slots shared by running jobs (default: CPU count)")
+    parser.add_argument("--memory", help="Memory budget shared by running jobs, e.g. 8G (default: 3/4 of RAM)")
+    parser.add_argument("--max-queue", type=int, default=16, help="Jobs waiting before new ones get HTTP 429")
+    parser.add_argument("--max-upload", default="8G", help="Largest accepted upload (e.g. 500MB)")
+    parser.add_argument("--job-ttl", type=int, default=DEFAULT_JOB_TTL,
+                        help="Seconds to keep finished jobs and their files")
+    parser.add_argument("--work-dir", help="Where uploads and results are kept (default: a temporary directory)")
+    parser.add_argument("--metrics", action="store_true", help="Serve GET /metrics and log per-job JSON metrics")
+    parser.add_argument("--metrics-log", help="Append per-job JSON metrics to this file instead of stderr")
+    args = parser.parse_args(argv)
+
+    if args.metrics or args.metrics_log:
+        metrics.enable(args.metrics_log)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="convert-py-service-")
+    try:
+        asyncio.run(serve(args.host, args.port, work_dir, args.workers, args.max_queue,
+                          parse_size(args.max_upload), args.job_ttl, args.cpu_slots,
+                          parse_size(args.memory) if args.memory else None))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
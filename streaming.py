@@ -0,0 +1,497 @@
+"""Conversion and compression on bytes, file objects and stdin/stdout pipes.
+
+The converters in converter.py read the input from disk and write the result
+to disk. The functions here take ``source`` as bytes, bytearray, memoryview,
+a binary file object, a path, or "-" for stdin. They return the result as
+bytes, or write it to ``output`` (anything with a ``write`` method, "-" for
+stdout) as it is produced.
+
+- Images never touch the disk. Pillow decodes straight from the buffer (or
+  from a memory map of a local file) and encodes into memory. Only an image
+  read from a pipe that is larger than IMAGE_SPOOL_BYTES is spooled to a
+  temporary file, since Pillow needs to seek.
+- Audio and video stream through ffmpeg's stdin and stdout. A writer thread
+  feeds the input in chunks and the output is passed on as ffmpeg produces
+  it, so neither side is held in memory. A local file, including stdin
+  redirected from one, is given to ffmpeg by path so it can seek.
+- MP4/MOV data whose index (moov) comes after the media cannot be read from
+  a pipe, so only those inputs are spooled to a temporary file first.
+- MP4, MOV and M4A outputs are written fragmented, because a pipe cannot be
+  seeked back to finish the index.
+
+PDFs still go through documents.py, which needs files.
+
+Usage examples:
+    cat photo.png | python streaming.py - - --to webp > photo.webp
+    python streaming.py - - --to mp3 < talk.wav | python streaming.py - talk.ogg
+    curl -s https://example.com/clip.mkv | python streaming.py - - --to webm | ffplay -
+"""
+
+import argparse
+import collections
+import io
+import json
+import mmap
+import os
+import re
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+
+import metrics
+from images import process_image
+from probe import AV_CONTAINERS, SNIFF_BYTES, sniff_bytes
+from transcode import (
+    ANIMATION_FORMATS,
+    AUDIO_FORMATS,
+    FFmpegNotFoundError,
+    JobCancelled,
+    animation_output_args,
+    audio_output_args,
+    ffmpeg_available,
+    find_ffmpeg,
+    find_ffprobe,
+    first_streams,
+    parse_progress,
+    probe_streams,
+    video_output_args,
+)
+
+CHUNK_SIZE = 256 * 1024
+
+# Bytes read ahead from a pipe or buffer to detect the format and probe the streams
+PROBE_BYTES = 4 * 1024 * 1024
+
+# Images piped in are kept in memory up to this size, then spooled to a temporary file
+IMAGE_SPOOL_BYTES = 32 * 1024 * 1024
+
+# ffmpeg muxer per video container
+MUXERS = {"mp4": "mp4", "mov": "mov", "mkv": "matroska", "webm": "webm", "avi": "avi", "flv": "flv", "wmv": "asf"}
+
+# Muxers that need a seekable output unless they write fragments
+FRAGMENTED_MUXERS = ("mp4", "mov", "ipod")
+
+# Codec name used when a stream could not be probed; never matches, so it is re-encoded
+UNKNOWN_CODEC = "unknown"
+
+_PROGRESS_LINE = re.compile(r"^[a-z0-9_]+=")
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable raw reader over a memoryview, so Pillow can read a buffer without copying it."""
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._view[self._position:self._position + len(b)]
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def _local_path(fileobj):
+    """Return the path of the regular file behind a file object (e.g. stdin redirected from a file), or None."""
+    try:
+        fd = fileobj.fileno()
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or fileobj.tell() != 0:
+            return None
+    except (AttributeError, OSError, ValueError):
+        return None
+    try:
+        path = os.readlink(f"/proc/self/fd/{fd}")
+    except OSError:
+        try:
+            import fcntl
+
+            path = fcntl.fcntl(fd, fcntl.F_GETPATH, bytes(1024)).rstrip(b"\0").decode()
+        except (ImportError, AttributeError, OSError):
+            return None
+    try:
+        return path if os.path.samestat(os.stat(path), st) else None
+    except OSError:
+        return None
+
+
+def _resolve(source):
+    """Return ("path", path), ("buffer", memoryview) or ("file", file object) for a source."""
+    if isinstance(source, str) and source == "-":
+        source = sys.stdin.buffer
+    if isinstance(source, (str, os.PathLike)):
+        return "path", os.fspath(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return "buffer", memoryview(source).cast("B")
+    path = _local_path(source)
+    if path is not None:
+        return "path", path
+    return "file", source
+
+
+def _read_head(fileobj, size):
+    """Read up to ``size`` bytes, across short reads from pipes."""
+    chunks, total = [], 0
+    while total < size:
+        chunk = fileobj.read(size - total)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        total += len(chunk)
+    return b"".join(chunks)
+
+
+def needs_seek(head):
+    """Return True for MP4/MOV data whose index (moov) comes after the media (mdat), which a pipe cannot read."""
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], "big")
+        kind = bytes(head[offset + 4:offset + 8])
+        if kind == b"moov":
+            return False
+        if kind == b"mdat":
+            return True
+        if size == 1 and offset + 16 <= len(head):
+            size = int.from_bytes(head[offset + 8:offset + 16], "big")
+        if size < 8:
+            return True
+        offset += size
+    return True
+
+
+def probe_head(head):
+    """Return probe_streams()-style info from the first bytes of a stream, probing them through a pipe."""
+    if find_ffprobe():
+        result = subprocess.run([find_ffprobe(), "-v", "error", "-show_streams", "-show_format", "-of", "json",
+                                 "-i", "pipe:0"], input=head, capture_output=True)
+        if result.returncode == 0:
+            data = json.loads(result.stdout or b"{}")
+            info = {kind: stream and stream.get("codec_name") for kind, stream in first_streams(data).items()}
+            try:
+                info["duration"] = float(data.get("format", {}).get("duration"))
+            except (TypeError, ValueError):
+                info["duration"] = None
+            return info
+    return {"video": UNKNOWN_CODEC, "audio": UNKNOWN_CODEC, "duration": None}
+
+
+def run_ffmpeg_pipe(cmd, feed, output, duration=None, progress=None, cancel=None):
+    """Run ffmpeg with ``feed(stdin)`` writing its input and its stdout copied to ``output``.
+
+    ``feed`` runs on its own thread (None when ffmpeg reads a file itself).
+    Progress comes from "-progress pipe:2" on stderr, since stdout carries
+    the output. Returns the number of bytes written.
+    """
+    cmd = [cmd[0], "-progress", "pipe:2", "-nostats"] + cmd[1:]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE if feed else subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    stderr_tail = collections.deque(maxlen=5)
+
+    def read_stderr():
+        block = {}
+        for raw in process.stderr:
+            line = raw.decode("utf-8", "replace").strip()
+            if not _PROGRESS_LINE.match(line):
+                if line:
+                    stderr_tail.append(line)
+                continue
+            key, _, value = line.partition("=")
+            block[key] = value
+            if key == "progress":
+                if progress:
+                    progress(parse_progress(block, duration))
+                block = {}
+
+    def write_stdin():
+        try:
+            feed(process.stdin)
+        except OSError:
+            # ffmpeg stopped reading: it finished, failed or was cancelled
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=read_stderr, daemon=True)]
+    if feed:
+        threads.append(threading.Thread(target=write_stdin, daemon=True))
+    if cancel is not None:
+        def watch_cancel():
+            while process.poll() is None:
+                if cancel.wait(0.2):
+                    process.terminate()
+                    return
+        threading.Thread(target=watch_cancel, daemon=True).start()
+    for thread in threads:
+        thread.start()
+
+    written = 0
+    try:
+        while True:
+            chunk = process.stdout.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            output.write(chunk)
+            written += len(chunk)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.wait()
+        for thread in threads:
+            thread.join(timeout=1)
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled("Job was cancelled")
+    if process.returncode != 0:
+        tail = "\n".join(stderr_tail)
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {tail}")
+    return written
+
+
+def _for_pipe(args):
+    """Adapt output options for a pipe: fragmented MP4/MOV instead of +faststart, which seeks back."""
+    args = list(args)
+    if "-movflags" in args:
+        index = args.index("-movflags")
+        del args[index:index + 2]
+    muxer = args[args.index("-f") + 1]
+    if muxer in FRAGMENTED_MUXERS:
+        args += ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+    return args
+
+
+def _media_args(category, mode, output_format, streams, quality=None, encoder=None, preset=None, max_size=None,
+                fps=None):
+    """Return the ffmpeg output options of a streamed audio/video job."""
+    from encoders import quality_args, select_encoder
+
+    if category == "audio":
+        if mode == "compress":
+            raise ValueError("Audio cannot be compressed; convert it to a smaller format instead")
+        return _for_pipe(audio_output_args(output_format, streams))
+    if output_format in ANIMATION_FORMATS:
+        return _for_pipe(animation_output_args(output_format, streams, fps, max_size, quality))
+    if output_format in AUDIO_FORMATS:
+        return _for_pipe(audio_output_args(output_format, streams))
+    if output_format not in MUXERS:
+        raise ValueError(f"Cannot stream video as {output_format}")
+    video_args = None
+    if mode == "compress":
+        encoder = encoder or select_encoder(output_format)
+        video_args = quality_args(encoder, quality)
+    args = video_output_args(output_format, streams, video_args, encoder=encoder, preset=preset)
+    return _for_pipe(args + ["-f", MUXERS[output_format]])
+
+
+def _spill(kind, value, head):
+    """Write a buffer or the rest of a pipe to a temporary file and return its path."""
+    with tempfile.NamedTemporaryFile("wb", prefix="convert-py-", suffix=".mp4", delete=False) as f:
+        if kind == "buffer":
+            f.write(value)
+        else:
+            f.write(head)
+            shutil.copyfileobj(value, f, CHUNK_SIZE)
+    return f.name
+
+
+def _stream_media(kind, value, head, category, mode, output_format, output, progress, cancel, **options):
+    if not ffmpeg_available():
+        raise FFmpegNotFoundError("Streaming audio/video needs ffmpeg")
+    spilled = None
+    if kind != "path" and bytes(head[4:8]) == b"ftyp" and needs_seek(head):
+        spilled = _spill(kind, value, head)
+        kind, value = "path", spilled
+    try:
+        if kind == "path":
+            streams = probe_streams(value)
+            cmd = [find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", value]
+            feed = None
+        else:
+            streams = probe_head(head)
+            cmd = [find_ffmpeg(), "-hide_banner", "-y", "-i", "pipe:0"]
+            if kind == "buffer":
+                def feed(pipe):
+                    for start in range(0, len(value), CHUNK_SIZE):
+                        pipe.write(value[start:start + CHUNK_SIZE])
+            else:
+                def feed(pipe):
+                    pipe.write(head)
+                    shutil.copyfileobj(value, pipe, CHUNK_SIZE)
+        if category is None:
+            category = "video" if streams["video"] else "audio"
+        cmd += _media_args(category, mode, output_format, streams, **options) + ["pipe:1"]
+        return run_ffmpeg_pipe(cmd, feed, output, streams["duration"], progress, cancel)
+    finally:
+        if spilled:
+            os.remove(spilled)
+
+
+def _stream_image(kind, value, head, output_format, output, quality=None, max_size=None, progress=None,
+                  cancel=None):
+    def on_stage(percent, stage):
+        if cancel is not None and cancel.is_set():
+            raise JobCancelled("Job was cancelled")
+        if progress:
+            progress({"stage": stage, "percent": percent, "fps": None, "eta": None, "bytes_written": None})
+
+    if kind == "path":
+        with open(value, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError("Input is empty")
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    elif kind == "buffer":
+        source = io.BufferedReader(_BufferReader(value), CHUNK_SIZE)
+    elif value.seekable():
+        value.seek(-len(head), io.SEEK_CUR)
+        source = value
+    else:
+        # Pillow seeks in its input; a large upload must not be held in memory whole
+        source = tempfile.SpooledTemporaryFile(IMAGE_SPOOL_BYTES)
+        source.write(head)
+        shutil.copyfileobj(value, source, CHUNK_SIZE)
+        source.seek(0)
+    buffer = io.BytesIO()
+    try:
+        process_image(source, buffer, output_format, quality, max_size, on_stage)
+    finally:
+        if source is not value:
+            source.close()
+    output.write(buffer.getbuffer())
+    return buffer.tell()
+
+
+def _run(mode, source, output, output_format, category, progress, cancel, **options):
+    kind, value = _resolve(source)
+    if kind == "path":
+        with open(value, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    elif kind == "buffer":
+        head = value[:PROBE_BYTES]
+    else:
+        head = _read_head(value, PROBE_BYTES)
+    sniffed, container = sniff_bytes(head)
+    category = category or sniffed
+    if category not in ("image", "audio", "video") and container not in AV_CONTAINERS:
+        raise ValueError("Unrecognized input; only images, audio and video can be streamed")
+    output_format = (output_format or {"asf": "wmv"}.get(container, container) or "").lower()
+    if not output_format:
+        raise ValueError("Output format is required")
+
+    target = sys.stdout.buffer if isinstance(output, str) and output == "-" else output
+    collect = target is None
+    if collect:
+        target = io.BytesIO()
+    with metrics.job(mode, value if kind == "path" else None, None, mode=mode, category=category,
+                     stream=True) as record:
+        progress = record.wrap_progress(progress)
+        try:
+            if category == "image":
+                written = _stream_image(kind, value, head, output_format, target, options["quality"],
+                                        options["max_size"], progress, cancel)
+            else:
+                written = _stream_media(kind, value, head, category, mode, output_format, target, progress, cancel,
+                                        **options)
+        except BrokenPipeError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Error {'converting' if mode == 'convert' else 'compressing'} stream: {str(e)}")
+        record.add_bytes(written=written)
+        if progress:
+            progress({"stage": "done", "percent": 100.0, "fps": None, "eta": None, "bytes_written": written})
+    if target is sys.stdout.buffer:
+        target.flush()
+    return target.getvalue() if collect else written
+
+
+def convert_stream(source, output_format, output=None, category=None, quality=None, max_size=None, encoder=None,
+                   preset=None, fps=None, progress=None, cancel=None):
+    """Convert ``source`` to ``output_format``.
+
+    Returns the result as bytes, or, when ``output`` is given, writes it
+    there and returns the number of bytes written. ``category`` skips content
+    detection. ``max_size`` caps the longest side of images and animations,
+    ``quality`` sets the image (or animated WebP) quality. ``progress`` and
+    ``cancel`` work as in converter.convert_file.
+    """
+    return _run("convert", source, output, output_format, category, progress, cancel, quality=quality,
+                max_size=max_size, encoder=encoder, preset=preset, fps=fps)
+
+
+def compress_stream(source, quality=75, output=None, output_format=None, category=None, max_size=None,
+                    encoder=None, preset=None, progress=None, cancel=None):
+    """Compress an image or video at ``quality`` (1-100), keeping its format unless ``output_format`` is given.
+
+    ``max_size`` caps the longest side of images. Returns bytes or the number
+    of bytes written to ``output``, like convert_stream().
+    """
+    return _run("compress", source, output, output_format, category, progress, cancel, quality=quality,
+                max_size=max_size, encoder=encoder, preset=preset, fps=None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert or compress a file or stdin to a file or stdout.")
+    parser.add_argument("input", help='Input file, or "-" for stdin')
+    parser.add_argument("output", help='Output file, or "-" for stdout')
+    parser.add_argument("--mode", choices=["convert", "compress"], default="convert")
+    parser.add_argument("--to", dest="output_format",
+                        help="Output format (default: the output file's extension, or the input's format when "
+                             "compressing)")
+    parser.add_argument("--category", choices=["image", "audio", "video"],
+                        help="Input category (default: detected from the content)")
+    parser.add_argument("--quality", type=int, help="Compression quality (1-100; default 75 when compressing)")
+    parser.add_argument("--max-size", type=int, help="Shrink images and animations to at most N pixels")
+    parser.add_argument("--fps", type=int, help="Frame rate of video-to-GIF/WebP animations (default 12)")
+    parser.add_argument("--encoder", help="Video encoder override (e.g. libx264, h264_nvenc)")
+    parser.add_argument("--preset", help="Encoder preset override (e.g. veryfast, p4)")
+    args = parser.parse_args(argv)
+
+    output_format = args.output_format
+    if not output_format and args.output != "-":
+        output_format = os.path.splitext(args.output)[1][1:] or None
+    if args.mode == "convert" and not output_format:
+        parser.error("--to is required when writing to stdout")
+
+    output = "-" if args.output == "-" else open(args.output, "wb")
+    try:
+        if args.mode == "convert":
+            convert_stream(args.input, output_format, output, args.category, args.quality, args.max_size,
+                           args.encoder, args.preset, args.fps)
+        else:
+            compress_stream(args.input, args.quality or 75, output, output_format, args.category, args.max_size,
+                            args.encoder, args.preset)
+    except BrokenPipeError:
+        # The next command in the pipeline exited; nothing left to report
+        return 1
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        if output != "-":
+            output.close()
+            os.remove(args.output)
+        return 1
+    finally:
+        if output != "-" and not output.closed:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Target-size compression ("make this at most 8 MB").
+
+Images binary-search the encoder quality (JPEG/WebP/HEIF) or, for lossless
+formats, the scale factor, encoding each trial into memory rather than to
+disk. Videos derive the bitrate from the duration and encode in two passes.
+Both return a report with the number of trial encodes, which is bounded.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+
+from images import QUALITY_FORMATS, draft_for_size, fit, pil_format, prepare_mode, save_kwargs
+from transcode import audio_codec_args, find_ffmpeg, probe_streams, run_ffmpeg
+
+DEFAULT_MAX_TRIALS = 8
+
+# Share of the size budget kept free for container overhead
+CONTAINER_OVERHEAD = 0.03
+
+# Below this the result is unwatchable; refuse instead of producing mush
+MIN_VIDEO_BITRATE = 50_000
+
+AUDIO_BITRATE = 128_000
+
+
+def parse_size(value):
+    """Parse "8MB", "500k", "1.5G" or a plain byte count into bytes."""
+    value = str(value).strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+
+def _encode(img, output_format, quality=None):
+    buffer = io.BytesIO()
+    prepare_mode(img, output_format).save(buffer, **save_kwargs(img, output_format, quality))
+    return buffer.getvalue()
+
+
+def compress_image_to_size(input_path, output_path, target_size, max_trials=DEFAULT_MAX_TRIALS, max_size=None,
+                           on_trial=None):
+    """Write the best image that fits in ``target_size`` bytes and return a report.
+
+    ``on_trial(trials, max_trials)`` is called after every trial encode.
+    """
+    from PIL import Image
+
+    output_format = os.path.splitext(output_path)[1][1:].lower()
+    report = {"target_size": target_size, "trials": 0, "max_trials": max_trials}
+
+    with Image.open(input_path) as img:
+        if img.format == pil_format(output_format) and os.path.getsize(input_path) <= target_size and not max_size:
+            shutil.copyfile(input_path, output_path)
+            report.update(size=os.path.getsize(output_path), met=True, setting="original")
+            return report
+        draft_for_size(img, max_size)
+        img.load()
+        fit(img, max_size)
+
+        best = None      # largest encode that fits
+        smallest = None  # fallback if nothing fits
+
+        def trial(data):
+            nonlocal smallest
+            report["trials"] += 1
+            if smallest is None or len(data) < len(smallest):
+                smallest = data
+            if on_trial:
+                on_trial(report["trials"], max_trials)
+            return len(data) <= target_size
+
+        if pil_format(output_format) in QUALITY_FORMATS:
+            low, high = 1, 95
+            while low <= high and report["trials"] < max_trials:
+                quality = (low + high) // 2
+                data = _encode(img, output_format, quality)
+                if trial(data):
+                    best, report["setting"] = data, f"quality={quality}"
+                    low = quality + 1
+                else:
+                    high = quality - 1
+        else:
+            # Lossless format: search the largest scale factor that fits
+            data = _encode(img, output_format)
+            if trial(data):
+                best, report["setting"] = data, "scale=1.00"
+            else:
+                low, high = 0.0, 1.0
+                while report["trials"] < max_trials:
+                    scale = (low + high) / 2
+                    scaled = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))),
+                                        Image.LANCZOS, reducing_gap=2.0)
+                    scaled.info = img.info
+                    data = _encode(scaled, output_format)
+                    # Output size grows with the scale, so every fit beats the previous one
+                    if trial(data):
+                        best, report["setting"] = data, f"scale={scale:.2f}"
+                        low = scale
+                    else:
+                        high = scale
+
+    data = best if best is not None else smallest
+    with open(output_path, "wb") as f:
+        f.write(data)
+    report.update(size=len(data), met=best is not None)
+    report.setdefault("setting", "smallest")
+    return report
+
+
+def compress_video_to_size(input_path, output_path, target_size, encoder=None, preset=None, progress=None,
+                           cancel=None, streams=None):
+    """Encode a video to fit in ``target_size`` bytes and return a report.
+
+    The video bitrate is derived from the duration after reserving room for
+    audio and container overhead. Software encoders run two passes; hardware
+    encoders run a single capped-bitrate pass.
+    """
+    from encoders import select_encoder, two_pass_args, video_encoder_args
+
+    output_format = os.path.splitext(output_path)[1][1:].lower()
+    streams = streams or probe_streams(input_path)
+    if not streams["duration"]:
+        raise ValueError("Cannot determine the video duration")
+    encoder = encoder or select_encoder(output_format)
+
+    audio_bitrate = AUDIO_BITRATE if streams["audio"] is not None else 0
+    budget_bits = target_size * 8 * (1 - CONTAINER_OVERHEAD)
+    video_bitrate = int(budget_bits / streams["duration"] - audio_bitrate)
+    if video_bitrate < MIN_VIDEO_BITRATE:
+        raise ValueError(f"Target size is too small for a {streams['duration']:.0f}s video")
+
+    rate_args = ["-b:v", str(video_bitrate), "-maxrate", str(int(video_bitrate * 1.5)),
+                 "-bufsize", str(video_bitrate * 2)]
+    audio_args = audio_codec_args(streams, output_format, ["-b:a", str(audio_bitrate)], force_encode=True)
+    base = [find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", input_path]
+    codec_args = video_encoder_args(output_format, encoder, preset)
+    report = {"target_size": target_size, "video_bitrate": video_bitrate, "audio_bitrate": audio_bitrate,
+              "encoder": encoder, "max_trials": 2}
+
+    def scaled(offset):
+        if progress is None:
+            return None
+        def forward(event):
+            if event["percent"] is not None:
+                event = dict(event, percent=offset + event["percent"] / 2)
+            progress(event)
+        return forward
+
+    log_dir = tempfile.mkdtemp(prefix=".passlog-", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        log_prefix = os.path.join(log_dir, "pass")
+        first_pass = two_pass_args(encoder, 1, log_prefix)
+        if first_pass is None:
+            run_ffmpeg(base + codec_args + rate_args + audio_args + [output_path],
+                       streams["duration"], progress, cancel)
+            report["trials"] = 1
+        else:
+            run_ffmpeg(base + codec_args + rate_args + first_pass + ["-an", "-f", "null", os.devnull],
+                       streams["duration"], scaled(0), cancel)
+            run_ffmpeg(base + codec_args + rate_args + two_pass_args(encoder, 2, log_prefix) + audio_args
+                       + [output_path], streams["duration"], scaled(50), cancel)
+            report["trials"] = 2
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+    report["size"] = os.path.getsize(output_path)
+    report["met"] = report["size"] <= target_size
+    return report
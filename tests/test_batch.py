@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+
+import pytest
+
+import batch
+from batch import build_job, format_result
+from scheduler import Scheduler
+
+
+def result(**fields):
+    return dict({"input": "in.pdf", "output": "out.pdf", "mode": "compress", "status": "ok", "seconds": 1.5},
+                **fields)
+
+
+def test_format_document_compress_report():
+    line = format_result(result(report={"images": 3, "input_size": 4 * 1024 ** 2, "size": 1024 ** 2}))
+    assert line == "[ok] in.pdf -> out.pdf (1.5s) Size: 1.00 MB (was 4.00 MB), 3 image(s) recompressed"
+
+
+def test_format_target_size_report():
+    report = {"target_size": 2 * 1024 ** 2, "trials": 4, "max_trials": 8, "size": 1024 ** 2, "met": True}
+    assert format_result(result(report=report)).endswith("Size: 1.00 MB (target 2.00 MB) after 4 trial encode(s)")
+
+
+def test_format_failure():
+    assert format_result(result(status="failed", error="boom")) == "[failed] in.pdf -> out.pdf (1.5s): boom"
+
+
+fork_only = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                               reason="workers must inherit the patched convert_file")
+
+
+def fake_convert(input_path, output_path, *args, **kwargs):
+    if os.path.basename(input_path).startswith("crash"):
+        # Die the way an OOM-killed worker does
+        os._exit(1)
+    with open(output_path, "wb") as f:
+        f.write(b"converted")
+
+
+def image_job(tmp_path, name):
+    return {"input": str(tmp_path / name), "output": str(tmp_path / "out" / f"{name}.png"), "mode": "convert",
+            "category": "image", "format": "png"}
+
+
+@fork_only
+def test_batch_survives_a_dead_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "convert_file", fake_convert)
+    jobs = [image_job(tmp_path, name) for name in ("a", "crash", "b", "c")]
+    summary = batch.run_batch(jobs, workers=1, retries=1, max_pending=1)
+    statuses = {os.path.basename(r["input"]): (r["status"], r["attempts"]) for r in summary["results"]}
+    assert statuses == {"a": ("ok", 1), "crash": ("failed", 2), "b": ("ok", 1), "c": ("ok", 1)}
+
+
+@fork_only
+def test_batch_survives_a_dead_worker_with_a_scheduler(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "convert_file", fake_convert)
+    jobs = [image_job(tmp_path, name) for name in ("crash", "a", "b")]
+    summary = batch.run_batch(jobs, workers=2, retries=0, scheduler=Scheduler(cpu_slots=2, memory=0))
+    assert summary["total"] == 3
+    assert [r["status"] for r in summary["results"] if "crash" in r["input"]] == ["failed"]
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / "photo.png"
+    path.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 32)
+    return str(path)
+
+
+def test_build_job_detects_the_category_and_names_the_output(photo, tmp_path):
+    job = build_job(photo, output_format="webp")
+    assert (job["category"], job["mode"], job["quality"]) == ("image", "convert", 75)
+    assert job["output"] == str(tmp_path / "photo_converted.webp")
+    assert build_job(photo, mode="compress", output_dir="out")["output"] == os.path.join("out", "photo_compressed.png")
+
+
+def test_build_job_keeps_manifest_fields(photo):
+    job = build_job({"input": photo, "format": "jpg", "quality": 50, "output": "x.jpg"}, output_format="webp")
+    assert (job["format"], job["quality"], job["output"]) == ("jpg", 50, "x.jpg")
+
+
+def test_build_job_expands_several_formats(photo, tmp_path):
+    job = build_job(photo, output_format="jpg,webp:320")
+    assert [(target["format"], target["max_size"]) for target in job["targets"]] == [("jpg", None), ("webp", 320)]
+    assert job["output"] == f"{tmp_path / 'photo_converted.jpg'}, {tmp_path / 'photo_converted_320.webp'}"
+
+
+def test_build_job_skips_what_it_cannot_process(photo, tmp_path):
+    notes = tmp_path / "notes.txt"
+    notes.write_text("hello")
+    assert build_job(str(notes), output_format="png") is None
+    assert build_job(photo) is None
+    with pytest.raises(ValueError):
+        build_job(photo, mode="resize")
@@ -0,0 +1,124 @@
+import os
+
+import converter
+from cache import ConversionCache, clone_file
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_store_and_fetch(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"))
+    write(tmp_path / "in.png", b"input")
+    write(tmp_path / "out.webp", b"result")
+    key = cache.job_key(str(tmp_path / "in.png"), "convert", str(tmp_path / "out.webp"), format="webp")
+    cache.store(key, str(tmp_path / "out.webp"))
+
+    assert cache.fetch(key, str(tmp_path / "again.webp"))
+    assert read(tmp_path / "again.webp") == b"result"
+    assert not cache.fetch("missing", str(tmp_path / "missing.webp"))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_overwriting_an_output_keeps_the_cached_result(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"))
+    write(tmp_path / "in.png", b"input")
+    write(tmp_path / "out.webp", b"first")
+    key = cache.job_key(str(tmp_path / "in.png"), "convert", str(tmp_path / "out.webp"))
+    cache.store(key, str(tmp_path / "out.webp"))
+
+    # A later job writing the same output path in place must not touch the entry
+    with open(tmp_path / "out.webp", "r+b") as f:
+        f.write(b"second")
+    assert cache.fetch(key, str(tmp_path / "fetched.webp"))
+    assert read(tmp_path / "fetched.webp") == b"first"
+
+    write(tmp_path / "fetched.webp", b"edited")
+    assert cache.fetch(key, str(tmp_path / "fetched2.webp"))
+    assert read(tmp_path / "fetched2.webp") == b"first"
+
+
+def test_clone_file_never_hardlinks(tmp_path):
+    write(tmp_path / "src", b"data")
+    write(tmp_path / "dst", b"old")
+    assert clone_file(str(tmp_path / "src"), str(tmp_path / "dst")) in ("reflink", "copy")
+    assert read(tmp_path / "dst") == b"data"
+    assert os.stat(tmp_path / "src").st_nlink == 1
+
+
+def test_key_depends_on_content_and_settings(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"))
+    write(tmp_path / "in.png", b"input")
+    path, output = str(tmp_path / "in.png"), str(tmp_path / "out.jpg")
+    key = cache.job_key(path, "compress", output, quality=80)
+
+    assert cache.job_key(path, "compress", output, quality=80) == key
+    assert cache.job_key(path, "compress", output, quality=70) != key
+    assert cache.job_key(path, "compress", str(tmp_path / "out.webp"), quality=80) != key
+    assert cache.job_key(path, "compress", output, quality=80, encoder=None) == key
+    write(tmp_path / "in.png", b"changed")
+    assert cache.job_key(path, "compress", output, quality=80) != key
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"), max_bytes=10)
+    for name in ("a", "b"):
+        write(tmp_path / name, b"12345")
+        cache.store(name, str(tmp_path / name))
+    assert cache.fetch("a", str(tmp_path / "a2"))
+
+    write(tmp_path / "c", b"12345")
+    cache.store("c", str(tmp_path / "c"))
+    assert not cache.fetch("b", str(tmp_path / "b2"))
+    assert cache.fetch("a", str(tmp_path / "a3"))
+    assert cache.total_bytes == 10
+    assert sorted(os.listdir(tmp_path / "cache")) == ["a", "c", "index.json"]
+
+
+def test_index_survives_reopening(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"))
+    write(tmp_path / "out.png", b"result")
+    cache.store("key", str(tmp_path / "out.png"))
+
+    reopened = ConversionCache(str(tmp_path / "cache"))
+    assert reopened.fetch("key", str(tmp_path / "copy.png"))
+    assert read(tmp_path / "copy.png") == b"result"
+
+
+def test_report_is_stored_with_the_result(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"))
+    write(tmp_path / "out.jpg", b"result")
+    cache.store("key", str(tmp_path / "out.jpg"), {"size": 6, "trials": 3})
+    cache.store("plain", str(tmp_path / "out.jpg"))
+
+    reopened = ConversionCache(str(tmp_path / "cache"))
+    assert reopened.report("key") == {"size": 6, "trials": 3}
+    assert reopened.report("plain") is None
+    assert reopened.report("missing") is None
+
+
+def test_target_size_compress_returns_its_report_from_the_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def compress_image(input_path, output_path, quality, progress, cancel, max_size, target_size):
+        calls.append(input_path)
+        write(output_path, b"small")
+        return {"target_size": target_size, "trials": 4, "size": 5}
+
+    monkeypatch.setattr(converter, "compress_image", compress_image)
+    monkeypatch.setattr(converter, "inspect_input", lambda path, category: {})
+    cache = ConversionCache(str(tmp_path / "cache"))
+    write(tmp_path / "in.jpg", b"input")
+    args = (str(tmp_path / "in.jpg"), str(tmp_path / "out.jpg"), "image", 75)
+
+    fresh = converter.compress_file(*args, cache=cache, target_size=100)
+    cached = converter.compress_file(*args, cache=cache, target_size=100)
+    assert len(calls) == 1
+    assert cached == fresh == {"target_size": 100, "trials": 4, "size": 5}
@@ -0,0 +1,7 @@
+from benchmarks.import_time import DEFAULT_BUDGET_MS, DEFAULT_MODULES, HEAVY_MODULES, measure
+
+
+def test_core_import_stays_within_budget():
+    total_us, imported = measure(list(DEFAULT_MODULES), runs=3)
+    assert not set(HEAVY_MODULES) & imported
+    assert total_us / 1000 <= DEFAULT_BUDGET_MS
@@ -0,0 +1,36 @@
+import jobs
+from jobs import Job
+from transcode import JobCancelled
+
+
+def test_failed_document_conversion_removes_page_files(tmp_path, monkeypatch):
+    output = str(tmp_path / "doc_converted.png")
+    pages = [str(tmp_path / f"doc_converted-{n:03d}.png") for n in (1, 2, 3)]
+
+    def convert_file(input_path, output_path, category, output_format, **kwargs):
+        for page in pages[:2]:
+            open(page, "wb").close()
+        raise JobCancelled("Job was cancelled")
+
+    monkeypatch.setattr(jobs, "convert_file", convert_file)
+    monkeypatch.setattr(jobs, "page_count", lambda path: 3)
+    job = Job("convert", str(tmp_path / "doc.pdf"), output, "document", output_format="png")
+    job.run()
+    assert job.status == "cancelled"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_job_removes_its_output(tmp_path, monkeypatch):
+    output = tmp_path / "out.jpg"
+
+    def compress_file(input_path, output_path, category, quality, **kwargs):
+        output.write_bytes(b"partial")
+        raise ValueError("Error during compression: boom")
+
+    monkeypatch.setattr(jobs, "compress_file", compress_file)
+    events = []
+    job = Job("compress", str(tmp_path / "in.jpg"), str(output), "image", quality=50)
+    job.subscribe(events.append)
+    job.run()
+    assert job.status == "failed" and events[-1]["type"] == "failed"
+    assert not output.exists()
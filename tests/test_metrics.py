@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import metrics
+from transcode import JobCancelled
+
+
+@pytest.fixture
+def enabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "_enabled", True)
+    monkeypatch.setenv(metrics.ENV_LOG, str(tmp_path / "metrics.log"))
+    monkeypatch.setattr(metrics, "_counters", metrics.collections.defaultdict(float))
+
+
+def job_count(status):
+    return sum(value for (name, labels), value in metrics._counters.items()
+               if name == "convert_py_jobs_total" and dict(labels)["status"] == status)
+
+
+def test_cancelled_and_failed_jobs(enabled):
+    with pytest.raises(JobCancelled):
+        with metrics.job("convert", mode="convert", category="video"):
+            raise JobCancelled("Job was cancelled")
+    with pytest.raises(ValueError):
+        with metrics.job("convert", mode="convert", category="video"):
+            raise ValueError("boom")
+    assert job_count("cancelled") == 1 and job_count("failed") == 1
+
+
+def test_stages_from_progress_events(enabled):
+    with metrics.job("convert", mode="convert", category="image") as record:
+        progress = record.wrap_progress(None)
+        progress({"stage": "decode", "fps": 30.0})
+        with record.stage("encode"):
+            pass
+    assert set(record.stages) == {"decode", "encode"}
+    assert job_count("ok") == 1
+
+
+def test_only_one_job_is_profiled_at_a_time(tmp_path, capsys):
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    with metrics.job("convert", profile=str(first)):
+        with metrics.job("convert", profile=str(second)):
+            pass
+    assert len(os.listdir(first)) == 1 and os.listdir(second) == []
+    assert "already being profiled" in capsys.readouterr().err
+
+    # The lock is released, so the next job is profiled again
+    with metrics.job("convert", profile=str(second)):
+        pass
+    assert len(os.listdir(second)) == 1
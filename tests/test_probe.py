@@ -0,0 +1,79 @@
+import pytest
+
+import probe
+from probe import SNIFF_BYTES, detect_category, probe_media, sniff, sniff_bytes
+
+
+@pytest.mark.parametrize("head, expected", [
+    (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR", ("image", "png")),
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF", ("image", "jpeg")),
+    (b"GIF89a\x01\x00", ("image", "gif")),
+    (b"II*\x00\x08\x00", ("image", "tiff")),
+    (b"BM\x36\x00", ("image", "bmp")),
+    (b"RIFF\x24\x00\x00\x00WEBPVP8 ", ("image", "webp")),
+    (b"RIFF\x24\x00\x00\x00WAVEfmt ", ("audio", "wav")),
+    (b"RIFF\x24\x00\x00\x00AVI LIST", ("video", "avi")),
+    (b"RIFF\x24\x00\x00\x00XXXX", (None, None)),
+    (b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00", ("video", "mp4")),
+    (b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00", ("image", "heif")),
+    (b"\x00\x00\x00\x20ftypM4A \x00\x00\x00\x00", ("audio", "m4a")),
+    (b"\x00\x00\x00\x14ftypqt  \x00\x00\x02\x00", ("video", "mov")),
+    (b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\x82\x88matroska", (None, "mkv")),
+    (b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\x82\x84webm", (None, "webm")),
+    (b"OggS\x00\x02" + b"\x00" * 22 + b"OpusHead", ("audio", "opus")),
+    (b"OggS\x00\x02" + b"\x00" * 22 + b"\x01vorbis", ("audio", "ogg")),
+    (b"fLaC\x00\x00\x00\x22", ("audio", "flac")),
+    (b"ID3\x04\x00", ("audio", "mp3")),
+    (b"\xff\xfb\x90\x64", ("audio", "mp3")),
+    (b"\xff\xf1\x50\x80", ("audio", "aac")),
+    (b"%PDF-1.7\n", ("document", "pdf")),
+    (b"FLV\x01\x05", ("video", "flv")),
+    (b"\x30\x26\xb2\x75\x8e\x66\xcf\x11\xa6\xd9", (None, "asf")),
+    (b"PK\x03\x04\x14\x00", (None, None)),
+    (b"plain text", (None, None)),
+    (b"", (None, None)),
+])
+def test_sniff_bytes(head, expected):
+    assert sniff_bytes(head) == expected
+
+
+def test_sniff_bytes_accepts_buffers():
+    head = b"\x89PNG\r\n\x1a\n" + b"\x00" * SNIFF_BYTES
+    assert sniff_bytes(memoryview(head)) == ("image", "png")
+    assert sniff_bytes(bytearray(head)) == ("image", "png")
+
+
+def test_sniff_ignores_the_extension(tmp_path):
+    path = tmp_path / "photo.mp3"
+    path.write_bytes(b"\xff\xd8\xff\xe1\x00\x18Exif")
+    assert sniff(str(path)) == ("image", "jpeg")
+
+
+MKV = b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\x82\x88matroska"
+
+
+def test_streams_decide_the_category_of_an_mkv(tmp_path, monkeypatch):
+    path = tmp_path / "song.mka"
+    path.write_bytes(MKV)
+    monkeypatch.setattr(probe, "find_ffprobe", lambda: "ffprobe")
+    monkeypatch.setattr(probe, "ffprobe_json", lambda path: {
+        "format": {"format_name": "matroska,webm", "duration": "3.5"},
+        "streams": [{"codec_type": "audio", "codec_name": "opus", "channels": 2, "sample_rate": "48000"}],
+    })
+    info = probe_media(str(path))
+    assert (info["category"], info["container"], info["audio"]) == ("audio", "mkv", "opus")
+
+    monkeypatch.setattr(probe, "default_index", lambda: probe.MetadataIndex(str(tmp_path / "index.json")))
+    assert detect_category(str(path)) == "audio"
+
+
+def test_unprobed_mkv_falls_back_to_the_extension(tmp_path, monkeypatch):
+    path = tmp_path / "clip.mkv"
+    path.write_bytes(MKV)
+
+    def unreadable(path):
+        raise ValueError("Not a recognized media file")
+
+    monkeypatch.setattr(probe, "default_index", lambda: type("Index", (), {"get": staticmethod(unreadable)})())
+    assert detect_category(str(path)) == "video"
+
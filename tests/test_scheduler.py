@@ -0,0 +1,196 @@
+import heapq
+import os
+import sys
+import threading
+import time
+
+from scheduler import DEFAULT_IMAGE_PIXELS, MB, Scheduler, _Entry, estimate_cost, physical_memory
+
+
+def queue(scheduler, category, cpu, priority=0, memory=0):
+    """Queue an entry without dispatching it, so the test decides when _dispatch runs."""
+    cost = scheduler._clamp(category, {"cpu": cpu, "memory": memory})
+    entry = _Entry(next(scheduler._seq), category, cost, priority, None, lambda entry: None)
+    heapq.heappush(scheduler._queues[category], entry)
+    return entry
+
+
+def dispatch(scheduler):
+    with scheduler._lock:
+        return scheduler._dispatch()
+
+
+def test_higher_priority_goes_first():
+    scheduler = Scheduler(cpu_slots=1, memory=0)
+    low = queue(scheduler, "image", 1)
+    high = queue(scheduler, "audio", 1, priority=5)
+    assert dispatch(scheduler) == [high]
+    scheduler._release(high)
+    assert low.started is not None
+
+
+def test_fifo_within_a_category():
+    scheduler = Scheduler(cpu_slots=1, memory=0)
+    first, second = queue(scheduler, "image", 1), queue(scheduler, "image", 1)
+    assert dispatch(scheduler) == [first]
+    assert second.started is None
+
+
+def test_least_used_category_is_served_next():
+    scheduler = Scheduler(cpu_slots=4, memory=0)
+    video1 = queue(scheduler, "video", 2)
+    video2 = queue(scheduler, "video", 2)
+    image1 = queue(scheduler, "image", 1)
+    image2 = queue(scheduler, "image", 1)
+    # The images are admitted next to the first video instead of queueing behind the second
+    assert dispatch(scheduler) == [video1, image1, image2]
+    assert video2.started is None
+
+
+def test_category_limit():
+    scheduler = Scheduler(cpu_slots=4, memory=0)
+    assert scheduler.limits["video"]["cpu"] == 3
+    first = queue(scheduler, "video", 2)
+    queue(scheduler, "video", 2)
+    image = queue(scheduler, "image", 2)
+    assert dispatch(scheduler) == [first, image]
+
+
+def test_memory_budget():
+    scheduler = Scheduler(cpu_slots=8, memory=1000)
+    first = queue(scheduler, "image", 1, memory=600)
+    queue(scheduler, "image", 1, memory=600)
+    small = queue(scheduler, "audio", 1, memory=300)
+    assert dispatch(scheduler) == [first, small]
+
+
+def test_max_jobs():
+    scheduler = Scheduler(cpu_slots=8, memory=0, max_jobs=2)
+    entries = [queue(scheduler, "image", 1) for _ in range(3)]
+    assert dispatch(scheduler) == entries[:2]
+
+
+def test_oversized_job_is_clamped_and_runs_alone():
+    scheduler = Scheduler(cpu_slots=2, memory=100)
+    big = queue(scheduler, "video", 64, memory=10 ** 9)
+    assert big.cost == {"cpu": 1, "memory": 75}
+    small = queue(scheduler, "image", 1)
+    assert dispatch(scheduler) == [big, small]
+
+    scheduler = Scheduler(cpu_slots=2, memory=0)
+    huge = queue(scheduler, "image", 64)
+    assert huge.cost["cpu"] == 2
+    assert dispatch(scheduler) == [huge]
+
+
+def test_starving_job_reserves_resources():
+    scheduler = Scheduler(cpu_slots=4, memory=0, max_wait=10)
+    running = queue(scheduler, "image", 2)
+    assert dispatch(scheduler) == [running]
+
+    big = queue(scheduler, "document", 3)
+    big.queued -= 60
+    small = queue(scheduler, "image", 1)
+    # The small job would fit, but the starving one holds the slots back
+    assert dispatch(scheduler) == []
+    scheduler._release(running)
+    assert big.started is not None and small.started is not None
+
+
+def test_submit_runs_when_admitted():
+    scheduler = Scheduler(cpu_slots=1, memory=0)
+    lease = scheduler.acquire("image", {"cpu": 1})
+    future = scheduler.submit(lambda: "done", category="image", cost={"cpu": 1})
+    time.sleep(0.05)
+    assert not future.done()
+    assert scheduler.stats()["queued"] == 1
+    lease.release()
+    assert future.result(timeout=5) == "done"
+    stats = scheduler.stats()
+    assert stats["running"] == 0 and stats["categories"]["image"]["completed"] == 2
+
+
+def test_acquire_timeout_leaves_the_queue():
+    scheduler = Scheduler(cpu_slots=1, memory=0)
+    with scheduler.acquire("image", {"cpu": 1}):
+        assert scheduler.acquire("image", {"cpu": 1}, timeout=0.05) is None
+        assert scheduler.queued() == 0
+    assert scheduler.stats()["cpu_used"] == 0
+
+
+def test_concurrent_acquires_never_exceed_the_budget():
+    scheduler = Scheduler(cpu_slots=3, memory=0)
+    lock, active, peak = threading.Lock(), [0], [0]
+
+    def work():
+        with scheduler.acquire("image", {"cpu": 1}):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] <= 3
+
+
+def test_estimate_cost():
+    assert estimate_cost("image", {"width": 1000, "height": 1000})["cpu"] == 1
+    small = estimate_cost("image", {"width": 100, "height": 100})["memory"]
+    assert estimate_cost("image", {"width": 4000, "height": 4000})["memory"] > small
+    assert estimate_cost("download")["cpu"] == 1
+
+
+def test_estimate_image_cost():
+    # Decoded RGBA source plus a converted copy on top of the base
+    assert estimate_cost("image", {"width": 1000, "height": 500}) == {"cpu": 1, "memory": 32 * MB + 4_000_000}
+    # Without dimensions the file size stands in, and without that a 12 MP default
+    assert estimate_cost("image", {"size": 4000})["memory"] == 32 * MB + 80_000
+    assert estimate_cost("image")["memory"] == 32 * MB + DEFAULT_IMAGE_PIXELS * 8
+
+
+def test_estimate_video_cost():
+    cpus = os.cpu_count() or 1
+    meta = {"video": "h264", "width": 1920, "height": 1080, "duration": 60}
+    # A remux only copies packets
+    assert estimate_cost("video", meta, output_format="mkv") == {"cpu": 1, "memory": 192 * MB}
+    assert estimate_cost("video", meta, mode="compress", output_format="mp4", segmented=False)["cpu"] == min(cpus, 4)
+    assert estimate_cost("video", meta, output_format="gif", segmented=False)["cpu"] == min(cpus, 4)
+    assert estimate_cost("video", meta, output_format="webm", segmented=True)["cpu"] == cpus
+    bigger = estimate_cost("video", dict(meta, width=3840, height=2160), output_format="webm", segmented=False)
+    assert bigger["memory"] > estimate_cost("video", meta, output_format="webm", segmented=False)["memory"]
+
+
+def test_estimate_document_and_audio_cost():
+    cpus = os.cpu_count() or 1
+    assert estimate_cost("document", mode="compress") == {"cpu": 1, "memory": 160 * MB}
+    assert estimate_cost("document", output_format="png") == {"cpu": cpus, "memory": 96 * MB + cpus * 32 * MB}
+    assert estimate_cost("audio", {"duration": 3600}) == {"cpu": 1, "memory": 64 * MB}
+
+
+def test_physical_memory():
+    total = physical_memory()
+    assert total is None or total > 0
+    if sys.platform == "win32" or hasattr(os, "sysconf"):
+        assert total > 0
+
+
+def test_unknown_memory_disables_the_budget_with_a_warning(monkeypatch, capsys):
+    monkeypatch.setattr("scheduler.physical_memory", lambda: None)
+    assert Scheduler(cpu_slots=2).memory is None
+    assert "memory budget is disabled" in capsys.readouterr().err
+
+
+def test_windows_fallback_without_kernel32(monkeypatch):
+    # Off Windows there is no ctypes.windll; the fallback reports "unknown" instead of raising
+    windows = sys.platform == "win32"
+    monkeypatch.setattr(sys, "platform", "win32")
+    if windows:
+        assert physical_memory() > 0
+    else:
+        assert physical_memory() is None
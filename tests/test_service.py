@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+from service import JobService
+
+
+def request(raw, tmp_path):
+    """Send a raw HTTP request to a JobService and return (status, body)."""
+    async def run():
+        service = JobService(str(tmp_path))
+        server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split(b" ")[1]), body
+
+    return asyncio.run(run())
+
+
+def test_stats(tmp_path):
+    status, body = request(b"GET /stats HTTP/1.1\r\n\r\n", tmp_path)
+    stats = json.loads(body)
+    assert status == 200
+    assert stats["running"] == 0 and stats["cpu_slots"] >= 1
+
+
+def test_invalid_content_length(tmp_path):
+    status, body = request(b"POST /convert?to=png HTTP/1.1\r\nContent-Length: ten\r\n\r\n", tmp_path)
+    assert status == 400
+    assert json.loads(body) == {"error": "Invalid Content-Length"}
+
+
+def test_missing_content_length(tmp_path):
+    status, _ = request(b"POST /jobs?mode=convert&filename=a.png&to=jpg HTTP/1.1\r\n\r\n", tmp_path)
+    assert status == 411
+
+
+def test_unknown_path(tmp_path):
+    status, _ = request(b"GET /nothing HTTP/1.1\r\n\r\n", tmp_path)
+    assert status == 404
+
+
+def test_audio_compress_is_rejected(tmp_path):
+    status, body = request(b"POST /jobs?mode=compress&filename=talk.mp3 HTTP/1.1\r\nContent-Length: 4\r\n\r\nID3\x04",
+                           tmp_path)
+    assert status == 400
+    assert "cannot be compressed" in json.loads(body)["error"]
+
+
+def test_audio_compress_is_rejected_by_content(tmp_path):
+    wav = b"RIFF\x24\x00\x00\x00WAVEfmt " + b"\x00" * 16
+    raw = b"POST /jobs?mode=compress&filename=upload.bin HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(wav) + wav
+    status, body = request(raw, tmp_path)
+    assert status == 400
+    assert "cannot be compressed" in json.loads(body)["error"]
+    assert list(tmp_path.iterdir()) == []
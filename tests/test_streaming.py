@@ -0,0 +1,68 @@
+import io
+import tempfile
+
+import pytest
+
+import streaming
+from streaming import _for_pipe, _read_head, _stream_image, needs_seek
+
+
+class Pipe(io.RawIOBase):
+    """A non-seekable reader, like stdin from a pipe or an HTTP request body."""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._data.readinto(b)
+
+
+def test_piped_image_is_spooled_not_held_in_memory(monkeypatch):
+    data = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 1024
+    seen = {}
+
+    def process_image(source, output, output_format, quality, max_size, on_stage):
+        seen["rolled"] = isinstance(source, tempfile.SpooledTemporaryFile) and source._rolled
+        output.write(source.read())
+        return "encoded"
+
+    monkeypatch.setattr(streaming, "process_image", process_image)
+    monkeypatch.setattr(streaming, "IMAGE_SPOOL_BYTES", 64 * 1024)
+    pipe = io.BufferedReader(Pipe(data))
+    output = io.BytesIO()
+    head = _read_head(pipe, 1024)
+    assert _stream_image("file", pipe, head, "png", output) == len(data)
+    assert output.getvalue() == data
+    assert seen["rolled"]
+
+
+def box(kind, payload=b""):
+    return (8 + len(payload)).to_bytes(4, "big") + kind + payload
+
+
+@pytest.mark.parametrize("head, expected", [
+    (box(b"ftyp", b"isom\x00\x00\x02\x00") + box(b"moov", b"\x00" * 16) + box(b"mdat"), False),
+    (box(b"ftyp", b"isom\x00\x00\x02\x00") + box(b"free") + box(b"mdat", b"\x00" * 16) + box(b"moov"), True),
+    # A 64-bit box size, then moov
+    (box(b"ftyp", b"isom") + (1).to_bytes(4, "big") + b"wide" + (24).to_bytes(8, "big") + b"\x00" * 8
+     + box(b"moov"), False),
+    # The head ends before either box shows up
+    (box(b"ftyp", b"isom") + (4096).to_bytes(4, "big") + b"free", True),
+    (b"\x00\x00\x00\x00ftyp", True),
+])
+def test_needs_seek(head, expected):
+    assert needs_seek(head) is expected
+
+
+def test_for_pipe_fragments_mp4():
+    args = _for_pipe(["-c:v", "copy", "-movflags", "+faststart", "-f", "mp4"])
+    assert args == ["-c:v", "copy", "-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+
+
+def test_for_pipe_leaves_streamable_muxers_alone():
+    args = ["-c:v", "libvpx-vp9", "-f", "webm"]
+    assert _for_pipe(args) == args
+    assert _for_pipe(args) is not args
@@ -0,0 +1,45 @@
+import pytest
+
+from encoders import quality_args
+from target_size import parse_size
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("8MB", 8 * 1024 ** 2),
+    ("500k", 500 * 1024),
+    ("1.5G", int(1.5 * 1024 ** 3)),
+    (" 2 mb ", 2 * 1024 ** 2),
+    ("123456", 123456),
+    (123456, 123456),
+    ("100B", 100),
+])
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "MB", "eight"])
+def test_parse_size_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        parse_size(value)
+
+
+@pytest.mark.parametrize("encoder, quality, expected", [
+    ("libx264", 100, ["-crf", "18"]),
+    ("libx264", 1, ["-crf", "51"]),
+    ("libx265", 50, ["-crf", "34"]),
+    ("libvpx-vp9", 100, ["-crf", "20", "-b:v", "0"]),
+    ("h264_nvenc", 100, ["-rc", "vbr", "-cq", "18", "-b:v", "0"]),
+    ("hevc_qsv", 100, ["-global_quality", "18"]),
+    ("h264_vaapi", 100, ["-rc_mode", "CQP", "-qp", "18"]),
+    ("h264_videotoolbox", 75, ["-q:v", "75"]),
+    ("h264_amf", 100, ["-rc", "cqp", "-qp_i", "18", "-qp_p", "18"]),
+    ("mpeg4", 100, ["-q:v", "2"]),
+    ("mpeg4", 1, ["-q:v", "31"]),
+])
+def test_quality_args(encoder, quality, expected):
+    assert quality_args(encoder, quality) == expected
+
+
+def test_quality_args_clamps_the_slider():
+    assert quality_args("libx264", 500) == quality_args("libx264", 100)
+    assert quality_args("libx264", -5) == quality_args("libx264", 1)
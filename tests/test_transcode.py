@@ -0,0 +1,39 @@
+import pytest
+
+from transcode import can_copy, parse_progress
+
+
+@pytest.mark.parametrize("codec, kind, output_format, expected", [
+    ("h264", "video", "mp4", True),
+    ("h264", "video", "MP4", True),
+    ("aac", "audio", "mp4", True),
+    ("vp9", "video", "webm", True),
+    ("h264", "video", "webm", False),
+    ("aac", "audio", "webm", False),
+    ("prores", "video", "mkv", True),
+    ("h264", "video", "gif", False),
+    (None, "audio", "webm", True),
+])
+def test_can_copy(codec, kind, output_format, expected):
+    assert can_copy(codec, kind, output_format) is expected
+
+
+def test_parse_progress():
+    block = {"out_time_us": "5000000", "fps": "29.97", "total_size": "1048576", "speed": "2.0x",
+             "progress": "continue"}
+    assert parse_progress(block, duration=20) == {"stage": "encode", "percent": 25.0, "fps": 29.97,
+                                                  "eta": 7.5, "bytes_written": 1048576}
+
+
+def test_parse_progress_without_a_duration_or_speed():
+    event = parse_progress({"out_time_ms": "5000000", "speed": "N/A", "total_size": "N/A"})
+    assert (event["percent"], event["eta"], event["bytes_written"]) == (None, None, None)
+    event = parse_progress({"out_time_us": "5000000", "speed": "N/A"}, duration=10)
+    assert (event["percent"], event["eta"]) == (50.0, None)
+
+
+def test_parse_progress_clamps_and_finishes():
+    assert parse_progress({"out_time_us": "-4000"}, duration=10)["percent"] == 0.0
+    assert parse_progress({"out_time_us": "99000000"}, duration=10)["percent"] == 100.0
+    end = parse_progress({"out_time_us": "N/A", "progress": "end"}, duration=10)
+    assert (end["percent"], end["eta"]) == (100.0, 0.0)
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from watch import Watcher
+
+
+def watcher(tmp_path, mode="convert", output_format="mp4", output_dir=None):
+    options = {"mode": mode, "format": output_format, "output_dir": output_dir}
+    return Watcher([str(tmp_path)], options, manifest_path=str(tmp_path / "manifest.json"))
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("clip.mov", True),
+    ("CLIP.MKV", True),
+    ("song.mp3", False),
+    ("notes.txt", False),
+    (".clip.mov", False),
+    ("~clip.mov", False),
+    ("clip.mov.part", False),
+    ("clip.MOV.crdownload", False),
+    ("clip_converted.mov", False),
+    ("clip_converted_320.mov", False),
+    ("clip_converted_draft.mov", True),
+])
+def test_is_candidate_for_conversion(tmp_path, name, expected):
+    assert watcher(tmp_path).is_candidate(str(tmp_path / name)) is expected
+
+
+def test_is_candidate_for_compression(tmp_path):
+    w = watcher(tmp_path, mode="compress", output_format=None)
+    assert w.is_candidate(str(tmp_path / "photo.jpg"))
+    assert w.is_candidate(str(tmp_path / "paper.pdf"))
+    assert not w.is_candidate(str(tmp_path / "song.mp3"))
+    assert not w.is_candidate(str(tmp_path / "photo_compressed.jpg"))
+
+
+def test_is_candidate_for_several_formats(tmp_path):
+    w = watcher(tmp_path, output_format="mp3,jpg:320")
+    assert w.is_candidate(str(tmp_path / "clip.mov"))
+    assert not w.is_candidate(str(tmp_path / "song.wav"))
+
+
+def test_is_candidate_skips_the_output_directory(tmp_path):
+    w = watcher(tmp_path, output_dir=str(tmp_path / "out"))
+    assert not w.is_candidate(str(tmp_path / "out" / "clip.mov"))
+    assert not w.is_candidate(os.path.join(str(tmp_path), "out", "nested", "clip.mov"))
+    assert w.is_candidate(str(tmp_path / "outtakes" / "clip.mov"))
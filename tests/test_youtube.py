@@ -0,0 +1,72 @@
+import http.server
+import os
+import subprocess
+import threading
+
+import pytest
+
+from transcode import ffmpeg_available, find_ffmpeg
+from youtube import DownloadItem, DownloadQueue
+
+
+def test_output_names_include_the_video_id(tmp_path):
+    queue = DownloadQueue(str(tmp_path))
+    options = queue.ydl_options(DownloadItem("https://example.com/watch?v=1", "MP4"))
+    assert os.path.basename(options["outtmpl"]) == "%(title)s [%(id)s].%(ext)s"
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def clip_urls(tmp_path_factory):
+    """Serve a few short WebM clips from a local HTTP server and return their URLs."""
+    pytest.importorskip("yt_dlp")
+    if not ffmpeg_available():
+        pytest.skip("ffmpeg is not installed")
+    fixture_dir = str(tmp_path_factory.mktemp("fixtures"))
+    names = []
+    for i in range(3):
+        name = f"clip_{i:02d}.webm"
+        subprocess.run([find_ffmpeg(), "-hide_banner", "-v", "error", "-y",
+                        "-f", "lavfi", "-i", "testsrc=size=160x120:rate=25:duration=1",
+                        "-f", "lavfi", "-i", f"sine=frequency={220 + 20 * i}:duration=1",
+                        "-c:v", "libvpx-vp9", "-deadline", "realtime", "-c:a", "libopus",
+                        os.path.join(fixture_dir, name)], check=True)
+        names.append(name)
+
+    def handler(*args, **kwargs):
+        return QuietHandler(*args, directory=fixture_dir, **kwargs)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield [f"http://127.0.0.1:{server.server_address[1]}/{name}" for name in names]
+    server.shutdown()
+
+
+def run_queue(output_dir, urls, download_format):
+    queue = DownloadQueue(output_dir, max_concurrent=2)
+    added = queue.add_many(urls + urls[:2], download_format)
+    assert queue.wait(timeout=300)
+    return queue, added
+
+
+@pytest.mark.parametrize("download_format", ["WEBM", "MP4", "MP3"])
+def test_download_queue_offline(tmp_path, clip_urls, download_format):
+    output_dir = str(tmp_path)
+    queue, added = run_queue(output_dir, clip_urls, download_format)
+    # Repeated URLs are dropped
+    assert len(added) == len(clip_urls)
+    assert [item.status for item in queue.snapshot()] == ["done"] * len(clip_urls), \
+        [item.describe() for item in queue.snapshot()]
+
+    # Every clip arrives in the requested format with no intermediate file left behind
+    files = [name for name in os.listdir(output_dir) if not name.startswith(".")]
+    assert len(files) == len(clip_urls)
+    assert all(name.endswith("." + download_format.lower()) for name in files)
+
+    # A second run skips everything through the download archive
+    rerun, _ = run_queue(output_dir, clip_urls, download_format)
+    assert [item.status for item in rerun.snapshot()] == ["skipped"] * len(clip_urls)
@@ -0,0 +1,466 @@
+"""Direct ffmpeg transcode backend.
+
+Drives ffmpeg as a subprocess so frames never pass through Python. When the
+source streams are already valid for the target container they are copied
+(remuxed) instead of re-encoded.
+"""
+
+import json
+import os
+import collections
+import re
+import shutil
+import subprocess
+import threading
+
+# Codecs each container can hold without re-encoding (None = anything goes)
+CONTAINER_CODECS = {
+    "mp4": {"video": {"h264", "hevc", "av1", "mpeg4", "vp9"}, "audio": {"aac", "mp3", "ac3", "eac3", "alac", "opus"}},
+    "mov": {"video": {"h264", "hevc", "mpeg4", "prores", "mjpeg"}, "audio": {"aac", "mp3", "alac", "pcm_s16le"}},
+    "mkv": None,
+    "webm": {"video": {"vp8", "vp9", "av1"}, "audio": {"vorbis", "opus"}},
+    "avi": {"video": {"mpeg4", "h264", "mjpeg", "msmpeg4v2"}, "audio": {"mp3", "ac3", "pcm_s16le"}},
+    "flv": {"video": {"h264", "flv1"}, "audio": {"aac", "mp3"}},
+    "wmv": {"video": {"wmv1", "wmv2"}, "audio": {"wmav1", "wmav2"}},
+}
+
+# Audio encoders used when a stream has to be re-encoded for a container
+# (video encoders are picked by the encoders module)
+AUDIO_ENCODERS = {
+    "mp4": "aac",
+    "mov": "aac",
+    "mkv": "aac",
+    "flv": "aac",
+    "webm": "libopus",
+    "avi": "libmp3lame",
+    "wmv": "wmav2",
+}
+
+
+# Audio-only targets: codecs that can be copied as-is, the encoder (with
+# default quality arguments) used otherwise, and the muxer name
+AUDIO_FORMATS = {
+    "mp3": ({"mp3"}, ["-c:a", "libmp3lame", "-q:a", "2"], "mp3"),
+    "wav": ({"pcm_s16le", "pcm_s24le", "pcm_s32le", "pcm_f32le"}, ["-c:a", "pcm_s16le"], "wav"),
+    "ogg": ({"vorbis", "opus", "flac"}, ["-c:a", "libvorbis", "-q:a", "5"], "ogg"),
+    "flac": ({"flac"}, ["-c:a", "flac"], "flac"),
+    "aac": ({"aac"}, ["-c:a", "aac", "-b:a", "192k"], "adts"),
+    "m4a": ({"aac", "alac"}, ["-c:a", "aac", "-b:a", "192k"], "ipod"),
+    "opus": ({"opus"}, ["-c:a", "libopus", "-b:a", "128k"], "opus"),
+}
+
+
+# Thumbnails are taken this far into the video (a fraction of its duration),
+# but no later than THUMBNAIL_MAX_SECONDS
+THUMBNAIL_POSITION = 0.1
+THUMBNAIL_MAX_SECONDS = 10.0
+
+# Animated outputs made from video, and their default frame rate and size
+# caps (animated GIF/WebP grow quickly with either)
+ANIMATION_FORMATS = ("gif", "webp")
+ANIMATION_FPS = 12
+ANIMATION_MAX_SIZE = 480
+
+
+class FFmpegNotFoundError(RuntimeError):
+    """Raised when no ffmpeg binary can be located."""
+
+
+class JobCancelled(BaseException):
+    """Raised inside a conversion when its cancel event is set.
+
+    Derives from BaseException (like asyncio.CancelledError) so the
+    ``except Exception`` wrappers around each converter let it through.
+    """
+
+
+def find_ffmpeg():
+    """Return the path of the ffmpeg binary, or None if none is available."""
+    candidate = os.environ.get("FFMPEG_BINARY") or shutil.which("ffmpeg")
+    if candidate:
+        return candidate
+    try:
+        # MoviePy ships ffmpeg through imageio-ffmpeg
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+def find_ffprobe():
+    """Return the path of the ffprobe binary, or None if none is available."""
+    candidate = os.environ.get("FFPROBE_BINARY") or shutil.which("ffprobe")
+    if candidate:
+        return candidate
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        sibling = os.path.join(os.path.dirname(ffmpeg), os.path.basename(ffmpeg).replace("ffmpeg", "ffprobe"))
+        if os.path.isfile(sibling):
+            return sibling
+    return None
+
+
+def ffmpeg_available():
+    """Return True if an ffmpeg binary can be found."""
+    return find_ffmpeg() is not None
+
+
+def ffprobe_json(input_path):
+    """Return ffprobe's stream and format description of a file as a dict."""
+    result = subprocess.run(
+        [find_ffprobe(), "-v", "error", "-show_streams", "-show_format", "-of", "json", input_path],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout or "{}")
+
+
+def first_streams(data):
+    """Return the first video and audio stream dicts of ffprobe output, skipping cover art."""
+    streams = {"video": None, "audio": None}
+    for stream in data.get("streams", []):
+        kind = stream.get("codec_type")
+        # Cover art in audio files shows up as a video stream; ignore it
+        if kind == "video" and stream.get("disposition", {}).get("attached_pic"):
+            continue
+        if kind in streams and streams[kind] is None:
+            streams[kind] = stream
+    return streams
+
+
+def probe_streams(input_path):
+    """Return {"video": codec or None, "audio": codec or None, "duration": seconds or None}."""
+    if find_ffprobe():
+        data = ffprobe_json(input_path)
+        info = {kind: stream and stream.get("codec_name") for kind, stream in first_streams(data).items()}
+        duration = data.get("format", {}).get("duration")
+        info["duration"] = float(duration) if duration else None
+        return info
+
+    # Without ffprobe, parse the stream summary ffmpeg prints for "-i"
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        raise FFmpegNotFoundError("ffmpeg is not installed")
+    result = subprocess.run([ffmpeg, "-hide_banner", "-i", input_path], capture_output=True, text=True)
+    info = {"video": None, "audio": None, "duration": None}
+    for kind, codec in re.findall(r"Stream #\S+: (Video|Audio): (\w+)", result.stderr):
+        if info[kind.lower()] is None:
+            info[kind.lower()] = codec
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return info
+
+
+def can_copy(codec, kind, output_format):
+    """Return True if a stream with this codec can go into the container as-is."""
+    if codec is None:
+        return True
+    allowed = CONTAINER_CODECS.get(output_format.lower())
+    if allowed is None:
+        return output_format.lower() in CONTAINER_CODECS
+    return codec in allowed[kind]
+
+
+def copies_video(streams, output_format, video_args=None, force_encode=False, encoder=None, preset=None):
+    """Return True if the video stream can be stream-copied for this job."""
+    # An explicit encoder or preset means the caller wants a re-encode
+    force_video = force_encode or encoder is not None or preset is not None
+    return not force_video and not video_args and can_copy(streams["video"], "video", output_format)
+
+
+def audio_codec_args(streams, output_format, audio_args=None, force_encode=False):
+    """Return the "-c:a ..." arguments for a job, copying the stream when possible."""
+    if streams["audio"] is None:
+        return []
+    if not force_encode and not audio_args and can_copy(streams["audio"], "audio", output_format):
+        return ["-c:a", "copy"]
+    return ["-c:a", AUDIO_ENCODERS.get(output_format.lower(), "aac")] + list(audio_args or [])
+
+
+def video_output_args(output_format, streams, video_args=None, audio_args=None, force_encode=False, encoder=None,
+                      preset=None):
+    """Return the ffmpeg output options (codecs, muxer flags) of one video output."""
+    # Imported here because encoders itself needs find_ffmpeg from this module
+    from encoders import video_encoder_args
+
+    output_format = output_format.lower()
+    args = []
+    if streams["video"] is not None:
+        if copies_video(streams, output_format, video_args, force_encode, encoder, preset):
+            args += ["-c:v", "copy"]
+        else:
+            args += video_encoder_args(output_format, encoder, preset) + list(video_args or [])
+    args += audio_codec_args(streams, output_format, audio_args, force_encode)
+    if output_format in ("mp4", "mov"):
+        args += ["-movflags", "+faststart"]
+    return args
+
+
+def audio_output_args(output_format, streams, audio_args=None):
+    """Return the ffmpeg output options that write the first audio stream as an audio-only file."""
+    output_format = output_format.lower()
+    if output_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format: {output_format}")
+    if streams["audio"] is None:
+        raise ValueError("Input has no audio stream")
+    copyable, encode_args, muxer = AUDIO_FORMATS[output_format]
+    args = ["-map", "0:a:0", "-vn"]
+    if not audio_args and streams["audio"] in copyable:
+        args += ["-c:a", "copy"]
+    else:
+        args += [encode_args[0], encode_args[1]] + list(audio_args or encode_args[2:])
+    return args + ["-f", muxer]
+
+
+def frame_output_args(output_format, streams, max_size=None):
+    """Return the ffmpeg output options that write one still frame (a thumbnail) as an image."""
+    if streams["video"] is None:
+        raise ValueError("Input has no video stream")
+    # As an output option -ss discards decoded frames for this output only, so
+    # the thumbnail shares the decoder with every other output
+    position = min((streams["duration"] or 0) * THUMBNAIL_POSITION, THUMBNAIL_MAX_SECONDS)
+    args = ["-map", "0:v:0", "-ss", f"{position:.3f}", "-frames:v", "1", "-update", "1"]
+    if max_size:
+        args += ["-vf", scale_filter(max_size)]
+    if output_format.lower() in ("jpg", "jpeg"):
+        args += ["-q:v", "2"]
+    return args
+
+
+def scale_filter(max_size):
+    """Return a scale filter that shrinks (never enlarges) frames to fit a max_size square."""
+    return (f"scale=w='min(iw,{max_size})':h='min(ih,{max_size})'"
+            f":force_original_aspect_ratio=decrease:flags=lanczos")
+
+
+def animation_output_args(output_format, streams, fps=None, max_size=None, quality=None):
+    """Return the ffmpeg output options that write the video as an animated GIF or WebP.
+
+    GIFs get a fresh palette per frame (palettegen stats_mode=single with
+    paletteuse new=1): unlike a global palette, this needs no second pass
+    and no buffering of the whole clip, so frames stream straight through.
+    """
+    # Imported here because encoders itself needs find_ffmpeg from this module
+    from encoders import listed_encoders
+
+    if streams["video"] is None:
+        raise ValueError("Input has no video stream")
+    chain = f"fps={fps or ANIMATION_FPS},{scale_filter(max_size or ANIMATION_MAX_SIZE)}"
+    args = ["-map", "0:v:0", "-an", "-loop", "0"]
+    if output_format.lower() == "gif":
+        chain += ",split[frames][stats];[stats]palettegen=stats_mode=single[palette];" \
+                 "[frames][palette]paletteuse=new=1:dither=sierra2_4a"
+        return args + ["-vf", chain, "-f", "gif"]
+    encoder = "libwebp_anim" if "libwebp_anim" in listed_encoders() else "libwebp"
+    return args + ["-vf", chain, "-c:v", encoder, "-quality", str(quality or 75), "-f", "webp"]
+
+
+def build_command(input_path, output_path, output_format, streams, video_args=None, audio_args=None,
+                  force_encode=False, encoder=None, preset=None):
+    """Build the ffmpeg argument list for a transcode or remux."""
+    cmd = [find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", input_path]
+    cmd += video_output_args(output_format, streams, video_args, audio_args, force_encode, encoder, preset)
+    cmd.append(output_path)
+    return cmd
+
+
+def build_multi_command(input_path, outputs, streams, encoder=None, preset=None):
+    """Build one ffmpeg command that writes every output from a single decode of the input.
+
+    ``outputs`` is a list of {"output": path, "format": ..., "max_size": ...}
+    dicts. Video containers get the same codecs as build_command, audio
+    formats get the first audio stream, gif/webp an animation (with optional
+    "fps" and "max_size"), and any other format (png, jpg, ...) a thumbnail
+    frame.
+    """
+    cmd = [find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", input_path]
+    for output in outputs:
+        output_format = output["format"].lower()
+        if output_format in AUDIO_FORMATS:
+            cmd += audio_output_args(output_format, streams)
+        elif output_format in CONTAINER_CODECS:
+            cmd += video_output_args(output_format, streams, encoder=encoder, preset=preset)
+        elif output_format in ANIMATION_FORMATS:
+            cmd += animation_output_args(output_format, streams, output.get("fps"), output.get("max_size"))
+        else:
+            cmd += frame_output_args(output_format, streams, output.get("max_size"))
+        cmd.append(output["output"])
+    return cmd
+
+
+def parse_progress(block, duration=None):
+    """Turn one block of ffmpeg "-progress" key=value pairs into a progress event."""
+    event = {"stage": "encode", "percent": None, "fps": None, "eta": None, "bytes_written": None}
+    # out_time_us and (despite its name) out_time_ms are both in microseconds
+    out_time = block.get("out_time_us") or block.get("out_time_ms")
+    seconds = int(out_time) / 1_000_000 if out_time and out_time.lstrip("-").isdigit() else None
+    if block.get("fps"):
+        event["fps"] = float(block["fps"])
+    if block.get("total_size", "").isdigit():
+        event["bytes_written"] = int(block["total_size"])
+    if duration and seconds is not None:
+        event["percent"] = max(0.0, min(100.0, seconds / duration * 100))
+        speed = block.get("speed", "").rstrip("x").strip()
+        try:
+            speed = float(speed)
+        except ValueError:
+            speed = 0
+        if speed > 0:
+            event["eta"] = max(0.0, (duration - seconds) / speed)
+    if block.get("progress") == "end":
+        event["percent"] = 100.0
+        event["eta"] = 0.0
+    return event
+
+
+def run_ffmpeg(cmd, duration=None, progress=None, cancel=None):
+    """Run an ffmpeg command, raising RuntimeError with its last output lines on failure.
+
+    When ``progress`` is given it is called with an event dict (percent, fps,
+    eta, bytes_written) parsed from ffmpeg's "-progress" output. When the
+    ``cancel`` event is set ffmpeg is terminated and JobCancelled is raised.
+    """
+    if progress is None and cancel is None:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            tail = "\n".join(result.stderr.strip().splitlines()[-5:])
+            raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {tail}")
+        return
+
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # Drain stderr on a thread so a chatty ffmpeg can never block on a full pipe
+    stderr_tail = collections.deque(maxlen=5)
+    drain = threading.Thread(target=lambda: stderr_tail.extend(process.stderr), daemon=True)
+    drain.start()
+    if cancel is not None:
+        def watch_cancel():
+            while process.poll() is None:
+                if cancel.wait(0.2):
+                    process.terminate()
+                    return
+        threading.Thread(target=watch_cancel, daemon=True).start()
+
+    block = {}
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        block[key] = value
+        if key == "progress":
+            if progress:
+                progress(parse_progress(block, duration))
+            block = {}
+    process.wait()
+    drain.join(timeout=1)
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled("Job was cancelled")
+    if process.returncode != 0:
+        tail = "\n".join(line.rstrip() for line in stderr_tail)
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {tail}")
+
+
+def transcode(input_path, output_path, output_format, video_args=None, audio_args=None, force_encode=False,
+              encoder=None, preset=None, progress=None, cancel=None, segmented=None, streams=None):
+    """Transcode or remux a media file with ffmpeg.
+
+    Streams are copied when the source codec already fits the target
+    container, unless encoder arguments are passed or ``force_encode`` is set.
+    ``encoder``/``preset`` override the encoder registry's choice for this job.
+    ``progress``/``cancel`` are passed to run_ffmpeg. When the video has to be
+    re-encoded, ``segmented`` selects parallel segmented encoding (True/False,
+    or None to decide from the input's duration). ``streams`` is a
+    probe_streams()-style dict the caller already has (e.g. from the probe
+    index); without it the input is probed. Returns the command that was run.
+    """
+    if not ffmpeg_available():
+        raise FFmpegNotFoundError("ffmpeg is not installed")
+    streams = streams or probe_streams(input_path)
+    use_segments = False
+    if (segmented is not False and streams["video"] is not None
+            and not copies_video(streams, output_format, video_args, force_encode, encoder, preset)):
+        from segmented import should_segment
+        use_segments = segmented or should_segment(streams["duration"], output_format, encoder)
+    try:
+        if use_segments:
+            from segmented import encode_segmented
+            return encode_segmented(input_path, output_path, output_format, streams, video_args, audio_args,
+                                    force_encode, encoder, preset, progress=progress, cancel=cancel)
+        cmd = build_command(input_path, output_path, output_format, streams, video_args, audio_args, force_encode,
+                            encoder, preset)
+        run_ffmpeg(cmd, streams["duration"], progress, cancel)
+    except BaseException:
+        # A failed or cancelled concat/encode leaves a partial output behind
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return cmd
+
+
+def transcode_audio(input_path, output_path, output_format, audio_args=None, progress=None, cancel=None,
+                    streams=None):
+    """Convert the first audio stream of a file with ffmpeg, remuxing when the codec already matches.
+
+    ffmpeg decodes and encodes packet by packet, so memory use stays flat no
+    matter how long the input is. Returns the command that was run.
+    """
+    if not ffmpeg_available():
+        raise FFmpegNotFoundError("ffmpeg is not installed")
+    output_format = output_format.lower()
+    if output_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format: {output_format}")
+
+    streams = streams or probe_streams(input_path)
+    cmd = [find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", input_path]
+    cmd += audio_output_args(output_format, streams, audio_args) + [output_path]
+    try:
+        run_ffmpeg(cmd, streams["duration"], progress, cancel)
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return cmd
+
+
+def transcode_animation(input_path, output_path, output_format, fps=None, max_size=None, quality=None,
+                        progress=None, cancel=None, streams=None):
+    """Turn a video into an animated GIF or WebP in one streaming ffmpeg pass.
+
+    ``fps`` and ``max_size`` cap the frame rate and the longest side
+    (defaults: ANIMATION_FPS, ANIMATION_MAX_SIZE); ``quality`` applies to
+    WebP. Returns the command that was run.
+    """
+    if not ffmpeg_available():
+        raise FFmpegNotFoundError("ffmpeg is not installed")
+    streams = streams or probe_streams(input_path)
+    cmd = [find_ffmpeg(), "-hide_banner", "-nostdin", "-y", "-i", input_path]
+    cmd += animation_output_args(output_format, streams, fps, max_size, quality) + [output_path]
+    try:
+        run_ffmpeg(cmd, streams["duration"], progress, cancel)
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return cmd
+
+
+def transcode_many(input_path, outputs, encoder=None, preset=None, progress=None, cancel=None, streams=None):
+    """Write several outputs from one input with a single ffmpeg process.
+
+    The input is demuxed and decoded once and every output's encoder is fed
+    from the same frames; compatible streams are still copied per output.
+    Segmented encoding is not used here. See build_multi_command for
+    ``outputs``. On failure every output is removed. Returns the command that
+    was run.
+    """
+    if not ffmpeg_available():
+        raise FFmpegNotFoundError("ffmpeg is not installed")
+    streams = streams or probe_streams(input_path)
+    cmd = build_multi_command(input_path, outputs, streams, encoder, preset)
+    try:
+        run_ffmpeg(cmd, streams["duration"], progress, cancel)
+    except BaseException:
+        for output in outputs:
+            if os.path.exists(output["output"]):
+                os.remove(output["output"])
+        raise
+    return cmd
@@ -0,0 +1,408 @@
+"""Watch folders and convert or compress files as they arrive.
+
+New and changed files are picked up through inotify on Linux (or by polling
+elsewhere, or with ``--poll``), left alone until their size and mtime have
+been stable for ``--settle`` seconds, and then handed to a process pool that
+runs the same jobs as batch.py. Outputs follow the usual ``_converted`` /
+``_compressed`` naming.
+
+A manifest records the size and mtime of every processed file. On restart
+only files whose stat differs from the manifest are processed; unchanged
+files are neither read nor converted again.
+
+Usage examples:
+    python watch.py ~/inbox --to mp4
+    python watch.py ~/photos --mode compress --quality 60 --output-dir ~/photos/small
+    python watch.py ~/inbox --to webp --once
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import queue
+import re
+import select
+import struct
+import sys
+import time
+
+import metrics
+from batch import WorkerPool, build_job, default_workers, is_multi_format
+from converter import CONVERSION_TARGETS, MULTI_OUTPUT_FORMATS, detect_file_category, parse_targets
+from scheduler import Scheduler, job_cost
+from target_size import parse_size
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = ".convert-py-watch.json"
+
+# Files that are still being written by browsers, downloaders and editors
+TEMPORARY_SUFFIXES = (".part", ".tmp", ".crdownload", ".download", ".ytdl", ".swp")
+
+# Our own outputs: "_converted", "_compressed", sized multi-output variants
+# ("_converted_320") and rendered PDF pages ("_converted-001")
+OUTPUT_STEM = re.compile(r"_(converted|compressed)([_-]\d+)?$")
+
+# inotify event bits (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def walk_files(directory):
+    """Yield the paths of all files below ``directory``, skipping hidden directories."""
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            yield os.path.join(root, name)
+
+
+class InotifySource:
+    """Change notifications from the Linux inotify API (through libc, no extra dependency)."""
+
+    def __init__(self, directories):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        for directory in directories:
+            self._watch_tree(directory)
+
+    def _watch_tree(self, directory):
+        for root, dirs, _ in os.walk(directory):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {root}")
+            self._dirs[wd] = root
+
+    def changes(self, timeout):
+        """Return the paths that changed within ``timeout`` seconds, or None if everything must be rescanned."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return set()
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self._dirs or not name:
+                continue
+            path = os.path.join(self._dirs[wd], name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith("."):
+                    # Files can land in a new directory before its watch exists
+                    self._watch_tree(path)
+                    paths.update(walk_files(path))
+            else:
+                paths.add(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Change detection by periodically comparing stat results."""
+
+    def __init__(self, directories, interval=2.0):
+        self.directories = directories
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for directory in self.directories:
+            for path in walk_files(directory):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout):
+        """Return the paths whose size or mtime changed since the previous call."""
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = {path for path, stat in snapshot.items() if self._snapshot.get(path) != stat}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class Watcher:
+    """Debounces file changes, runs jobs on a process pool and keeps the manifest."""
+
+    def __init__(self, directories, job_options, manifest_path=None, workers=None, settle=2.0, poll=False,
+                 poll_interval=2.0, on_result=None, metrics_file=None, scheduler=None):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.options = job_options
+        self.manifest_path = manifest_path or os.path.join(self.directories[0], MANIFEST_NAME)
+        self.workers = workers or default_workers()
+        self.settle = settle
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.on_result = on_result
+        self.metrics_file = metrics_file
+        self.scheduler = scheduler
+        self.output_dir = os.path.abspath(job_options["output_dir"]) if job_options.get("output_dir") else None
+        self.settings_key = hashlib.blake2b(json.dumps(job_options, sort_keys=True).encode(),
+                                            digest_size=8).hexdigest()
+        self.manifest = self._load_manifest()
+        self._pending = {}     # path -> (size, mtime_ns, stable since)
+        self._running = {}     # path -> (size, mtime_ns)
+        self._finished = queue.Queue()
+
+    def is_candidate(self, path):
+        """Return True for files this watcher should process."""
+        name = os.path.basename(path)
+        stem, extension = os.path.splitext(name)
+        if name.startswith((".", "~")) or name.lower().endswith(TEMPORARY_SUFFIXES) or OUTPUT_STEM.search(stem):
+            return False
+        if self.output_dir and (os.path.dirname(path) + os.sep).startswith(self.output_dir + os.sep):
+            return False
+        category = detect_file_category(extension[1:])
+        if self.options["mode"] == "compress":
+            return category in ("image", "video", "document")
+        if is_multi_format(self.options["format"]):
+            formats = [target["format"] for target in parse_targets(self.options["format"])]
+            return all(output_format in MULTI_OUTPUT_FORMATS.get(category, ()) for output_format in formats)
+        return category is not None and self.options["format"] in CONVERSION_TARGETS[category]
+
+    def needs_processing(self, path, stat):
+        entry = self.manifest.get(path)
+        return entry is None or (entry["size"], entry["mtime_ns"]) != stat
+
+    def reconcile(self):
+        """Queue every file that changed since the manifest was written and forget deleted ones."""
+        for path in list(self.manifest):
+            if not os.path.exists(path):
+                del self.manifest[path]
+        for directory in self.directories:
+            for path in walk_files(directory):
+                self.notice(path)
+
+    def notice(self, path):
+        """Record a change to ``path``; it is processed once it has been stable for ``settle`` seconds."""
+        if not self.is_candidate(path):
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._pending.pop(path, None)
+            return
+        stat = (st.st_size, st.st_mtime_ns)
+        if not self.needs_processing(path, stat) or self._running.get(path) == stat:
+            self._pending.pop(path, None)
+            return
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != stat:
+            # The file has not changed since its mtime, so files that settled
+            # while nobody was watching are processed without waiting
+            unchanged_for = max(0.0, time.time() - st.st_mtime)
+            self._pending[path] = stat + (time.monotonic() - unchanged_for,)
+
+    def _settled(self):
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            if path in self._running or now - since < self.settle:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+                continue
+            del self._pending[path]
+            ready.append((path, (size, mtime_ns)))
+        return ready
+
+    def _submit(self, pool, path, stat):
+        job = build_job(path, self.options["mode"], self.options.get("format"), self.options["quality"],
+                        self.options.get("output_dir"), self.options.get("encoder"), self.options.get("preset"))
+        if job is None:
+            return
+        for name in ("segmented", "max_size", "target_size", "fps"):
+            if self.options.get(name):
+                job[name] = self.options[name]
+        self._running[path] = stat
+        if self.scheduler is None:
+            future = pool.submit(job)
+        else:
+            future = self.scheduler.submit(pool.run, job, category=job["category"], cost=job_cost(job))
+        future.add_done_callback(lambda f: self._finished.put((path, stat, job, f)))
+
+    def _collect(self):
+        while True:
+            try:
+                path, stat, job, future = self._finished.get_nowait()
+            except queue.Empty:
+                return
+            del self._running[path]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"input": job["input"], "output": job["output"], "mode": job["mode"],
+                          "status": "failed", "error": str(e), "seconds": 0}
+            if "metrics" in result:
+                metrics.merge(result.pop("metrics"))
+                if self.metrics_file:
+                    metrics.write_prometheus(self.metrics_file)
+            # Failed files are recorded too, so they are retried only after they change
+            self.manifest[path] = {"size": stat[0], "mtime_ns": stat[1], "output": result["output"],
+                                   "status": result["status"], "error": result.get("error")}
+            self._save_manifest()
+            if self.on_result:
+                self.on_result(result)
+
+    def _source(self):
+        if not self.poll and sys.platform.startswith("linux"):
+            try:
+                return InotifySource(self.directories)
+            except OSError as e:
+                print(f"inotify unavailable ({e}); polling every {self.poll_interval}s", file=sys.stderr)
+        return PollingSource(self.directories, self.poll_interval)
+
+    def run(self, once=False, stop=None):
+        """Process changes until interrupted, ``stop`` is set, or (with ``once``) the backlog is done."""
+        source = None if once else self._source()
+        self.reconcile()
+        try:
+            with WorkerPool(self.workers) as pool:
+                while stop is None or not stop.is_set():
+                    for path, stat in self._settled():
+                        self._submit(pool, path, stat)
+                    self._collect()
+                    if once:
+                        if not self._pending and not self._running:
+                            break
+                        time.sleep(0.2)
+                        for path in list(self._pending):
+                            self.notice(path)
+                        continue
+                    changes = source.changes(0.5)
+                    if changes is None:
+                        self.reconcile()
+                        continue
+                    for path in changes:
+                        self.notice(path)
+                # Let running jobs finish and record them before exiting
+                while self._running:
+                    time.sleep(0.2)
+                    self._collect()
+        finally:
+            if source is not None:
+                source.close()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != MANIFEST_VERSION or data.get("settings") != self.settings_key:
+            # Different output settings: everything has to be produced again
+            return {}
+        return data.get("files", {})
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings_key, "files": self.manifest}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert or compress files dropped into watched folders.")
+    parser.add_argument("directories", nargs="+", help="Folders to watch (recursively)")
+    parser.add_argument("--mode", choices=["convert", "compress"], default="convert")
+    parser.add_argument("--to", dest="output_format", help="Output format for conversion (e.g. mp4, png)")
+    parser.add_argument("--quality", type=int, default=75, help="Compression quality (1-100)")
+    parser.add_argument("--encoder", help="Video encoder override (e.g. libx264, h264_nvenc)")
+    parser.add_argument("--preset", help="Encoder preset override (e.g. veryfast, p4)")
+    parser.add_argument("--segmented", action="store_true", default=None,
+                        help="Encode every video as parallel segments (default: only long videos)")
+    parser.add_argument("--target-size", help="Compress to at most this size (e.g. 8MB, 500k) instead of --quality")
+    parser.add_argument("--max-size", type=int,
+                        help="Shrink images (and video-to-GIF/WebP animations) to at most N pixels on the longest side")
+    parser.add_argument("--fps", type=int, help="Frame rate of video-to-GIF/WebP animations (default 12)")
+    parser.add_argument("--output-dir", help="Write results here instead of next to the inputs")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--memory", help="Memory budget shared by running jobs, e.g. 8G (default: 3/4 of RAM)")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="Seconds a file must stay unchanged before it is processed")
+    parser.add_argument("--poll", action="store_true", help="Poll for changes instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between polls")
+    parser.add_argument("--manifest", help=f"Manifest path (default: {MANIFEST_NAME} in the first folder)")
+    parser.add_argument("--once", action="store_true", help="Process what changed since the last run and exit")
+    parser.add_argument("--metrics-log", help="Append per-job JSON metrics to this file")
+    parser.add_argument("--metrics-file", help="Keep Prometheus-format totals in this file (for a textfile collector)")
+    parser.add_argument("--profile", metavar="DIR", help="Write a cProfile/pyinstrument profile of every job here")
+    args = parser.parse_args(argv)
+
+    if args.mode == "convert" and not args.output_format:
+        parser.error("--to is required in convert mode")
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            parser.error(f"Not a directory: {directory}")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.metrics_log or args.metrics_file or args.profile:
+        metrics.enable(args.metrics_log, args.profile and os.path.abspath(args.profile))
+
+    options = {
+        "mode": args.mode,
+        "format": args.output_format.lower() if args.output_format else None,
+        "quality": args.quality,
+        "encoder": args.encoder,
+        "preset": args.preset,
+        "segmented": args.segmented,
+        "max_size": args.max_size,
+        "target_size": parse_size(args.target_size) if args.target_size else None,
+        "output_dir": args.output_dir,
+    }
+    if args.fps:
+        # Only when set, so existing manifests keep their settings hash
+        options["fps"] = args.fps
+
+    def print_result(result):
+        line = f"[{result['status']}] {result['input']} -> {result['output']} ({result['seconds']}s)"
+        if result["status"] != "ok":
+            line += f": {result['error']}"
+        print(line, flush=True)
+
+    watcher = Watcher(args.directories, options, args.manifest, args.workers, args.settle, args.poll,
+                      args.poll_interval, print_result, args.metrics_file,
+                      Scheduler(args.workers or default_workers(), parse_size(args.memory) if args.memory else None))
+    try:
+        watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""Download queue for YouTube (and anything else yt-dlp can fetch).
+
+DownloadQueue runs up to ``max_concurrent`` downloads at a time, each with
+``fragment_concurrency`` parallel fragment downloads for DASH/HLS formats.
+Playlists are expanded into one item per entry, URLs already queued are
+ignored, and videos recorded in the download archive are skipped without
+being fetched again. Interrupted downloads resume from their ``.part``
+files.
+
+Format selection prefers streams that already fit the requested container
+(H.264/AAC for MP4, VP9/Opus for WEBM, MP3 audio for MP3), so the merged
+download usually only needs a remux. The final step runs as a yt-dlp
+postprocessor that calls transcode/transcode_audio once: it copies
+compatible streams, re-encodes only those that do not fit, and yt-dlp
+deletes the intermediate file afterwards.
+
+yt-dlp is imported on first use so importing this module stays cheap.
+"""
+
+import collections
+import os
+import re
+import threading
+import time
+
+import metrics
+from transcode import JobCancelled, transcode, transcode_audio
+
+# Per download format: yt-dlp format selector (native streams first),
+# merge container preference and final extension
+DOWNLOAD_FORMATS = {
+    "WEBM": ("bestvideo[ext=webm]+bestaudio[ext=webm]/best[ext=webm]/bestvideo+bestaudio/best", "webm/mkv", "webm"),
+    "MP4": ("bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/bestvideo+bestaudio/best", "mp4/mkv", "mp4"),
+    "MP3": ("bestaudio[ext=mp3]/bestaudio/best", None, "mp3"),
+}
+
+ACTIVE_STATUSES = ("queued", "expanding", "downloading", "processing")
+
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class DownloadItem:
+    """One URL in the queue and its current state."""
+
+    def __init__(self, url, download_format):
+        self.url = url
+        self.download_format = download_format
+        self.status = "queued"
+        self.title = None
+        self.percent = 0.0
+        self.speed = None
+        self.eta = None
+        self.filename = None
+        self.error = None
+        self.updated = time.monotonic()
+        self.queued_at = time.time()
+        self.cancel_event = threading.Event()
+
+    def describe(self):
+        """Return a one-line status for display."""
+        name = self.title or self.url
+        if self.status == "downloading":
+            line = f"{self.percent:5.1f}%  {name}"
+            if self.speed:
+                line += f"  {self.speed / 1_000_000:.1f} MB/s"
+            if self.eta is not None:
+                line += f"  ETA {int(self.eta) // 60}:{int(self.eta) % 60:02d}"
+            return line
+        if self.status == "failed":
+            return f"failed  {name}: {self.error}"
+        return f"{self.status}  {name}"
+
+
+class DownloadQueue:
+    """Bounded-parallelism yt-dlp download queue."""
+
+    def __init__(self, output_dir, max_concurrent=3, fragment_concurrency=4, archive_path=None, on_update=None,
+                 scheduler=None):
+        """``archive_path=False`` disables the download archive.
+
+        With a ``scheduler`` (scheduler.Scheduler), every download also waits
+        for a "download" slot, so downloads share CPU and memory budgets with
+        conversions.
+        """
+        self.output_dir = output_dir
+        self.scheduler = scheduler
+        self.max_concurrent = max_concurrent
+        self.fragment_concurrency = fragment_concurrency
+        if archive_path is False:
+            self.archive_path = None
+        else:
+            self.archive_path = archive_path or os.path.join(output_dir, ".download-archive.txt")
+        self.on_update = on_update
+        self.items = []
+        self._pending = collections.deque()
+        self._seen = set()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def add(self, url, download_format="MP4"):
+        """Queue a URL; return its DownloadItem, or None if it is already queued."""
+        url = url.strip()
+        with self._lock:
+            if not url or (url, download_format) in self._seen:
+                return None
+            self._seen.add((url, download_format))
+            item = DownloadItem(url, download_format)
+            self.items.append(item)
+            self._pending.append(item)
+        self._notify(item)
+        self._start_workers()
+        return item
+
+    def add_many(self, urls, download_format="MP4"):
+        """Queue several URLs and return the items that were added."""
+        return [item for item in (self.add(url, download_format) for url in urls) if item]
+
+    def cancel(self, item):
+        """Cancel a queued or running item; a running download stops at its next progress update."""
+        with self._lock:
+            if item in self._pending:
+                self._pending.remove(item)
+                item.status = "cancelled"
+            item.cancel_event.set()
+        self._notify(item)
+
+    def forget(self, item):
+        """Drop a finished item so its URL can be queued again."""
+        with self._lock:
+            if item in self.items:
+                self.items.remove(item)
+            self._seen.discard((item.url, item.download_format))
+
+    def find(self, url, download_format="MP4"):
+        """Return the item already queued for a URL, or None."""
+        for item in self.snapshot():
+            if item.url == url.strip() and item.download_format == download_format:
+                return item
+        return None
+
+    def set_max_concurrent(self, max_concurrent):
+        """Change the number of simultaneous downloads; takes effect as slots free up."""
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._start_workers()
+
+    def wait(self, timeout=None):
+        """Block until every queued item has finished; return False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def snapshot(self):
+        """Return the list of items (safe to read from another thread)."""
+        with self._lock:
+            return list(self.items)
+
+    def overall_progress(self):
+        """Return the mean progress (0-1) of the items that are not finished yet."""
+        active = [item for item in self.snapshot() if item.status in ACTIVE_STATUSES]
+        if not active:
+            return 0.0
+        return sum(item.percent for item in active) / len(active) / 100
+
+    def _start_workers(self):
+        with self._lock:
+            while self._pending and self._running < self.max_concurrent:
+                self._running += 1
+                threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if not self._pending or self._running > self.max_concurrent:
+                    self._running -= 1
+                    self._idle.notify_all()
+                    return
+                item = self._pending.popleft()
+            try:
+                if self.scheduler is None:
+                    self._process(item)
+                else:
+                    with self.scheduler.acquire("download"):
+                        if item.cancel_event.is_set():
+                            raise JobCancelled("Download was cancelled")
+                        self._process(item)
+            except JobCancelled:
+                item.status = "cancelled"
+                self._notify(item)
+
+    def _notify(self, item):
+        item.updated = time.monotonic()
+        if self.on_update:
+            self.on_update(item)
+
+    def ydl_options(self, item):
+        """Return the yt-dlp options for an item."""
+        selector, merge_format, _ = DOWNLOAD_FORMATS[item.download_format]
+        return {
+            # The id keeps different videos with the same title from overwriting each other
+            "outtmpl": os.path.join(self.output_dir, "%(title)s [%(id)s].%(ext)s"),
+            "format": selector,
+            "merge_output_format": merge_format,
+            "progress_hooks": [lambda d: self._on_progress(item, d)],
+            "concurrent_fragment_downloads": self.fragment_concurrency,
+            "download_archive": self.archive_path,
+            "continuedl": True,
+            "nopart": False,
+            "retries": 10,
+            "fragment_retries": 10,
+            "quiet": True,
+            "no_warnings": True,
+            "noprogress": True,
+        }
+
+    def _process(self, item):
+        try:
+            with metrics.job("download", item.url, None, item.queued_at, mode="download",
+                             format=item.download_format) as record:
+                self._fetch(item, record)
+        except Exception as e:
+            item.status = "failed"
+            item.error = _ANSI_ESCAPE.sub("", str(e))
+        self._notify(item)
+
+    def _fetch(self, item, record):
+        import yt_dlp
+
+        with yt_dlp.YoutubeDL(self.ydl_options(item)) as ydl:
+            ydl.add_post_processor(output_postprocessor(item, self._notify, record), when="post_process")
+            item.status = "expanding"
+            self._notify(item)
+            with record.stage("probe"):
+                info = ydl.extract_info(item.url, download=False, process=False)
+                if info.get("_type") in ("playlist", "multi_video"):
+                    entries = [entry.get("webpage_url") or entry.get("url") for entry in info.get("entries") or []]
+                    self.add_many([url for url in entries if url], item.download_format)
+                    item.title = info.get("title")
+                    item.status = "expanded"
+                    item.percent = 100.0
+                    return
+                info = ydl.process_ie_result(info, download=False)
+            item.title = info.get("title")
+            if ydl.in_download_archive(info):
+                item.status = "skipped"
+                item.percent = 100.0
+                return
+
+            item.status = "downloading"
+            self._notify(item)
+            record.enter_stage("download")
+            ydl.process_ie_result(info, download=True)
+        item.status = "done"
+        item.percent = 100.0
+        if item.filename and os.path.exists(item.filename):
+            record.add_bytes(written=os.path.getsize(item.filename))
+
+    def _on_progress(self, item, d):
+        if item.cancel_event.is_set():
+            # JobCancelled is a BaseException, so yt-dlp's error handling lets it through
+            raise JobCancelled("Download was cancelled")
+        if d["status"] == "downloading":
+            total = d.get("total_bytes") or d.get("total_bytes_estimate")
+            if total:
+                item.percent = d.get("downloaded_bytes", 0) / total * 100
+            elif d.get("fragment_count"):
+                item.percent = d.get("fragment_index", 0) / d["fragment_count"] * 100
+            item.speed = d.get("speed")
+            item.eta = d.get("eta")
+        elif d["status"] == "finished":
+            item.percent = 100.0
+        self._notify(item)
+
+
+def output_postprocessor(item, notify, record=None):
+    """Return a yt-dlp postprocessor that turns the download into the item's final format in one pass.
+
+    ``record`` is the item's metrics record; transcode stages and bytes are added to it.
+    """
+    from yt_dlp.postprocessor import PostProcessor
+
+    output_format = DOWNLOAD_FORMATS[item.download_format][2]
+
+    class OutputPostProcessor(PostProcessor):
+        def run(self, info):
+            source = info["filepath"]
+            if record is not None:
+                record.add_bytes(read=os.path.getsize(source))
+            if source.lower().endswith("." + output_format):
+                item.filename = source
+                return [], info
+            item.status = "processing"
+            item.percent = 0.0
+            notify(item)
+
+            def progress(event):
+                if event["percent"] is not None:
+                    item.percent = event["percent"]
+                    notify(item)
+
+            if record is not None:
+                record.enter_stage("postprocess")
+                progress = record.wrap_progress(progress)
+
+            target = os.path.splitext(source)[0] + "." + output_format
+            if output_format == "mp3":
+                transcode_audio(source, target, output_format, progress=progress, cancel=item.cancel_event)
+            else:
+                transcode(source, target, output_format, progress=progress, cancel=item.cancel_event)
+            info["filepath"] = item.filename = target
+            info["ext"] = output_format
+            # yt-dlp deletes the returned intermediate file unless keepvideo is set
+            return [source], info
+
+    return OutputPostProcessor()